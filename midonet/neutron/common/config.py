@@ -22,8 +22,23 @@
 from oslo.config import cfg
 
 midonet_opts = [
-    cfg.StrOpt('midonet_uri', default='http://localhost:8080/midonet-api',
-               help=_('MidoNet API server URI.')),
+    cfg.ListOpt('midonet_uri', default=['http://localhost:8080/midonet-api'],
+                help=_('MidoNet API server URIs. Requests are spread over '
+                       'them, and fail over from the servers that cannot be '
+                       'connected to.')),
+    cfg.StrOpt('midonet_uri_selection', default='least_outstanding',
+               choices=['least_outstanding', 'round_robin'],
+               help=_("How each request picks a MidoNet API server. "
+                      "'least_outstanding' picks the server with the "
+                      "fewest requests in progress, 'round_robin' each "
+                      "server in turn.")),
+    cfg.IntOpt('midonet_uri_eject_time', default=30,
+               help=_('Seconds a MidoNet API server failing a connection '
+                      'or a health check is left out of the selection.')),
+    cfg.IntOpt('midonet_uri_check_interval', default=10,
+               help=_('Seconds between two health checks of the MidoNet '
+                      'API servers, when there are several. 0 disables '
+                      'the checks.')),
     cfg.StrOpt('username', default='admin',
                help=_('MidoNet admin username.')),
     cfg.StrOpt('password', default='passw0rd',
@@ -33,6 +48,145 @@ midonet_opts = [
                default='77777777-7777-7777-7777-777777777777',
                help=_('ID of the project that MidoNet admin user'
                       'belongs to.')),
+    cfg.IntOpt('http_pool_size', default=10,
+               help=_('Number of keep-alive HTTP connections to the MidoNet '
+                      'API each process keeps open. Requests made while '
+                      'they are all in use get a connection of their own. '
+                      '0 makes a new connection for each request, as the '
+                      'MidoNet client does.')),
+    cfg.FloatOpt('http_connect_timeout', default=10.0,
+                 help=_('Seconds to wait for a connection to the MidoNet '
+                        'API.')),
+    cfg.FloatOpt('http_read_timeout', default=60.0,
+                 help=_('Seconds to wait for data from the MidoNet API on '
+                        'an established connection.')),
+    cfg.IntOpt('http_max_requests', default=0,
+               help=_('Number of requests made on a connection to the '
+                      'MidoNet API before it is closed and replaced. 0 for '
+                      'no limit.')),
+    cfg.IntOpt('lock_stripes', default=1024,
+               help=_('Number of external locks in lock_path the locks of '
+                      'the networks and routers are spread over. Changes '
+                      'of the networks and routers sharing a lock are '
+                      'serialized.')),
+    cfg.IntOpt('deletion_retry_interval', default=60,
+               help=_('Seconds between two attempts to make again the '
+                      'MidoNet deletions that failed after their Neutron '
+                      'deletion committed. 0 disables the retries.')),
+    cfg.BoolOpt('use_task_journal', default=False,
+                help=_('Record changes as tasks in the midonet_tasks table '
+                       'instead of calling the MidoNet API directly. The '
+                       'tasks are pushed to MidoNet by a separate task '
+                       'consumer.')),
+    cfg.StrOpt('task_data_format', default='json',
+               choices=['json', 'zlib'],
+               help=_("Encoding of the data of the tasks recorded. 'json' "
+                      "stores plain JSON, 'zlib' stores zlib compressed "
+                      "JSON, which task consumers older than this option "
+                      "cannot read.")),
+    cfg.IntOpt('task_insert_batch_size', default=500,
+               help=_('Number of tasks written by each INSERT statement when '
+                      'tasks are recorded in bulk.')),
+    cfg.BoolOpt('task_notification', default=True,
+                help=_('Notify the task consumers after each transaction '
+                       'that recorded tasks, so they do not have to poll.')),
+    cfg.StrOpt('task_notify_topic', default='midonet-tasks',
+               help=_('RPC topic the task notifications are sent to.')),
+    cfg.StrOpt('task_notify_socket',
+               default='$state_path/midonet-tasks.sock',
+               help=_('Unix datagram socket the task notifications are also '
+                      'sent to, for a task consumer on the same host. Set it '
+                      'empty to disable it.')),
+    cfg.StrOpt('task_consumer_name', default='midonet-task-replayer',
+               help=_('Name under which the task replayer records the id '
+                      'of the last task it applied.')),
+    cfg.IntOpt('task_replay_page_size', default=1000,
+               help=_('Number of tasks the task replayer reads from the '
+                      'database at a time.')),
+    cfg.IntOpt('task_replay_workers', default=1,
+               help=_('Number of tasks the task replayer applies '
+                      'concurrently. Tasks touching the same resources are '
+                      'still applied in order.')),
+    cfg.IntOpt('task_replay_gap_timeout', default=300,
+               help=_('Seconds the task replayer looks for the tasks of the '
+                      'ids it found missing, whose transactions may not '
+                      'have committed yet. Set it above the duration of the '
+                      'longest transaction writing tasks.')),
+    cfg.IntOpt('task_replay_interval', default=1,
+               help=_('Seconds the task replayer waits for a task '
+                      'notification before polling for new tasks when it '
+                      'has caught up.')),
+    cfg.IntOpt('task_feed_page_size', default=1000,
+               help=_('Number of tasks the task API returns when the '
+                      'request sets no limit.')),
+    cfg.IntOpt('task_backlog_soft_limit', default=0,
+               help=_('Number of tasks the task replayer may be behind '
+                      'from which writes are delayed. 0 disables it.')),
+    cfg.IntOpt('task_backlog_hard_limit', default=0,
+               help=_('Number of tasks the task replayer may be behind '
+                      'from which writes of non-admin users are rejected '
+                      'with a 503 error. 0 disables it.')),
+    cfg.FloatOpt('task_backlog_max_delay', default=1.0,
+                 help=_('Seconds writes are delayed when the backlog '
+                        'reaches the hard limit, less below it.')),
+    cfg.IntOpt('task_backlog_retry_after', default=30,
+               help=_('Seconds rejected clients are told to wait before '
+                      'retrying.')),
+    cfg.FloatOpt('task_backlog_interval', default=1.0,
+                 help=_('Seconds between two reads of the task backlog.')),
+    cfg.IntOpt('task_rate_window', default=60,
+               help=_('Seconds over which the task metrics API averages '
+                      'the rate of the tasks written.')),
+    cfg.IntOpt('task_metrics_interval', default=60,
+               help=_('Seconds between two log lines reporting the backlog '
+                      'of each task consumer. 0 disables them.')),
+    cfg.IntOpt('task_compaction_watermark', default=0,
+               help=_('Id of the last task the task compactor must never '
+                      'touch. Tasks a task consumer may have applied are '
+                      'never touched either.')),
+    cfg.IntOpt('task_compaction_page_size', default=10000,
+               help=_('Number of tasks the task compactor reads and locks '
+                      'at a time.')),
+    cfg.IntOpt('task_prune_watermark', default=0,
+               help=_('Id of the last task the task pruner deletes. When '
+                      'not set, the tasks every task consumer has applied '
+                      'are deleted.')),
+    cfg.IntOpt('task_prune_batch_size', default=1000,
+               help=_('Number of consecutive task ids the task pruner '
+                      'deletes in each transaction.')),
+    cfg.FloatOpt('task_prune_interval', default=0.1,
+                 help=_('Seconds the task pruner waits between two '
+                        'batches.')),
+    cfg.StrOpt('task_prune_archive',
+               help=_('File the task pruner appends the tasks it deletes '
+                      'to, as gzip compressed JSON lines.')),
+    cfg.StrOpt('cluster_rebuild_mode', default='full',
+               choices=['full', 'incremental'],
+               help=_("How a cluster rebuild writes the tasks. 'full' "
+                      "replaces all the tasks with a CREATE task for every "
+                      "resource, 'incremental' appends the tasks creating, "
+                      "updating and deleting the resources that differ "
+                      "from what the task replayer has applied.")),
+    cfg.StrOpt('cluster_snapshot_mode', default='consistent',
+               choices=['consistent', 'lock'],
+               help=_("How a cluster rebuild reads the Neutron database. "
+                      "'consistent' reads it in a consistent snapshot "
+                      "transaction without blocking writes, 'lock' locks "
+                      "all the tables of the database server while "
+                      "reading.")),
+    cfg.IntOpt('cluster_snapshot_workers', default=1,
+               help=_('Number of database sessions a cluster rebuild reads '
+                      'the kinds of resources on concurrently. With more '
+                      'than one, the sessions start their consistent '
+                      'snapshot transactions under a global read lock.')),
+    cfg.IntOpt('cluster_rebuild_timeout', default=300,
+               help=_('Seconds after which a running cluster rebuild whose '
+                      'server has not reported it running is considered '
+                      'stopped, and is resumed by the next rebuild '
+                      'request.')),
+    cfg.IntOpt('cluster_rebuild_chunk_size', default=1000,
+               help=_('Number of resources a cluster rebuild reads, and of '
+                      'tasks it inserts, at a time.')),
 ]
 
 
@@ -0,0 +1,172 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""MidoNet API calls made once the Neutron DB transaction commits.
+
+The plugin queues its calls to the MidoNet API on the session of the
+request instead of making them in its transactions, so that the
+transactions, and the row locks they hold, do not last for HTTP round trips
+to MidoNet.  The queued calls run in order once the outermost transaction
+commits, and are dropped when it rolls back.
+
+Deletions cannot be undone once committed, so a deletion MidoNet fails to
+apply is recorded instead, and made again by retry_deletions() until
+MidoNet applies it.
+"""
+
+import json
+import sys
+
+import six
+import sqlalchemy as sa
+from sqlalchemy import orm
+from webob import exc as w_exc
+
+from midonet.neutron.db import task
+
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+_HOOKS = 'midonet_post_commit_hooks'
+
+
+def add_hook(context, operation, resource_id, call, compensate=None):
+    """Queue a MidoNet API call to run after the transaction commits.
+
+    :param operation: The name of the operation, such as 'update_network',
+                      for the logs.
+    :param call: The callable making the MidoNet API call.
+    :param compensate: The callable undoing, in the Neutron DB, what the
+                       call failed to apply to MidoNet, or None when there is
+                       nothing to undo, for example after a deletion.
+    """
+    context.session.info.setdefault(_HOOKS, []).append(
+        (operation, resource_id, call, compensate))
+
+
+def add_deletion(context, api_cli, method, *args):
+    """Queue a MidoNet API deletion to run after the transaction commits.
+
+    When MidoNet fails to apply it, the deletion is recorded in the
+    midonet_deletion_retries table for retry_deletions(), and the request
+    still succeeds: the Neutron resource is gone already.  A resource
+    MidoNet does not have counts as deleted.
+
+    :param method: The name of the method of the MidoNet client, such as
+                   'delete_port'.
+    :param args: The arguments of the method, which must serialize to JSON.
+    """
+    def call():
+        try:
+            getattr(api_cli, method)(*args)
+        except w_exc.HTTPNotFound:
+            pass
+        except Exception as e:
+            LOG.warn(_("MidoNet failed to apply %(method)s%(args)r, it will "
+                       "be retried: %(err)s"),
+                     {'method': method, 'args': args, 'err': e})
+            _record_deletion(context.session, method, args)
+
+    add_hook(context, method, args[0], call)
+
+
+def _record_deletion(session, method, args):
+    try:
+        with session.begin(subtransactions=True):
+            session.add(task.DeletionRetry(method=method,
+                                           args=json.dumps(args)))
+    except Exception:
+        LOG.exception(_("Failed to record %(method)s%(args)r for retry, "
+                        "MidoNet keeps the resource"),
+                      {'method': method, 'args': args})
+
+
+def retry_deletions(session, api_cli):
+    """Make again the MidoNet deletions that failed, in the order they were
+    recorded, and return the number made.
+
+    Stops at the first one failing again, as MidoNet is likely still
+    failing, and a later deletion may depend on it.
+    """
+    retries = session.query(task.DeletionRetry).order_by(
+        task.DeletionRetry.id).all()
+    for count, retry in enumerate(retries):
+        args = json.loads(retry.args)
+        try:
+            getattr(api_cli, retry.method)(*args)
+        except w_exc.HTTPNotFound:
+            pass
+        except Exception as e:
+            LOG.warn(_("MidoNet failed to apply %(method)s%(args)r again: "
+                       "%(err)s"),
+                     {'method': retry.method, 'args': args, 'err': e})
+            with session.begin(subtransactions=True):
+                retry.attempts += 1
+            return count
+        # Another server may have made it again too.
+        with session.begin(subtransactions=True):
+            session.query(task.DeletionRetry).filter_by(
+                id=retry.id).delete()
+    return len(retries)
+
+
+@sa.event.listens_for(orm.Session, 'after_rollback')
+def _discard_hooks(session):
+    session.info.pop(_HOOKS, None)
+
+
+def _compensate(operation, resource_id, compensate):
+    try:
+        compensate()
+    except Exception:
+        LOG.exception(_("Failed to compensate for %(operation)s of "
+                        "%(id)s"), {'operation': operation, 'id': resource_id})
+
+
+def run_hooks(context):
+    """Run the calls queued on the session of the context.
+
+    Inside a transaction, this does nothing: the calls are left for the
+    outermost level to run once the transaction commits.
+
+    When a call fails, its compensating action runs, as well as those of
+    the calls queued after it, which do not run, in reverse order, and the
+    error is raised.  A failed call without a compensating action does not
+    stop the other calls, and its error is raised once they have run.
+    """
+    session = context.session
+    if session.transaction is not None:
+        return
+    hooks = session.info.pop(_HOOKS, [])
+    error = None
+    for i, (operation, resource_id, call, compensate) in enumerate(hooks):
+        try:
+            call()
+        except Exception:
+            exc_info = sys.exc_info()
+            LOG.error(_("MidoNet failed to apply %(operation)s of %(id)s: "
+                        "%(err)s"), {'operation': operation,
+                                     'id': resource_id, 'err': exc_info[1]})
+            if compensate is None:
+                error = error or exc_info
+                continue
+            for pending in reversed(hooks[i:]):
+                if pending[3] is not None:
+                    _compensate(pending[0], pending[1], pending[3])
+            six.reraise(*exc_info)
+    if error:
+        six.reraise(*error)
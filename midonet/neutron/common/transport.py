@@ -0,0 +1,310 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keep-alive HTTP connections to the MidoNet API servers.
+
+The MidoNet client makes each request with a new httplib2.Http object, so
+each request pays for a TCP, and TLS, handshake.  Once installed, the
+client borrows its Http objects from a pool instead, and they keep their
+connections open between requests.  An Http object is used by one green
+thread at a time.
+
+With several MidoNet API servers configured, the requests for any of them
+are spread over all of them.  A server that cannot be connected to is left
+out for a while, and the request is sent to another server: it never
+reached the first one, so this is safe whatever its method.
+"""
+
+import sys
+import time
+
+from eventlet import pools
+import httplib2
+from oslo.config import cfg
+import six
+
+from midonetclient import api_lib
+
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+
+
+LOG = logging.getLogger(__name__)
+
+_checker = None
+
+
+class ConnectError(Exception):
+    """The connection to a server failed, with the error in exc_info."""
+
+    def __init__(self, exc_info):
+        super(ConnectError, self).__init__(str(exc_info[1]))
+        self.exc_info = exc_info
+
+
+def _connect(connect, conn):
+    try:
+        connect(conn)
+    except Exception:
+        # Nothing was sent yet. httplib2 lets this exception through, unlike
+        # the socket errors it handles by itself.
+        raise ConnectError(sys.exc_info())
+    conn.sock.settimeout(cfg.CONF.MIDONET.http_read_timeout)
+
+
+class HTTPConnection(httplib2.HTTPConnectionWithTimeout):
+    """Connection reading with the http_read_timeout once connected.
+
+    httplib2 uses the timeout of the Http object for the connection, the
+    http_connect_timeout, and for the reads that follow.
+    """
+
+    def connect(self):
+        _connect(httplib2.HTTPConnectionWithTimeout.connect, self)
+
+
+class HTTPSConnection(httplib2.HTTPSConnectionWithTimeout):
+    """TLS counterpart of HTTPConnection."""
+
+    def connect(self):
+        _connect(httplib2.HTTPSConnectionWithTimeout.connect, self)
+
+
+_CONNECTION_TYPES = {'http': HTTPConnection, 'https': HTTPSConnection}
+
+
+class _Http(httplib2.Http):
+
+    def __init__(self, timeout):
+        httplib2.Http.__init__(self, timeout=timeout)
+        self.request_count = 0
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+        self.request_count = 0
+
+
+class Endpoint(object):
+
+    def __init__(self, uri):
+        self.uri = uri.rstrip('/')
+        self.outstanding = 0
+        self.ejected_until = 0
+
+
+class Endpoints(object):
+    """The MidoNet API servers requests are spread over.
+
+    :param uris: The base URIs of the servers.
+    :param selection: 'least_outstanding' or 'round_robin'.
+    :param eject_time: The seconds a failing server is left out.
+    """
+
+    def __init__(self, uris, selection='least_outstanding', eject_time=30):
+        self.endpoints = [Endpoint(uri) for uri in uris]
+        self.selection = selection
+        self.eject_time = eject_time
+        self._next = 0
+
+    def path(self, uri):
+        """Return the part of the URI after the base URI of its server, or
+        None when it is not the URI of any of the servers.
+        """
+        for endpoint in self.endpoints:
+            rest = uri[len(endpoint.uri):]
+            if uri.startswith(endpoint.uri) and rest[:1] in ('', '/', '?'):
+                return rest
+        return None
+
+    def choose(self, exclude=()):
+        """Return the server for the next request, or None when they are all
+        excluded.
+
+        The servers left out are only chosen when all the others are.
+        """
+        candidates = [e for e in self.endpoints if e not in exclude]
+        now = time.time()
+        candidates = ([e for e in candidates if e.ejected_until <= now] or
+                      candidates)
+        if not candidates:
+            return None
+        # Start from the next server each time, for round robin, and so that
+        # ties between the least loaded servers are spread too.
+        start = self._next % len(candidates)
+        self._next += 1
+        candidates = candidates[start:] + candidates[:start]
+        if self.selection == 'round_robin':
+            return candidates[0]
+        return min(candidates, key=lambda e: e.outstanding)
+
+    def eject(self, endpoint, reason):
+        if endpoint.ejected_until <= time.time():
+            LOG.warn(_("Leaving MidoNet API server %(uri)s out for %(time)ds: "
+                       "%(reason)s"), {'uri': endpoint.uri,
+                                       'time': self.eject_time,
+                                       'reason': reason})
+        endpoint.ejected_until = time.time() + self.eject_time
+
+    def readmit(self, endpoint):
+        if endpoint.ejected_until > time.time():
+            LOG.info(_("MidoNet API server %s is back"), endpoint.uri)
+        endpoint.ejected_until = 0
+
+
+class HttpPool(object):
+    """Pool of Http objects, used in place of a single one.
+
+    :param size: The number of Http objects kept, with their connections.
+    :param connect_timeout: The seconds to wait for a connection.
+    :param max_requests: The number of requests after which the connections
+                         of an Http object are closed, or 0 for no limit.
+    :param endpoints: The Endpoints to spread the requests over, if any.
+    """
+
+    def __init__(self, size, connect_timeout, max_requests=0,
+                 endpoints=None):
+        self.connect_timeout = connect_timeout
+        self.max_requests = max_requests
+        self.endpoints = endpoints
+        self._pool = pools.Pool(max_size=size, create=self._create)
+
+    def _create(self):
+        return _Http(self.connect_timeout)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        """Make a request like httplib2.Http.request()."""
+        path = self.endpoints.path(uri) if self.endpoints else None
+        try:
+            if path is None:
+                return self._send(uri, method, body, headers, **kwargs)
+            return self._balance(path, method, body, headers, **kwargs)
+        except ConnectError as e:
+            six.reraise(*e.exc_info)
+
+    def _balance(self, path, method, body, headers, **kwargs):
+        tried = []
+        error = None
+        while True:
+            endpoint = self.endpoints.choose(exclude=tried)
+            if endpoint is None:
+                raise error
+            tried.append(endpoint)
+            endpoint.outstanding += 1
+            try:
+                return self._send(endpoint.uri + path, method, body, headers,
+                                  **kwargs)
+            except ConnectError as e:
+                error = e
+                self.endpoints.eject(endpoint, e)
+            finally:
+                endpoint.outstanding -= 1
+
+    def _send(self, uri, method, body, headers, **kwargs):
+        scheme = uri.split(':', 1)[0].lower()
+        if scheme in _CONNECTION_TYPES:
+            kwargs.setdefault('connection_type', _CONNECTION_TYPES[scheme])
+        if self._pool.free():
+            with self._pool.item() as http:
+                return self._request(http, uri, method, body, headers,
+                                     **kwargs)
+        # All the pooled connections are in use: rather than waiting for one,
+        # make this request on a connection of its own.
+        http = self._create()
+        try:
+            return self._request(http, uri, method, body, headers, **kwargs)
+        finally:
+            http.close()
+
+    def _request(self, http, uri, method, body, headers, **kwargs):
+        try:
+            response = http.request(uri, method, body, headers, **kwargs)
+        except Exception:
+            # The connection may be left in the middle of a response.
+            http.close()
+            raise
+        http.request_count += 1
+        if self.max_requests and http.request_count >= self.max_requests:
+            http.close()
+        return response
+
+    def check_endpoints(self):
+        """Leave out the servers failing to answer a GET of their base URI
+        without a server error, and readmit the others.
+        """
+        for endpoint in self.endpoints.endpoints:
+            http = self._create()
+            try:
+                scheme = endpoint.uri.split(':', 1)[0].lower()
+                response, content = http.request(
+                    endpoint.uri,
+                    connection_type=_CONNECTION_TYPES.get(scheme))
+                error = (None if response.status < 500
+                         else _("status %d") % response.status)
+            except Exception as e:
+                error = e
+            finally:
+                http.close()
+            if error is None:
+                self.endpoints.readmit(endpoint)
+            else:
+                self.endpoints.eject(endpoint, error)
+
+
+class _Httplib2(object):
+    """Stands for the httplib2 module in the MidoNet client, handing out the
+    pool for every Http object the client creates.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def Http(self, *args, **kwargs):
+        return self.pool
+
+    def __getattr__(self, name):
+        return getattr(httplib2, name)
+
+
+def install():
+    """Make the MidoNet client of this process use the pool of connections,
+    and spread its requests over the midonet_uri servers.
+
+    Does nothing when already installed, or when http_pool_size is 0 with a
+    single server.
+    """
+    global _checker
+    conf = cfg.CONF.MIDONET
+    if isinstance(api_lib.httplib2, _Httplib2):
+        return
+    if conf.http_pool_size <= 0 and len(conf.midonet_uri) < 2:
+        return
+
+    endpoints = None
+    if len(conf.midonet_uri) > 1:
+        endpoints = Endpoints(conf.midonet_uri, conf.midonet_uri_selection,
+                              conf.midonet_uri_eject_time)
+    pool = HttpPool(max(conf.http_pool_size, 0), conf.http_connect_timeout,
+                    conf.http_max_requests, endpoints)
+    api_lib.httplib2 = _Httplib2(pool)
+    LOG.debug("Pooling %(size)d connections to the MidoNet API servers "
+              "%(uris)s", {'size': conf.http_pool_size,
+                           'uris': conf.midonet_uri})
+
+    if endpoints and conf.midonet_uri_check_interval > 0:
+        _checker = loopingcall.FixedIntervalLoopingCall(pool.check_endpoints)
+        _checker.start(conf.midonet_uri_check_interval,
+                       initial_delay=conf.midonet_uri_check_interval)
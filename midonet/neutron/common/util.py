@@ -14,15 +14,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import re
+import zlib
+
+from oslo.config import cfg
 from webob import exc as w_exc
 
 from midonetclient import exc
 
 from neutron.api.v2 import base
 from neutron.common import exceptions as n_exc
+from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 
+from midonet.neutron.common import config  # noqa
+
 
 LOG = logging.getLogger(__name__)
 PLURAL_NAME_MAP = {}
@@ -38,6 +45,31 @@ def handle_api_error(fn):
     return wrapped
 
 
+def keyed_locks(*keys):
+    """Hold the external locks of the keys, such as 'network-<id>'.
+
+    The keys are hashed to one of lock_stripes locks, so that the lock files
+    do not pile up as networks and routers come and go.  The locks are
+    taken in sorted order, so that callers locking overlapping keys cannot
+    deadlock.
+    """
+    stripes = cfg.CONF.MIDONET.lock_stripes
+    return _stripe_locks(sorted(set(
+        (zlib.crc32(key.encode('utf-8')) & 0xffffffff) % stripes
+        for key in keys)))
+
+
+@contextlib.contextmanager
+def _stripe_locks(stripes):
+    if not stripes:
+        yield
+        return
+    with lockutils.lock('midonet-lock-%d' % stripes[0],
+                        lock_file_prefix='neutron-', external=True):
+        with _stripe_locks(stripes[1:]):
+            yield
+
+
 class MidonetApiException(n_exc.NeutronException):
         message = _("MidoNet API error: %(msg)s")
 
@@ -0,0 +1,40 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""create task checkpoint table
+
+Revision ID: 2b1f7d3e9a5c
+Revises: 4cedd30aadf6
+Create Date: 2014-11-20 10:12:41.385120
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b1f7d3e9a5c'
+down_revision = '4cedd30aadf6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_task_checkpoints',
+        sa.Column('consumer', sa.String(length=255), primary_key=True),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime()),)
+
+
+def downgrade():
+    op.drop_table('midonet_task_checkpoints')
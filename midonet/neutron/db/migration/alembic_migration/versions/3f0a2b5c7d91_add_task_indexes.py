@@ -0,0 +1,42 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task indexes
+
+Revision ID: 3f0a2b5c7d91
+Revises: 2b1f7d3e9a5c
+Create Date: 2014-11-25 14:03:17.624511
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f0a2b5c7d91'
+down_revision = '2b1f7d3e9a5c'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_midonet_tasks_resource_id', 'midonet_tasks',
+                    ['resource_id', 'id'])
+    op.create_index('ix_midonet_tasks_transaction_id', 'midonet_tasks',
+                    ['transaction_id'])
+    op.create_index('ix_midonet_tasks_created_at', 'midonet_tasks',
+                    ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_midonet_tasks_created_at', 'midonet_tasks')
+    op.drop_index('ix_midonet_tasks_transaction_id', 'midonet_tasks')
+    op.drop_index('ix_midonet_tasks_resource_id', 'midonet_tasks')
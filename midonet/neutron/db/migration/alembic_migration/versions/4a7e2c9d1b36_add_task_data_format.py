@@ -0,0 +1,60 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task data format
+
+Revision ID: 4a7e2c9d1b36
+Revises: 3f0a2b5c7d91
+Create Date: 2014-11-27 09:41:05.218374
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4a7e2c9d1b36'
+down_revision = '3f0a2b5c7d91'
+
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import column
+from sqlalchemy.sql import table
+
+
+def upgrade():
+    # The existing rows hold plain JSON, which is format 0
+    op.add_column('midonet_tasks',
+                  sa.Column('data_format', sa.Integer(), nullable=False,
+                            server_default='0'))
+    op.alter_column('midonet_tasks', 'data',
+                    type_=sa.LargeBinary(length=2**24),
+                    existing_type=sa.Text(length=2**24))
+
+
+def downgrade():
+    tasks = table('midonet_tasks',
+                  column('id', sa.Integer()),
+                  column('data', sa.LargeBinary()),
+                  column('data_format', sa.Integer()))
+    bind = op.get_bind()
+    for task_id, data in bind.execute(
+            sa.select([tasks.c.id, tasks.c.data]).where(
+                tasks.c.data_format == 1)).fetchall():
+        op.execute(tasks.update().where(tasks.c.id == task_id).values(
+            data=zlib.decompress(data), data_format=0))
+
+    op.alter_column('midonet_tasks', 'data',
+                    type_=sa.Text(length=2**24),
+                    existing_type=sa.LargeBinary(length=2**24))
+    op.drop_column('midonet_tasks', 'data_format')
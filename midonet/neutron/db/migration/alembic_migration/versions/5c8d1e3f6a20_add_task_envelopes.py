@@ -0,0 +1,53 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task envelopes
+
+Revision ID: 5c8d1e3f6a20
+Revises: 4a7e2c9d1b36
+Create Date: 2014-12-02 11:26:48.903517
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c8d1e3f6a20'
+down_revision = '4a7e2c9d1b36'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_task_envelopes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('transaction_id', sa.String(length=40)),
+        sa.Column('task_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('committed_at', sa.DateTime()),)
+    # The existing tasks have no envelope and are applied one by one.
+    op.add_column('midonet_tasks',
+                  sa.Column('envelope_id', sa.Integer()))
+    op.create_index('ix_midonet_tasks_envelope_id', 'midonet_tasks',
+                    ['envelope_id'])
+    op.create_foreign_key('fk_midonet_tasks_envelope_id', 'midonet_tasks',
+                          'midonet_task_envelopes', ['envelope_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('fk_midonet_tasks_envelope_id', 'midonet_tasks',
+                       type_='foreignkey')
+    op.drop_index('ix_midonet_tasks_envelope_id', 'midonet_tasks')
+    op.drop_column('midonet_tasks', 'envelope_id')
+    op.drop_table('midonet_task_envelopes')
@@ -0,0 +1,41 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task fingerprints
+
+Revision ID: 6d1f4a2b8c73
+Revises: 5c8d1e3f6a20
+Create Date: 2014-12-04 16:12:35.480913
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6d1f4a2b8c73'
+down_revision = '5c8d1e3f6a20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_task_fingerprints',
+        sa.Column('data_type_id', sa.Integer(), primary_key=True,
+                  autoincrement=False),
+        sa.Column('resource_id', sa.String(length=36), primary_key=True),
+        sa.Column('content_hash', sa.String(length=40), nullable=False),)
+
+
+def downgrade():
+    op.drop_table('midonet_task_fingerprints')
@@ -0,0 +1,81 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add cluster rebuilds
+
+Revision ID: 7e2a5b9c4d18
+Revises: 6d1f4a2b8c73
+Create Date: 2014-12-08 10:41:17.226380
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7e2a5b9c4d18'
+down_revision = '6d1f4a2b8c73'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_cluster_rebuilds',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('mode', sa.String(length=16), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('data_type_id', sa.Integer()),
+        sa.Column('items_done', sa.Integer(), nullable=False),
+        sa.Column('items_total', sa.Integer(), nullable=False),
+        sa.Column('rate', sa.Float()),
+        sa.Column('task_id', sa.Integer()),
+        sa.Column('task_count', sa.Integer()),
+        sa.Column('error', sa.String(length=255)),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('finished_at', sa.DateTime()),)
+    op.create_table(
+        'midonet_cluster_rebuild_chunks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('rebuild_id', sa.String(length=36),
+                  sa.ForeignKey('midonet_cluster_rebuilds.id',
+                                ondelete='CASCADE'),
+                  nullable=False),
+        sa.Column('data_type_id', sa.Integer(), nullable=False),
+        sa.Column('last_resource_id', sa.String(length=36)),
+        sa.Column('complete', sa.Boolean(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('task_count', sa.Integer(), nullable=False),)
+    op.create_table(
+        'midonet_cluster_rebuild_tasks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('rebuild_id', sa.String(length=36),
+                  sa.ForeignKey('midonet_cluster_rebuilds.id',
+                                ondelete='CASCADE'),
+                  nullable=False),
+        sa.Column('data_type_id', sa.Integer(), nullable=False),
+        sa.Column('resource_id', sa.String(length=36)),
+        sa.Column('data', sa.LargeBinary(length=2**24)),
+        sa.Column('data_format', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),)
+    op.create_index('ix_midonet_cluster_rebuild_tasks_rebuild_id',
+                    'midonet_cluster_rebuild_tasks',
+                    ['rebuild_id', 'data_type_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_midonet_cluster_rebuild_tasks_rebuild_id',
+                  'midonet_cluster_rebuild_tasks')
+    op.drop_table('midonet_cluster_rebuild_tasks')
+    op.drop_table('midonet_cluster_rebuild_chunks')
+    op.drop_table('midonet_cluster_rebuilds')
@@ -0,0 +1,42 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add deletion retries
+
+Revision ID: 8c4f1a7e2d95
+Revises: 7e2a5b9c4d18
+Create Date: 2014-12-15 14:22:08.613570
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c4f1a7e2d95'
+down_revision = '7e2a5b9c4d18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_deletion_retries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('method', sa.String(length=64), nullable=False),
+        sa.Column('args', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),)
+
+
+def downgrade():
+    op.drop_table('midonet_deletion_retries')
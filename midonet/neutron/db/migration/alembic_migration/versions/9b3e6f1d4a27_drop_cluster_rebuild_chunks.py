@@ -0,0 +1,47 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""drop cluster rebuild chunks
+
+Revision ID: 9b3e6f1d4a27
+Revises: 8c4f1a7e2d95
+Create Date: 2014-12-17 09:51:36.402718
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b3e6f1d4a27'
+down_revision = '8c4f1a7e2d95'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.drop_table('midonet_cluster_rebuild_chunks')
+
+
+def downgrade():
+    op.create_table(
+        'midonet_cluster_rebuild_chunks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('rebuild_id', sa.String(length=36),
+                  sa.ForeignKey('midonet_cluster_rebuilds.id',
+                                ondelete='CASCADE'),
+                  nullable=False),
+        sa.Column('data_type_id', sa.Integer(), nullable=False),
+        sa.Column('last_resource_id', sa.String(length=36)),
+        sa.Column('complete', sa.Boolean(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('task_count', sa.Integer(), nullable=False),)
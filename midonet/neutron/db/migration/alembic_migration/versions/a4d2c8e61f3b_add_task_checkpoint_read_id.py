@@ -0,0 +1,37 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task checkpoint read id
+
+Revision ID: a4d2c8e61f3b
+Revises: 9b3e6f1d4a27
+Create Date: 2014-12-18 11:07:52.931846
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2c8e61f3b'
+down_revision = '9b3e6f1d4a27'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('midonet_task_checkpoints',
+                  sa.Column('read_id', sa.Integer()))
+
+
+def downgrade():
+    op.drop_column('midonet_task_checkpoints', 'read_id')
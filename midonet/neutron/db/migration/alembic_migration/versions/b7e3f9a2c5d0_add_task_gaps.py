@@ -0,0 +1,42 @@
+# Copyright 2014 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task gaps
+
+Revision ID: b7e3f9a2c5d0
+Revises: a4d2c8e61f3b
+Create Date: 2014-12-18 16:34:20.518273
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f9a2c5d0'
+down_revision = 'a4d2c8e61f3b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'midonet_task_gaps',
+        sa.Column('consumer', sa.String(length=255), primary_key=True),
+        sa.Column('first_id', sa.Integer(), primary_key=True,
+                  autoincrement=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('found_at', sa.DateTime()),)
+
+
+def downgrade():
+    op.drop_table('midonet_task_gaps')
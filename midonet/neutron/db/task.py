@@ -12,14 +12,38 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import collections
 import datetime
+import gzip
+import hashlib
+import itertools
 import sqlalchemy as sa
 import json
+import shutil
+import six
+import sys
+import tempfile
+import time
+import zlib
+
+import eventlet
+from eventlet import queue
+
+from oslo.config import cfg
+from sqlalchemy import orm
+
+from midonet.neutron.common import config  # noqa
 
 from neutron.common import exceptions as n_exc
+from neutron import context as n_context
+from neutron.db import l3_db
 from neutron.db import model_base
 from neutron.db import models_v2
+from neutron.db import securitygroups_db
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
 
 CREATE = 1
 DELETE = 2
@@ -35,6 +59,97 @@ SECURITYGROUP = 6
 SECURITYGROUPRULE = 7
 ROUTERINTERFACE = 8
 
+# Encodings of the task data
+DATA_FORMAT_JSON = 0
+DATA_FORMAT_ZLIB = 1
+
+DATA_FORMATS = {
+    'json': DATA_FORMAT_JSON,
+    'zlib': DATA_FORMAT_ZLIB,
+}
+
+# Dependency depth of the data types: a resource only refers to resources
+# of a lower depth, so the resources of a depth can be created concurrently
+# once those of the lower depths exist, and deleted concurrently once those
+# of the higher depths are gone.
+DEPTHS = {
+    NETWORK: 0,
+    SECURITYGROUP: 0,
+    SUBNET: 1,
+    SECURITYGROUPRULE: 1,
+    ROUTER: 1,
+    PORT: 2,
+    ROUTERINTERFACE: 3,
+    FLOATINGIP: 3,
+}
+
+# The resources a cluster rebuild reads, with their Neutron models and the
+# plugin methods making their dicts, in dependency order.  Router interfaces
+# are ports, and are created with them.
+CLUSTER_RESOURCES = [
+    (NETWORK, models_v2.Network, '_make_network_dict'),
+    (SECURITYGROUP, securitygroups_db.SecurityGroup,
+     '_make_security_group_dict'),
+    (SUBNET, models_v2.Subnet, '_make_subnet_dict'),
+    (SECURITYGROUPRULE, securitygroups_db.SecurityGroupRule,
+     '_make_security_group_rule_dict'),
+    (ROUTER, l3_db.Router, '_make_router_dict'),
+    (PORT, models_v2.Port, '_make_port_dict'),
+    (FLOATINGIP, l3_db.FloatingIP, '_make_floatingip_dict'),
+]
+
+# Names of the data types, as cluster rebuilds report them
+DATA_TYPE_NAMES = {
+    NETWORK: 'network',
+    SUBNET: 'subnet',
+    ROUTER: 'router',
+    PORT: 'port',
+    FLOATINGIP: 'floatingip',
+    SECURITYGROUP: 'security_group',
+    SECURITYGROUPRULE: 'security_group_rule',
+    ROUTERINTERFACE: 'router_interface',
+}
+
+# Names of the task types, as the task metrics report them
+TASK_TYPE_NAMES = {
+    CREATE: 'create',
+    DELETE: 'delete',
+    UPDATE: 'update',
+    FLUSH: 'flush',
+}
+
+# Format and version of the snapshot files
+SNAPSHOT_FORMAT = 'midonet-neutron-snapshot'
+SNAPSHOT_VERSION = 1
+
+# Status of cluster rebuilds
+REBUILD_RUNNING = 'RUNNING'
+REBUILD_COMPLETED = 'COMPLETED'
+REBUILD_FAILED = 'FAILED'
+
+# The cluster resources MidoNet cannot update, whose changes an incremental
+# cluster rebuild ignores.
+_IMMUTABLE_RESOURCES = (SECURITYGROUP, SECURITYGROUPRULE)
+
+# Session info key set when the transaction writes tasks
+TASKS_WRITTEN = 'midonet_tasks_written'
+
+# Session info key of the envelope of the tasks the transaction writes
+_ENVELOPE = 'midonet_task_envelope'
+
+# Session info keys of the time the transaction wrote its first task, and of
+# the number of tasks it wrote by operation
+_STARTED_AT = 'midonet_tasks_started_at'
+_OPERATIONS = 'midonet_task_operations'
+
+# Number of gaps looked up in each query.
+_GAP_CHUNK = 100
+
+# Keys of the task data that refer to other resources.
+_PARENT_ID_KEYS = ('network_id', 'subnet_id', 'router_id', 'port_id',
+                   'security_group_id', 'remote_group_id',
+                   'floating_network_id')
+
 
 class TaskType(model_base.BASEV2):
     __tablename__ = 'midonet_task_types'
@@ -50,72 +165,1566 @@ class DataType(model_base.BASEV2):
 
 class Task(model_base.BASEV2):
     __tablename__ = 'midonet_tasks'
+    __table_args__ = (
+        sa.Index('ix_midonet_tasks_resource_id', 'resource_id', 'id'),
+        sa.Index('ix_midonet_tasks_transaction_id', 'transaction_id'),
+        sa.Index('ix_midonet_tasks_created_at', 'created_at'),
+    )
 
     id = sa.Column(sa.Integer(), primary_key=True)
     type_id = sa.Column(sa.Integer(), sa.ForeignKey('midonet_task_types.id'))
     data_type_id = sa.Column(sa.Integer(),
                              sa.ForeignKey('midonet_data_types.id'))
-    data = sa.Column(sa.Text(length=2**24))
+    data = sa.Column(sa.LargeBinary(length=2**24))
+    data_format = sa.Column(sa.Integer(), nullable=False, server_default='0',
+                            default=DATA_FORMAT_JSON)
     resource_id = sa.Column(sa.String(36))
     transaction_id = sa.Column(sa.String(40))
     created_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+    envelope_id = sa.Column(sa.Integer(),
+                            sa.ForeignKey('midonet_task_envelopes.id',
+                                          name='fk_midonet_tasks_envelope_id'),
+                            index=True)
+
+
+class TaskEnvelope(model_base.BASEV2):
+    """The tasks written by a database transaction.
+
+    The envelope is written in the same transaction as its tasks, and is
+    stamped with the commit time just before the transaction commits, so a
+    consumer seeing an envelope knows how many tasks it holds.
+    """
+    __tablename__ = 'midonet_task_envelopes'
+
+    id = sa.Column(sa.Integer(), primary_key=True)
+    transaction_id = sa.Column(sa.String(40))
+    task_count = sa.Column(sa.Integer(), nullable=False, default=0)
+    created_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+    committed_at = sa.Column(sa.DateTime())
+
+
+class TaskCheckpoint(model_base.BASEV2):
+    """The id of the last task applied by a task consumer.
+
+    read_id is the id of the last task the consumer has read, and may be
+    applying, when it reads the tasks with read_envelopes().
+    """
+    __tablename__ = 'midonet_task_checkpoints'
+
+    consumer = sa.Column(sa.String(255), primary_key=True)
+    task_id = sa.Column(sa.Integer(), nullable=False, default=0)
+    read_id = sa.Column(sa.Integer())
+    updated_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow)
+
+
+class TaskGap(model_base.BASEV2):
+    """A range of task ids a task consumer moved its checkpoint past
+    without finding their tasks.
+
+    Task ids are taken when the tasks are written, not when they commit, so
+    the transactions holding them may commit later.  The consumer looks for
+    their tasks until task_replay_gap_timeout seconds after it found the
+    gap.
+    """
+    __tablename__ = 'midonet_task_gaps'
+
+    consumer = sa.Column(sa.String(255), primary_key=True)
+    first_id = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
+    last_id = sa.Column(sa.Integer(), nullable=False)
+    found_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+
+
+class DeletionRetry(model_base.BASEV2):
+    """A MidoNet API deletion that failed after the Neutron deletion
+    committed, to be made again.
+    """
+    __tablename__ = 'midonet_deletion_retries'
+
+    id = sa.Column(sa.Integer(), primary_key=True)
+    method = sa.Column(sa.String(64), nullable=False)
+    args = sa.Column(sa.Text(), nullable=False)
+    attempts = sa.Column(sa.Integer(), nullable=False, default=0)
+    created_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+
+
+class TaskFingerprint(model_base.BASEV2):
+    """The content hash of a resource as the task replayer last applied it.
+    """
+    __tablename__ = 'midonet_task_fingerprints'
+
+    data_type_id = sa.Column(sa.Integer(), primary_key=True,
+                             autoincrement=False)
+    resource_id = sa.Column(sa.String(36), primary_key=True)
+    content_hash = sa.Column(sa.String(40), nullable=False)
+
+
+class ClusterRebuild(model_base.BASEV2, models_v2.HasId):
+    """A cluster rebuild and its progress.
+
+    task_id is the id of the last task the snapshot of a full rebuild
+    reflects, and task_count the number of tasks up to it.  They are set
+    once all the tasks of the snapshot are staged.
+    """
+    __tablename__ = 'midonet_cluster_rebuilds'
+
+    mode = sa.Column(sa.String(16), nullable=False)
+    status = sa.Column(sa.String(16), nullable=False)
+    data_type_id = sa.Column(sa.Integer())
+    items_done = sa.Column(sa.Integer(), nullable=False, default=0)
+    items_total = sa.Column(sa.Integer(), nullable=False, default=0)
+    rate = sa.Column(sa.Float())
+    task_id = sa.Column(sa.Integer())
+    task_count = sa.Column(sa.Integer())
+    error = sa.Column(sa.String(255))
+    started_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+    updated_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow)
+    finished_at = sa.Column(sa.DateTime())
+
+
+class ClusterRebuildTask(model_base.BASEV2):
+    """A CREATE task staged by a cluster rebuild."""
+    __tablename__ = 'midonet_cluster_rebuild_tasks'
+    __table_args__ = (
+        sa.Index('ix_midonet_cluster_rebuild_tasks_rebuild_id',
+                 'rebuild_id', 'data_type_id', 'id'),
+    )
+
+    id = sa.Column(sa.Integer(), primary_key=True)
+    rebuild_id = sa.Column(sa.String(36),
+                           sa.ForeignKey('midonet_cluster_rebuilds.id',
+                                         ondelete='CASCADE'),
+                           nullable=False)
+    data_type_id = sa.Column(sa.Integer(), nullable=False)
+    resource_id = sa.Column(sa.String(36))
+    data = sa.Column(sa.LargeBinary(length=2**24))
+    data_format = sa.Column(sa.Integer(), nullable=False)
+    created_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+
+
+def _get_data_format():
+    return DATA_FORMATS[cfg.CONF.MIDONET.task_data_format]
+
+
+def encode_task_data(data, data_format=None):
+    """Return the task data serialized in data_format, which defaults to
+    task_data_format.
+
+    :param data: task data, or its JSON serialization.
+    """
+    if data is None:
+        return None
+    if not isinstance(data, six.string_types):
+        data = json.dumps(data)
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    if data_format is None:
+        data_format = _get_data_format()
+    if data_format == DATA_FORMAT_ZLIB:
+        return zlib.compress(data)
+    return data
+
+
+def get_task_data(task):
+    """Return the decoded data of the task."""
+    if task.data is None:
+        return None
+    if task.data_format == DATA_FORMAT_ZLIB:
+        return json.loads(zlib.decompress(task.data).decode('utf-8'))
+    return json.loads(task.data.decode('utf-8'))
+
+
+def _get_envelope(context):
+    """Return the envelope of the tasks of the current transaction."""
+    session = context.session
+    envelope = session.info.get(_ENVELOPE)
+    if envelope is None:
+        envelope = TaskEnvelope(transaction_id=context.request_id,
+                                task_count=0)
+        session.add(envelope)
+        session.flush()
+        session.info[_ENVELOPE] = envelope
+    return envelope
+
+
+@sa.event.listens_for(orm.Session, 'before_commit')
+def _seal_envelope(session):
+    envelope = session.info.pop(_ENVELOPE, None)
+    if envelope is not None:
+        envelope.committed_at = datetime.datetime.utcnow()
+
+
+def _next_envelope(context):
+    """Seal the envelope of the current transaction and return a new one
+    for the tasks it writes next.
+    """
+    _seal_envelope(context.session)
+    return _get_envelope(context)
+
+
+@sa.event.listens_for(orm.Session, 'after_rollback')
+def _discard_envelope(session):
+    session.info.pop(_ENVELOPE, None)
+
+
+def get_operation_name(task_type_id, data_type_id):
+    """Return the name of the operation a task records, e.g. create_port.
+    """
+    if data_type_id is None:
+        return TASK_TYPE_NAMES[task_type_id]
+    return '%s_%s' % (TASK_TYPE_NAMES[task_type_id],
+                      DATA_TYPE_NAMES[data_type_id])
+
+
+class TaskInsertStats(object):
+    """Time from the first task a transaction writes to its commit, by
+    operation, since the server started.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    def record(self, operations, latency):
+        for name, count in operations.items():
+            stats = self._stats.setdefault(
+                name, {'transactions': 0, 'tasks': 0, 'latency_sum': 0.0,
+                       'latency_max': 0.0})
+            stats['transactions'] += 1
+            stats['tasks'] += count
+            stats['latency_sum'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+
+    def get(self):
+        return dict((name, dict(stats))
+                    for name, stats in self._stats.items())
+
+
+insert_stats = TaskInsertStats()
+
+
+def _record_operation(session, task_type_id, data_type_id):
+    session.info.setdefault(_STARTED_AT, time.time())
+    operations = session.info.setdefault(_OPERATIONS,
+                                         collections.Counter())
+    operations[get_operation_name(task_type_id, data_type_id)] += 1
+
+
+@sa.event.listens_for(orm.Session, 'after_commit')
+def _record_insert_latency(session):
+    started_at = session.info.pop(_STARTED_AT, None)
+    operations = session.info.pop(_OPERATIONS, None)
+    if operations:
+        insert_stats.record(operations, time.time() - started_at)
+
+
+@sa.event.listens_for(orm.Session, 'after_rollback')
+def _discard_operations(session):
+    session.info.pop(_STARTED_AT, None)
+    session.info.pop(_OPERATIONS, None)
 
 
 def create_task(context, task_type_id, task_id=None, data_type_id=None,
                 resource_id=None, data=None):
 
+    data_format = _get_data_format()
     with context.session.begin(subtransactions=True):
+        envelope = _get_envelope(context)
+        envelope.task_count += 1
         db = Task(id=task_id,
+                  envelope_id=envelope.id,
                   type_id=task_type_id,
                   data_type_id=data_type_id,
-                  data=None if data is None else json.dumps(data),
+                  data=encode_task_data(data, data_format),
+                  data_format=data_format,
                   resource_id=resource_id,
                   transaction_id=context.request_id)
         context.session.add(db)
+        context.session.info[TASKS_WRITTEN] = True
+        _record_operation(context.session, task_type_id, data_type_id)
+
+
+def _insert_tasks(session, rows, batch_size):
+    """Insert task rows with one multi-row INSERT statement per batch and
+    return their number.
+    """
+    session.info[TASKS_WRITTEN] = True
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            session.execute(Task.__table__.insert().values(batch))
+            count += len(batch)
+            batch = []
+    if batch:
+        session.execute(Task.__table__.insert().values(batch))
+        count += len(batch)
+    return count
+
+
+def create_tasks(context, tasks, batch_size=None):
+    """Record many tasks at once, bypassing the ORM.
+
+    :param tasks: iterable of (task_type_id, data_type_id, resource_id, data)
+                  tuples.
+    :param batch_size: number of tasks inserted by each statement, defaults
+                       to task_insert_batch_size.
+    """
+    batch_size = batch_size or cfg.CONF.MIDONET.task_insert_batch_size
+    created_at = datetime.datetime.utcnow()
+    data_format = _get_data_format()
+
+    def iter_rows(envelope_id):
+        for task_type_id, data_type_id, resource_id, data in tasks:
+            _record_operation(context.session, task_type_id, data_type_id)
+            yield {'type_id': task_type_id,
+                   'data_type_id': data_type_id,
+                   'data': encode_task_data(data, data_format),
+                   'data_format': data_format,
+                   'resource_id': resource_id,
+                   'transaction_id': context.request_id,
+                   'created_at': created_at,
+                   'envelope_id': envelope_id}
+
+    with context.session.begin(subtransactions=True):
+        envelope = _get_envelope(context)
+        # Write the pending tasks first so that the ids follow call order.
+        context.session.flush()
+        envelope.task_count += _insert_tasks(context.session,
+                                             iter_rows(envelope.id),
+                                             batch_size)
+
+
+def get_parent_ids(data):
+    """Return the ids of the resources the task data refers to."""
+    if not isinstance(data, dict):
+        return set()
+
+    ids = set(data[key] for key in _PARENT_ID_KEYS if data.get(key))
+    ids.update(ip['subnet_id'] for ip in data.get('fixed_ips') or []
+               if ip.get('subnet_id'))
+    ids.update(data.get('security_groups') or [])
+    gw_info = data.get('external_gateway_info') or {}
+    if gw_info.get('network_id'):
+        ids.add(gw_info['network_id'])
+    return ids
+
+
+def get_tasks(session, after_id=0, limit=None, type_ids=None,
+              data_type_ids=None, before_id=None, descending=False):
+    """Return the tasks whose id is greater than after_id, in id order.
+
+    :param type_ids: only return the tasks of these types.
+    :param data_type_ids: only return the tasks of these data types.
+    :param before_id: only return the tasks whose id is lower, the last
+                      ones first up to the limit.
+    :param descending: return the tasks in reverse id order, the last ones
+                       first up to the limit.
+    """
+    query = session.query(Task).filter(Task.id > after_id)
+    if type_ids:
+        query = query.filter(Task.type_id.in_(type_ids))
+    if data_type_ids:
+        query = query.filter(Task.data_type_id.in_(data_type_ids))
+    if before_id is not None:
+        query = query.filter(Task.id < before_id)
+    if descending or before_id is not None:
+        query = query.order_by(Task.id.desc())
+    else:
+        query = query.order_by(Task.id)
+    if limit:
+        query = query.limit(limit)
+    tasks = query.all()
+    if before_id is not None and not descending:
+        tasks.reverse()
+    return tasks
+
+
+def _get_envelope_ends(session, tasks):
+    """Return the id of the last task of the envelope of each task."""
+    ends, counts = {}, {}
+    for t in tasks:
+        if t.envelope_id:
+            ends[t.envelope_id] = t.id
+            counts[t.envelope_id] = counts.get(t.envelope_id, 0) + 1
+
+    if not counts:
+        return ends
+
+    # The envelopes whose tasks are not all there go on after the tasks.
+    partial_ids = [envelope.id for envelope in session.query(
+        TaskEnvelope.id, TaskEnvelope.task_count).filter(
+            TaskEnvelope.id.in_(list(counts)))
+        if envelope.task_count > counts[envelope.id]]
+    if partial_ids:
+        ends.update(session.query(
+            Task.envelope_id, sa.func.max(Task.id)).filter(
+                Task.envelope_id.in_(partial_ids)).group_by(
+                    Task.envelope_id))
+    return ends
+
+
+def get_envelopes(session, after_id=0, limit=None):
+    """Return the whole envelopes of the tasks after after_id.
+
+    The tasks are read in id order, and the page ends after the last task
+    that leaves no envelope partly read.  The page may hold more than limit
+    tasks when a single envelope does.
+
+    Returns a list of lists of the tasks of each envelope, in the order of
+    the first task of the envelopes.  The tasks of concurrent transactions
+    can interleave, and are grouped by envelope.  Tasks without an envelope
+    are alone.
+    """
+    tasks = get_tasks(session, after_id=after_id, limit=limit)
+    while tasks:
+        ends = _get_envelope_ends(session, tasks)
+        end, reach = 0, 0
+        for i, t in enumerate(tasks):
+            reach = max(reach, ends.get(t.envelope_id, t.id))
+            if reach == t.id:
+                end = i + 1
+        if end:
+            tasks = tasks[:end]
+            break
+        # The first envelopes go past the page, read up to their end.
+        tasks += get_tasks(session, after_id=tasks[-1].id,
+                           before_id=reach + 1)
+
+    envelopes = []
+    by_id = {}
+    for t in tasks:
+        if t.envelope_id is None:
+            envelopes.append([t])
+        elif t.envelope_id in by_id:
+            by_id[t.envelope_id].append(t)
+        else:
+            by_id[t.envelope_id] = [t]
+            envelopes.append(by_id[t.envelope_id])
+    return envelopes
+
+
+def make_task_dict(task, fields=None):
+    res = {'id': task.id,
+           'type_id': task.type_id,
+           'data_type_id': task.data_type_id,
+           'resource_id': task.resource_id,
+           'transaction_id': task.transaction_id,
+           'created_at': task.created_at and task.created_at.isoformat(),
+           'envelope_id': task.envelope_id,
+           'depth': DEPTHS.get(task.data_type_id),
+           'data': get_task_data(task)}
+    if fields:
+        res = dict((key, value) for key, value in res.items()
+                   if key in fields)
+    return res
+
+
+def get_task_feed(session, after_id=0, limit=None, type_ids=None,
+                  data_type_ids=None):
+    """Return the dicts of the tasks after after_id, with their data decoded.
+
+    The tasks are found with the primary key, so a consumer reads the whole
+    journal by passing the id of the last task of each page as after_id.
+    """
+    return [make_task_dict(t) for t in get_tasks(
+        session, after_id=after_id, limit=limit, type_ids=type_ids,
+        data_type_ids=data_type_ids)]
+
+
+def get_checkpoint(session, consumer):
+    """Return the id of the last task applied by the consumer, or 0."""
+    checkpoint = session.query(TaskCheckpoint).get(consumer)
+    return checkpoint.task_id if checkpoint else 0
+
+
+def set_checkpoint(session, consumer, task_id):
+    with session.begin(subtransactions=True):
+        checkpoint = session.query(TaskCheckpoint).get(consumer)
+        if checkpoint is None:
+            session.add(TaskCheckpoint(consumer=consumer, task_id=task_id))
+        else:
+            checkpoint.task_id = task_id
+
+
+def find_gaps(after_id, task_ids, last_id):
+    """Return the (first_id, last_id) ranges of the ids after after_id up to
+    last_id that are not in task_ids.
+    """
+    gaps = []
+    next_id = after_id + 1
+    for task_id in sorted(task_ids):
+        if task_id > last_id:
+            break
+        if task_id > next_id:
+            gaps.append((next_id, task_id - 1))
+        next_id = task_id + 1
+    return gaps
+
+
+def add_gaps(session, consumer, gaps):
+    """Record the (first_id, last_id) ranges of ids the consumer found no
+    task for.
+    """
+    with session.begin(subtransactions=True):
+        for first_id, last_id in gaps:
+            session.add(TaskGap(consumer=consumer, first_id=first_id,
+                                last_id=last_id))
+
+
+def get_gap_tasks(session, consumer, timeout):
+    """Return the tasks committed in the gaps of the consumer since it found
+    them, in id order, and forget the gaps older than timeout seconds that
+    hold none.
+    """
+    with session.begin(subtransactions=True):
+        gaps = session.query(TaskGap).filter_by(consumer=consumer).all()
+        tasks = []
+        for i in range(0, len(gaps), _GAP_CHUNK):
+            tasks.extend(session.query(Task).filter(sa.or_(*[
+                Task.id.between(gap.first_id, gap.last_id)
+                for gap in gaps[i:i + _GAP_CHUNK]])))
+        tasks.sort(key=lambda t: t.id)
+
+        task_ids = [t.id for t in tasks]
+        expired_at = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=timeout)
+        for gap in gaps:
+            i = bisect.bisect_left(task_ids, gap.first_id)
+            if gap.found_at < expired_at and (
+                    i == len(task_ids) or task_ids[i] > gap.last_id):
+                session.delete(gap)
+        return tasks
+
+
+def fill_gaps(session, consumer, task_ids):
+    """Remove the ids of the tasks the consumer applied from its gaps."""
+    with session.begin(subtransactions=True):
+        for task_id in task_ids:
+            gap = session.query(TaskGap).filter(
+                TaskGap.consumer == consumer, TaskGap.first_id <= task_id,
+                TaskGap.last_id >= task_id).first()
+            if gap is None:
+                continue
+            if gap.last_id > task_id:
+                session.add(TaskGap(consumer=consumer, first_id=task_id + 1,
+                                    last_id=gap.last_id,
+                                    found_at=gap.found_at))
+            if gap.first_id < task_id:
+                gap.last_id = task_id - 1
+            else:
+                session.delete(gap)
+            session.flush()
+
+
+def read_envelopes(session, consumer, limit=None):
+    """Return the checkpoint of the consumer and the whole envelopes of the
+    tasks after it, as get_envelopes() does, and record the id of the last
+    task read as the read id of the consumer.
+
+    The checkpoint is locked while the tasks are read, so the task
+    compactor, which locks the checkpoints, sees the read id of every page
+    read before it folds the tasks.
+    """
+    with session.begin(subtransactions=True):
+        checkpoint = session.query(TaskCheckpoint).filter_by(
+            consumer=consumer).populate_existing().with_lockmode(
+                'update').first()
+        if checkpoint is None:
+            checkpoint = TaskCheckpoint(consumer=consumer, task_id=0)
+            session.add(checkpoint)
+            session.flush()
+        envelopes = get_envelopes(session, after_id=checkpoint.task_id,
+                                  limit=limit)
+        if envelopes:
+            checkpoint.read_id = max(t.id for envelope in envelopes
+                                     for t in envelope)
+        return checkpoint.task_id, envelopes
+
+
+def get_consumer_lags(session):
+    """Return the backlog of each task consumer: the tasks after its
+    checkpoint, their size in bytes, and the age of the oldest in seconds.
+    """
+    now = datetime.datetime.utcnow()
+    lags = []
+    for checkpoint in session.query(TaskCheckpoint).order_by(
+            TaskCheckpoint.consumer):
+        rows, size, oldest = session.query(
+            sa.func.count(Task.id), sa.func.sum(sa.func.length(Task.data)),
+            sa.func.min(Task.created_at)).filter(
+                Task.id > checkpoint.task_id).one()
+        lags.append({'consumer': checkpoint.consumer,
+                     'task_id': checkpoint.task_id,
+                     'backlog_rows': rows,
+                     'backlog_bytes': int(size or 0),
+                     'oldest_task_age': (
+                         _total_seconds(now - oldest) if oldest else 0.0)})
+    return lags
+
+
+def get_task_rates(session, window):
+    """Return the tasks written per second over the last window seconds, by
+    operation.
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=window)
+    return dict((get_operation_name(type_id, data_type_id),
+                 float(count) / window)
+                for type_id, data_type_id, count in session.query(
+                    Task.type_id, Task.data_type_id,
+                    sa.func.count(Task.id)).filter(
+                        Task.created_at >= since).group_by(
+                            Task.type_id, Task.data_type_id))
+
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def fingerprint(data):
+    """Return the content hash of the data of a resource."""
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def fold_fingerprints(tasks):
+    """Return the fingerprints the tasks leave, in id order.
+
+    Returns whether the tasks include a FLUSH, which voids the fingerprints
+    before it, and a dict mapping the (data_type_id, resource_id) of the
+    cluster resources the tasks write to their fingerprints, or to None
+    when they are deleted.
+    """
+    data_type_ids = set(r[0] for r in CLUSTER_RESOURCES)
+    flushed, fingerprints = False, {}
+    for t in tasks:
+        if t.type_id == FLUSH:
+            flushed = True
+            fingerprints.clear()
+        elif t.data_type_id in data_type_ids:
+            fingerprints[t.data_type_id, t.resource_id] = (
+                None if t.type_id == DELETE
+                else fingerprint(get_task_data(t)))
+    return flushed, fingerprints
+
+
+def update_fingerprints(session, tasks):
+    """Record the fingerprints of the resources the tasks applied."""
+    flushed, fingerprints = fold_fingerprints(tasks)
+    if not flushed and not fingerprints:
+        return
+
+    resource_ids = {}
+    for data_type_id, resource_id in fingerprints:
+        resource_ids.setdefault(data_type_id, []).append(resource_id)
+
+    with session.begin(subtransactions=True):
+        query = session.query(TaskFingerprint)
+        if flushed:
+            query.delete(synchronize_session=False)
+        else:
+            for data_type_id, ids in resource_ids.items():
+                query.filter(TaskFingerprint.data_type_id == data_type_id,
+                             TaskFingerprint.resource_id.in_(ids)).delete(
+                                 synchronize_session=False)
+        rows = [{'data_type_id': data_type_id,
+                 'resource_id': resource_id,
+                 'content_hash': content_hash}
+                for (data_type_id, resource_id), content_hash
+                in fingerprints.items() if content_hash]
+        if rows:
+            session.execute(TaskFingerprint.__table__.insert().values(rows))
+
+
+class TaskNotFound(n_exc.NotFound):
+    message = _("Task %(id)s could not be found")
+
+
+class TaskConsumerNotFound(n_exc.NotFound):
+    message = _("Task consumer %(id)s could not be found")
+
+
+class TaskMetricNotFound(n_exc.NotFound):
+    message = _("Task metric %(id)s could not be found")
+
+
+class MidoTaskMixin(object):
+    """Read-only task feed of the task extension, for administrators."""
+
+    def _check_task_admin(self, context):
+        if not context.is_admin:
+            raise n_exc.AdminRequired(reason=_("tasks are admin only"))
+
+    def _get_task_id(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise n_exc.BadRequest(resource='task',
+                                   msg=_("Invalid task id %s") % value)
+
+    def get_tasks(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
+        """Return a page of tasks in id order, or reverse id order.
+
+        The tasks are paged with the task id as the marker and read with the
+        primary key, whatever the page.  They can only be sorted by id.
+        """
+        self._check_task_admin(context)
+        descending = self._is_task_sort_descending(sorts)
+        filters = filters or {}
+        marker_id = self._get_task_id(marker) if marker is not None else None
+        kwargs = {'limit': limit or cfg.CONF.MIDONET.task_feed_page_size,
+                  'type_ids': filters.get('type_id'),
+                  'data_type_ids': filters.get('data_type_id')}
+        # The page is read away from the marker, towards the lower ids when
+        # the order and the direction of the page disagree.
+        if descending != bool(page_reverse):
+            tasks = get_tasks(context.session, before_id=marker_id,
+                              descending=True, **kwargs)
+        else:
+            tasks = get_tasks(context.session, after_id=marker_id or 0,
+                              **kwargs)
+        if page_reverse:
+            tasks.reverse()
+        return [make_task_dict(t, fields) for t in tasks]
+
+    def _is_task_sort_descending(self, sorts):
+        keys = dict(sorts or [])
+        if set(keys) - set(['id']):
+            raise n_exc.BadRequest(resource='task',
+                                   msg=_("Tasks can only be sorted by id"))
+        return not keys.get('id', True)
+
+    def get_task(self, context, id, fields=None):
+        self._check_task_admin(context)
+        t = context.session.query(Task).get(self._get_task_id(id))
+        if t is None:
+            raise TaskNotFound(id=id)
+        return make_task_dict(t, fields)
+
+    def _make_task_consumer_dict(self, lag, fields=None):
+        res = {'id': lag['consumer'],
+               'task_id': lag['task_id'],
+               'backlog_rows': lag['backlog_rows'],
+               'backlog_bytes': lag['backlog_bytes'],
+               'oldest_task_age': lag['oldest_task_age']}
+        if fields:
+            res = dict((key, value) for key, value in res.items()
+                       if key in fields)
+        return res
+
+    def get_task_consumers(self, context, filters=None, fields=None):
+        self._check_task_admin(context)
+        return [self._make_task_consumer_dict(lag, fields)
+                for lag in get_consumer_lags(context.session)]
+
+    def get_task_consumer(self, context, id, fields=None):
+        self._check_task_admin(context)
+        for lag in get_consumer_lags(context.session):
+            if lag['consumer'] == id:
+                return self._make_task_consumer_dict(lag, fields)
+        raise TaskConsumerNotFound(id=id)
+
+    def update_task_consumer(self, context, id, task_consumer):
+        """Record the id of the last task the consumer applied."""
+        self._check_task_admin(context)
+        set_checkpoint(context.session, id,
+                       task_consumer['task_consumer']['task_id'])
+        return self.get_task_consumer(context, id)
+
+    def _make_task_metric_dict(self, name, rate, stats, fields=None):
+        transactions = stats.get('transactions', 0)
+        res = {'id': name,
+               'tasks_per_sec': rate,
+               'transactions': transactions,
+               'insert_latency_avg': (stats['latency_sum'] / transactions
+                                      if transactions else None),
+               'insert_latency_max': stats.get('latency_max')}
+        if fields:
+            res = dict((key, value) for key, value in res.items()
+                       if key in fields)
+        return res
+
+    def get_task_metrics(self, context, filters=None, fields=None):
+        """Return, by operation, the rate of the tasks written over the last
+        task_rate_window seconds, and the time from the first task of the
+        transactions of this server writing them to their commit.
+        """
+        self._check_task_admin(context)
+        rates = get_task_rates(context.session,
+                               cfg.CONF.MIDONET.task_rate_window)
+        stats = insert_stats.get()
+        return [self._make_task_metric_dict(name, rates.get(name, 0.0),
+                                            stats.get(name, {}), fields)
+                for name in sorted(set(rates) | set(stats))]
+
+    def get_task_metric(self, context, id, fields=None):
+        for metric in self.get_task_metrics(context):
+            if metric['id'] == id:
+                if fields:
+                    metric = dict((key, value)
+                                  for key, value in metric.items()
+                                  if key in fields)
+                return metric
+        raise TaskMetricNotFound(id=id)
+
+    def _log_task_metrics(self):
+        """Log the backlog of each task consumer."""
+        try:
+            for lag in get_consumer_lags(
+                    n_context.get_admin_context().session):
+                LOG.info(_("Task consumer %(consumer)s is %(backlog_rows)d "
+                           "tasks (%(backlog_bytes)d bytes) behind, the "
+                           "oldest written %(oldest_task_age).1f seconds "
+                           "ago"), lag)
+        except Exception:
+            LOG.exception(_("Failed to read the task consumer backlog"))
 
 
 class MidonetClusterException(n_exc.NeutronException):
     message = _("Midonet Cluster Error: %(msg)s")
 
 
+class ClusterRebuildNotFound(n_exc.NotFound):
+    message = _("Cluster rebuild %(id)s could not be found")
+
+
+class ClusterRebuildInProgress(n_exc.Conflict):
+    message = _("Cluster rebuild %(id)s is in progress")
+
+
+def import_snapshot(context, fileobj):
+    """Append the resources of a snapshot file as CREATE tasks after a FLUSH
+    task, in envelopes of cluster_rebuild_chunk_size tasks, and return the
+    header of the file.
+
+    The lines are inserted as they are read, and checked against the counts
+    and the checksum of the header before the transaction commits.
+    """
+    session = context.session
+    data_format = _get_data_format()
+    created_at = datetime.datetime.utcnow()
+    snapshot = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    try:
+        header = json.loads(snapshot.readline().decode('utf-8'))
+        if (header.get('format') != SNAPSHOT_FORMAT or
+                header.get('version') != SNAPSHOT_VERSION):
+            raise MidonetClusterException(
+                msg=_("Unsupported snapshot file"))
+        checksum = hashlib.sha1()
+        counts = collections.Counter()
+
+        def iter_rows():
+            for line in snapshot:
+                checksum.update(line)
+                record = json.loads(line.decode('utf-8'))
+                counts[DATA_TYPE_NAMES[record['data_type_id']]] += 1
+                yield {'type_id': CREATE,
+                       'data_type_id': record['data_type_id'],
+                       'data': encode_task_data(record['data'], data_format),
+                       'data_format': data_format,
+                       'resource_id': record['resource_id'],
+                       'transaction_id': context.request_id,
+                       'created_at': created_at}
+
+        chunk_size = cfg.CONF.MIDONET.cluster_rebuild_chunk_size
+        with session.begin(subtransactions=True):
+            create_task(context, FLUSH)
+            envelope = _get_envelope(context)
+            session.flush()
+            rows = iter_rows()
+            chunk = list(itertools.islice(rows, chunk_size))
+            while chunk:
+                for row in chunk:
+                    row['envelope_id'] = envelope.id
+                envelope.task_count += _insert_tasks(session, chunk,
+                                                     chunk_size)
+                chunk = list(itertools.islice(rows, chunk_size))
+                if chunk:
+                    envelope = _next_envelope(context)
+            expected = dict((name, count) for name, count
+                            in header['counts'].items() if count)
+            if (checksum.hexdigest() != header['sha1'] or
+                    dict(counts) != expected):
+                raise MidonetClusterException(
+                    msg=_("The snapshot file does not match its header"))
+    finally:
+        snapshot.close()
+    return header
+
+
 class MidoClusterMixin(object):
+    """Rebuilds midonet_tasks from a snapshot of the Neutron database.
+
+    A rebuild runs in the background and records its progress in
+    midonet_cluster_rebuilds.
+
+    A full rebuild replaces the tasks with a CREATE task for every
+    resource.  The resources are read in one snapshot and their tasks
+    staged in midonet_cluster_rebuild_tasks a chunk at a time, each chunk
+    in its own transaction, so a rebuild that fails once they are all
+    staged resumes with them.  The staged tasks then replace the tasks,
+    followed by the tasks written since the snapshot was taken.
+
+    An incremental rebuild compares the content of the resources to the
+    fingerprints of what the task replayer has applied, and of the tasks it
+    has not applied yet, and appends the tasks creating, updating and
+    deleting the resources that differ.  The resources are read a chunk at
+    a time and spooled to a temporary file as serialized tasks, which are
+    then inserted a chunk at a time, so the memory a rebuild uses does not
+    depend on the number of resources.
+    """
+
+    def _query_chunk(self, context, model, make_dict, last_id, chunk_size):
+        """Return the dicts of the resources of a model after last_id."""
+        query = self._model_query(context, model)
+        if last_id is not None:
+            query = query.filter(model.id > last_id)
+        return [make_dict(item)
+                for item in query.order_by(model.id).limit(chunk_size)]
 
-    def create_cluster(self, context):
+    def _iter_chunks(self, context, model, make_dict, chunk_size,
+                     heartbeat=None):
+        """Yield the dicts of all the resources of a model in id order, a
+        chunk at a time.
+        """
+        last_id = None
+        while True:
+            items = self._query_chunk(context, model, make_dict, last_id,
+                                      chunk_size)
+            if heartbeat is not None:
+                heartbeat()
+            if items:
+                yield items
+            if len(items) < chunk_size:
+                return
+            last_id = items[-1]['id']
+
+    def _write_task_line(self, spool, task_type_id, data_type_id,
+                         resource_id, data):
+        spool.write('%d\t%d\t%s\t%s\n' % (
+            task_type_id, data_type_id, resource_id, json.dumps(data)))
+
+    def _get_expected_fingerprints(self, session):
+        """Return whether the task replayer will flush MidoNet, and the
+        fingerprints of the tasks it has not applied yet.
+        """
+        checkpoint = get_checkpoint(session,
+                                    cfg.CONF.MIDONET.task_consumer_name)
+        flushed, pending = fold_fingerprints(session.query(Task).filter(
+            Task.id > checkpoint).order_by(Task.id))
+        if not flushed and session.query(TaskFingerprint).first() is None:
+            raise MidonetClusterException(
+                msg=_("There are no fingerprints to compare the resources "
+                      "to, a full rebuild is needed first"))
+        return flushed, pending
+
+    def _write_resources(self, context, resource, expected, spool,
+                         delete_spool, heartbeat=None):
+        """Write the task lines of a kind of resource.
+
+        Without expected fingerprints, a CREATE task line is written to the
+        spool for every resource.  Otherwise, only the resources that differ
+        from what MidoNet holds once the pending tasks are applied get a
+        CREATE or UPDATE task line in the spool, or a DELETE task line in
+        the delete spool.
+        """
+        data_type_id, model, make_dict = resource
+        session = context.session
+        chunk_size = cfg.CONF.MIDONET.cluster_rebuild_chunk_size
+        if expected is not None:
+            flushed, pending = expected
+
+        for items in self._iter_chunks(context, model,
+                                       getattr(self, make_dict),
+                                       chunk_size, heartbeat):
+            if expected is None:
+                for item in items:
+                    self._write_task_line(spool, CREATE, data_type_id,
+                                          item['id'], item)
+                continue
+
+            hashes = {}
+            if not flushed:
+                hashes.update(session.query(
+                    TaskFingerprint.resource_id,
+                    TaskFingerprint.content_hash).filter(
+                        TaskFingerprint.data_type_id == data_type_id,
+                        TaskFingerprint.resource_id.in_(
+                            [item['id'] for item in items])))
+            for item in items:
+                expected_hash = pending.get((data_type_id, item['id']),
+                                            hashes.get(item['id']))
+                if expected_hash is None:
+                    self._write_task_line(spool, CREATE, data_type_id,
+                                          item['id'], item)
+                elif (expected_hash != fingerprint(item) and
+                      data_type_id not in _IMMUTABLE_RESOURCES):
+                    self._write_task_line(spool, UPDATE, data_type_id,
+                                          item['id'], item)
+
+        if expected is None:
+            return
+
+        deleted_ids = set()
+        if not flushed:
+            deleted_ids.update(row.resource_id for row in session.query(
+                TaskFingerprint.resource_id).outerjoin(
+                    model, model.id == TaskFingerprint.resource_id).filter(
+                        TaskFingerprint.data_type_id == data_type_id,
+                        model.id.is_(None)))
+        live_ids = set()
+        for (pending_type_id, resource_id), content_hash in pending.items():
+            if pending_type_id != data_type_id:
+                continue
+            deleted_ids.discard(resource_id)
+            if content_hash:
+                live_ids.add(resource_id)
+        if live_ids:
+            deleted_ids |= live_ids - set(row.id for row in session.query(
+                model.id).filter(model.id.in_(live_ids)))
+        for resource_id in sorted(deleted_ids):
+            self._write_task_line(delete_spool, DELETE, data_type_id,
+                                  resource_id, None)
+
+    def _run_per_resource(self, contexts, func, args):
+        """Call func with a context and each of args, each call on the first
+        free context, so the calls run concurrently on several contexts.
+        """
+        free_contexts = queue.LightQueue()
+        for context in contexts:
+            free_contexts.put(context)
+
+        errors = []
+
+        def call(arg):
+            if errors:
+                return
+            context = free_contexts.get()
+            try:
+                return func(context, arg)
+            except Exception:
+                errors.append(sys.exc_info())
+                raise
+            finally:
+                free_contexts.put(context)
+
+        pool = eventlet.GreenPool(len(contexts))
+        threads = [pool.spawn(call, arg) for arg in args]
+        # Wait for every call, so that none is left running on the contexts
+        # after a failure, then raise the first failure.
+        pool.waitall()
+        if errors:
+            six.reraise(*errors[0])
+        return [thread.wait() for thread in threads]
+
+    def _spool_snapshot(self, contexts, spool, incremental, heartbeat=None):
+        """Write the task lines of the rebuild to the spool.
+
+        Each kind of resource is read on the first free context, so with
+        several contexts sharing a snapshot the kinds are read concurrently.
+        The CREATE and UPDATE tasks are spooled in the order of
+        CLUSTER_RESOURCES, followed by the DELETE tasks in reverse order, so
+        that the resources referring to others are deleted first.
+        """
+        expected = (self._get_expected_fingerprints(contexts[0].session)
+                    if incremental else None)
+
+        def write_resources(context, args):
+            resource, spools = args
+            self._write_resources(context, resource, expected, *spools,
+                                  heartbeat=heartbeat)
+
+        spools = [(tempfile.TemporaryFile(mode='w+'),
+                   tempfile.TemporaryFile(mode='w+'))
+                  for resource in CLUSTER_RESOURCES]
+        try:
+            self._run_per_resource(contexts, write_resources,
+                                   zip(CLUSTER_RESOURCES, spools))
+            for resource_spool in ([s[0] for s in spools] +
+                                   [s[1] for s in reversed(spools)]):
+                resource_spool.seek(0)
+                shutil.copyfileobj(resource_spool, spool)
+        finally:
+            for resource_spools in spools:
+                for resource_spool in resource_spools:
+                    resource_spool.close()
+
+    def _write_snapshot(self, context, spool):
+        """Write a CREATE task line to the spool for every resource."""
+        self._spool_snapshot([context], spool, False)
+
+    def _write_diff(self, context, spool):
+        """Write a task line to the spool for every resource that differs
+        from what MidoNet holds once the pending tasks are applied.
+        """
+        self._spool_snapshot([context], spool, True)
+
+    def _get_snapshot_contexts(self, context):
+        """Return the context and the extra contexts reading the snapshot
+        concurrently.
+        """
+        workers = min(cfg.CONF.MIDONET.cluster_snapshot_workers,
+                      len(CLUSTER_RESOURCES))
+        return [context] + [n_context.get_admin_context()
+                            for i in range(workers - 1)]
+
+    def _read_snapshot(self, contexts, spool, incremental, heartbeat=None):
+        self._spool_snapshot(contexts, spool, incremental, heartbeat)
+
+        # record the last task the snapshot includes and how many tasks it
+        # sees up to there. We compare this to another count after we lock
+        # midonet_tasks to make sure no transaction was writing tasks while
+        # the snapshot was taken.
+        max_task_id, task_count = contexts[0].session.query(
+            sa.func.max(Task.id), sa.func.count(Task.id)).one()
+        return max_task_id or 0, task_count
+
+    def _take_locked_snapshot(self, context, spool, incremental,
+                              heartbeat=None):
+        """Take the snapshot with all the tables of the server locked.
+
+        The heartbeat cannot be written while the tables are locked, so it
+        is only called before and after.
+        """
+        contexts = self._get_snapshot_contexts(context)
+        session = context.session
+        if heartbeat is not None:
+            heartbeat()
+        with session.begin(subtransactions=True):
+            session.execute('FLUSH TABLES WITH READ LOCK')
+            try:
+                return self._read_snapshot(contexts, spool, incremental)
+            finally:
+                session.execute('UNLOCK TABLES')
+                if heartbeat is not None:
+                    heartbeat()
+
+    def _take_consistent_snapshot(self, context, spool, incremental,
+                                  heartbeat=None):
+        """Take the snapshot in consistent snapshot transactions.
+
+        With several snapshot workers, the tables are locked while their
+        transactions start, so they all see the same snapshot, as
+        mysqldump does.  Otherwise nothing is locked, and the Neutron API
+        keeps serving writes while the snapshot is read.
+        """
+        contexts = self._get_snapshot_contexts(context)
+        transactions = []
         try:
-            # lock the entire database so we can take a snapshot of the
-            # data we need.
-            context.session.execute('FLUSH TABLES WITH READ LOCK')
-
-            database = collections.OrderedDict({
-                NETWORK: self.get_networks(context),
-                SUBNET: self.get_subnets(context),
-                PORT: self.get_ports(context),
-                ROUTER: self.get_routers(context),
-                FLOATINGIP: self.get_floatingips(context),
-                SECURITYGROUP: self.get_security_groups(context),
-                SECURITYGROUPRULE: self.get_security_group_rules(context)})
-
-            # record how much items we have processed so far. We compare
-            # this to another count after we lock midonet_tasks to make
-            # sure nothing snuck in between the locks.
-            task_count = context.session.query(Task).count()
+            transactions.append(context.session.begin())
+            if len(contexts) > 1:
+                context.session.execute('FLUSH TABLES WITH READ LOCK')
+            try:
+                for snapshot_context in contexts:
+                    session = snapshot_context.session
+                    if snapshot_context is not context:
+                        transactions.append(session.begin())
+                    session.execute(
+                        'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                    session.execute(
+                        'START TRANSACTION WITH CONSISTENT SNAPSHOT')
+            finally:
+                if len(contexts) > 1:
+                    context.session.execute('UNLOCK TABLES')
+            return self._read_snapshot(contexts, spool, incremental,
+                                       heartbeat)
         finally:
-            context.session.execute('UNLOCK TABLES')
+            for transaction in reversed(transactions):
+                transaction.commit()
+
+    def _take_snapshot(self, context, spool, incremental, heartbeat=None):
+        if cfg.CONF.MIDONET.cluster_snapshot_mode == 'lock':
+            return self._take_locked_snapshot(context, spool, incremental,
+                                              heartbeat)
+        return self._take_consistent_snapshot(context, spool, incremental,
+                                              heartbeat)
+
+    def export_snapshot(self, context, fileobj):
+        """Write the resources to a gzip compressed snapshot file, one JSON
+        line per resource in dependency order, and return its header.
 
+        The first line is the header, with the number of resources of each
+        kind and the SHA-1 checksum of the lines that follow.  The resources
+        are read in a consistent snapshot transaction, so the Neutron API
+        keeps serving writes meanwhile.
+        """
+        spool = tempfile.TemporaryFile(mode='w+')
+        records = tempfile.TemporaryFile(mode='w+b')
         try:
-            context.session.execute('LOCK TABLES midonet_tasks WRITE')
-            with context.session.begin(subtransactions=True):
-                if task_count != context.session.query(Task).count():
+            task_id, task_count = self._take_consistent_snapshot(
+                context, spool, False)
+            counts = dict((DATA_TYPE_NAMES[data_type_id], 0)
+                          for data_type_id, model, make_dict
+                          in CLUSTER_RESOURCES)
+            checksum = hashlib.sha1()
+            spool.seek(0)
+            for line in spool:
+                task_type_id, data_type_id, resource_id, data = line.rstrip(
+                    '\n').split('\t', 3)
+                record = ('{"data_type_id": %s, "resource_id": %s, '
+                          '"data": %s}\n' % (data_type_id,
+                                             json.dumps(resource_id),
+                                             data)).encode('utf-8')
+                checksum.update(record)
+                records.write(record)
+                counts[DATA_TYPE_NAMES[int(data_type_id)]] += 1
+
+            header = {'format': SNAPSHOT_FORMAT,
+                      'version': SNAPSHOT_VERSION,
+                      'created_at': datetime.datetime.utcnow().isoformat(),
+                      'task_id': task_id,
+                      'counts': counts,
+                      'sha1': checksum.hexdigest()}
+            snapshot = gzip.GzipFile(fileobj=fileobj, mode='wb')
+            try:
+                snapshot.write(json.dumps(header).encode('utf-8') + b'\n')
+                records.seek(0)
+                shutil.copyfileobj(records, snapshot)
+            finally:
+                snapshot.close()
+            return header
+        finally:
+            records.close()
+            spool.close()
+
+    def _iter_spool(self, context, spool, envelope_id=None, heartbeat=None):
+        """Yield the task rows written to the spool."""
+        created_at = datetime.datetime.utcnow()
+        data_format = _get_data_format()
+        spool.seek(0)
+        for line in spool:
+            if heartbeat is not None:
+                heartbeat()
+            task_type_id, data_type_id, resource_id, data = line.rstrip(
+                '\n').split('\t', 3)
+            yield {'type_id': int(task_type_id),
+                   'data_type_id': int(data_type_id),
+                   'data': encode_task_data(data, data_format),
+                   'data_format': data_format,
+                   'resource_id': resource_id,
+                   'transaction_id': context.request_id,
+                   'created_at': created_at,
+                   'envelope_id': envelope_id}
+
+    def _insert_snapshot(self, context, spool, envelope_id=None,
+                         heartbeat=None):
+        """Insert the tasks of the spool a chunk at a time and return
+        their number.
+        """
+        return _insert_tasks(context.session,
+                             self._iter_spool(context, spool, envelope_id,
+                                              heartbeat),
+                             cfg.CONF.MIDONET.cluster_rebuild_chunk_size)
+
+    def _append_tasks(self, context, spool, max_task_id, task_count,
+                      heartbeat=None):
+        session = context.session
+        with session.begin(subtransactions=True):
+            session.execute('LOCK TABLES midonet_tasks WRITE, '
+                            'midonet_task_envelopes WRITE')
+            try:
+                # The tasks are appended, so no task may have been written
+                # since the snapshot was taken.
+                last_id, count = session.query(
+                    sa.func.max(Task.id), sa.func.count(Task.id)).one()
+                if ((last_id or 0), count) != (max_task_id, task_count):
                     error_msg = ("The database has been updated while the "
                                  "rebuild operation is in progress")
                     raise MidonetClusterException(msg=error_msg)
 
-                context.session.execute('TRUNCATE TABLE midonet_tasks')
+                # The differences are applied together.
+                envelope = _get_envelope(context)
+                envelope.task_count += self._insert_snapshot(
+                    context, spool, envelope.id, heartbeat)
+
+                # UNLOCK TABLES commits, so write everything before it.
+                _seal_envelope(session)
+                session.flush()
+            finally:
+                session.execute('UNLOCK TABLES')
+
+    def _stage_snapshot(self, context, rebuild_id, spool, task_id,
+                        task_count):
+        """Stage the CREATE tasks of the spool a chunk at a time, each chunk
+        in its own transaction, then record the last task the snapshot
+        reflects.
+        """
+        session = context.session
+        chunk_size = cfg.CONF.MIDONET.cluster_rebuild_chunk_size
+        spool.seek(0)
+        items_total = sum(1 for line in spool)
+        with session.begin(subtransactions=True):
+            session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                {'items_done': 0, 'items_total': items_total},
+                synchronize_session=False)
+
+        rows = self._iter_spool(context, spool)
+        items_done, started = 0, time.time()
+        while True:
+            chunk = [{'rebuild_id': rebuild_id,
+                      'data_type_id': row['data_type_id'],
+                      'resource_id': row['resource_id'],
+                      'data': row['data'],
+                      'data_format': row['data_format'],
+                      'created_at': row['created_at']}
+                     for row in itertools.islice(rows, chunk_size)]
+            if not chunk:
+                break
+            items_done += len(chunk)
+            with session.begin(subtransactions=True):
+                session.execute(
+                    ClusterRebuildTask.__table__.insert().values(chunk))
+                session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                    {'items_done': items_done,
+                     'data_type_id': chunk[-1]['data_type_id'],
+                     'rate': items_done / max(time.time() - started, 0.001)},
+                    synchronize_session=False)
 
+        with session.begin(subtransactions=True):
+            session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                {'task_id': task_id, 'task_count': task_count},
+                synchronize_session=False)
+
+    def _clear_staging(self, session, rebuild_id):
+        with session.begin(subtransactions=True):
+            session.query(ClusterRebuildTask).filter_by(
+                rebuild_id=rebuild_id).delete(synchronize_session=False)
+
+    def _swap_tasks(self, context, rebuild_id, heartbeat=None):
+        """Replace the tasks with the staged ones, followed by the tasks
+        written since the snapshot was taken.
+
+        Returns False, without changing anything, when a transaction that
+        was writing tasks while the snapshot was taken has committed since.
+        """
+        session = context.session
+        rebuild = session.query(ClusterRebuild).get(rebuild_id)
+        with session.begin(subtransactions=True):
+            session.execute('LOCK TABLES midonet_tasks WRITE, '
+                            'midonet_task_envelopes WRITE, '
+                            'midonet_task_checkpoints WRITE, '
+                            'midonet_task_gaps WRITE, '
+                            'midonet_cluster_rebuild_tasks READ')
+            try:
+                if rebuild.task_count != session.query(
+                        sa.func.count(Task.id)).filter(
+                            Task.id <= rebuild.task_id).scalar():
+                    return False
+
+                tail = [row._asdict() for row in session.query(
+                    Task.id, Task.type_id, Task.data_type_id, Task.data,
+                    Task.data_format, Task.resource_id, Task.transaction_id,
+                    Task.created_at, Task.envelope_id).filter(
+                        Task.id > rebuild.task_id).order_by(Task.id)]
+
+                session.execute('TRUNCATE TABLE midonet_tasks')
+                # Task ids start over after the truncate, so the consumers
+                # must start over as well.
+                session.query(TaskCheckpoint).delete()
+                session.query(TaskGap).delete()
+                envelope_counts = collections.Counter(
+                    row['envelope_id'] for row in tail if row['envelope_id'])
+                envelopes = session.query(TaskEnvelope)
+                if envelope_counts:
+                    envelopes = envelopes.filter(
+                        ~TaskEnvelope.id.in_(list(envelope_counts)))
+                envelopes.delete(synchronize_session=False)
+                for envelope_id, count in envelope_counts.items():
+                    session.query(TaskEnvelope).filter_by(
+                        id=envelope_id).update({'task_count': count},
+                                               synchronize_session=False)
+
+                # The staged tasks, in the order of the spool, go in
+                # envelopes of a chunk each, the first one with the FLUSH
+                # task, so that the consumers apply and checkpoint the
+                # rebuild a chunk at a time.
                 create_task(context, FLUSH, task_id=1)
-                for key in database:
-                    for item in database[key]:
-                        create_task(context, CREATE, data_type_id=key,
-                                    resource_id=item['id'], data=item)
+                envelope = _get_envelope(context)
+                session.flush()
+                chunk_size = cfg.CONF.MIDONET.cluster_rebuild_chunk_size
+                staged = ClusterRebuildTask.__table__
+                start_id = 0
+                while start_id is not None:
+                    if heartbeat is not None:
+                        heartbeat()
+                    next_id = session.query(ClusterRebuildTask.id).filter(
+                        ClusterRebuildTask.rebuild_id == rebuild_id,
+                        ClusterRebuildTask.id >= start_id).order_by(
+                            ClusterRebuildTask.id).offset(chunk_size).limit(
+                                1).scalar()
+                    chunk = sa.and_(staged.c.rebuild_id == rebuild_id,
+                                    staged.c.id >= start_id)
+                    if next_id is not None:
+                        chunk = sa.and_(chunk, staged.c.id < next_id)
+                    result = session.execute(
+                        Task.__table__.insert().from_select(
+                            ['type_id', 'data_type_id', 'data', 'data_format',
+                             'resource_id', 'transaction_id', 'created_at',
+                             'envelope_id'],
+                            sa.select([sa.literal(CREATE),
+                                       staged.c.data_type_id, staged.c.data,
+                                       staged.c.data_format,
+                                       staged.c.resource_id,
+                                       sa.literal(context.request_id),
+                                       staged.c.created_at,
+                                       sa.literal(envelope.id)]).where(
+                                           chunk).order_by(staged.c.id)))
+                    envelope.task_count += result.rowcount
+                    if next_id is not None:
+                        envelope = _next_envelope(context)
+                    start_id = next_id
+                for row in tail:
+                    del row['id']
+                _insert_tasks(session, tail,
+                              cfg.CONF.MIDONET.cluster_rebuild_chunk_size)
+
+                # UNLOCK TABLES commits, so write everything before it.
+                _seal_envelope(session)
+                session.flush()
+            finally:
+                session.execute('UNLOCK TABLES')
+        return True
+
+    def _rebuild_full(self, context, rebuild_id, heartbeat):
+        session = context.session
+        if session.query(ClusterRebuild.task_id).filter_by(
+                id=rebuild_id).scalar() is None:
+            # The tasks of an earlier attempt are not all staged, and its
+            # snapshot is gone, so start over.
+            self._clear_staging(session, rebuild_id)
+            spool = tempfile.TemporaryFile(mode='w+')
+            try:
+                snapshot = self._take_snapshot(context, spool, False,
+                                               heartbeat)
+                self._stage_snapshot(context, rebuild_id, spool, *snapshot)
+            finally:
+                spool.close()
+
+        if not self._swap_tasks(context, rebuild_id, heartbeat):
+            # The snapshot cannot be trusted, start over on the next attempt.
+            with session.begin(subtransactions=True):
+                self._clear_staging(session, rebuild_id)
+                session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                    {'task_id': None, 'task_count': None, 'items_done': 0},
+                    synchronize_session=False)
+            raise MidonetClusterException(
+                msg=_("The database has been updated while the rebuild "
+                      "operation is in progress"))
+        self._clear_staging(session, rebuild_id)
+
+    def _rebuild_incremental(self, context, heartbeat):
+        spool = tempfile.TemporaryFile(mode='w+')
+        try:
+            snapshot = self._take_snapshot(context, spool, True, heartbeat)
+            self._append_tasks(context, spool, *snapshot, heartbeat=heartbeat)
         finally:
-            context.session.execute('UNLOCK TABLES')
+            spool.close()
+
+    def _get_heartbeat(self, rebuild_id):
+        """Return a function touching the updated_at of the rebuild when a
+        tenth of cluster_rebuild_timeout has passed since it last did.
+
+        It writes on a session of its own, so the rebuild calls it in the
+        middle of its long transactions, to tell the other servers it is
+        still running.
+        """
+        session = n_context.get_admin_context().session
+        interval = cfg.CONF.MIDONET.cluster_rebuild_timeout / 10.0
+        beaten_at = [time.time()]
+
+        def heartbeat():
+            if time.time() - beaten_at[0] < interval:
+                return
+            beaten_at[0] = time.time()
+            with session.begin():
+                session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                    {'updated_at': datetime.datetime.utcnow()},
+                    synchronize_session=False)
+        return heartbeat
+
+    def _run_rebuild(self, rebuild_id, mode):
+        """Run or resume a cluster rebuild, recording how it ends."""
+        context = n_context.get_admin_context()
+        session = context.session
+        heartbeat = self._get_heartbeat(rebuild_id)
+        try:
+            if mode == 'incremental':
+                self._rebuild_incremental(context, heartbeat)
+            else:
+                self._rebuild_full(context, rebuild_id, heartbeat)
+        except Exception as ex:
+            LOG.exception(_("Cluster rebuild %s failed"), rebuild_id)
+            values = {'status': REBUILD_FAILED,
+                      'error': six.text_type(ex)[:255]}
+        else:
+            values = {'status': REBUILD_COMPLETED,
+                      'items_done': ClusterRebuild.items_total,
+                      'finished_at': datetime.datetime.utcnow()}
+        with session.begin(subtransactions=True):
+            session.query(ClusterRebuild).filter_by(id=rebuild_id).update(
+                values, synchronize_session=False)
+
+    def _make_cluster_dict(self, rebuild, fields=None):
+        eta = None
+        if rebuild.status == REBUILD_RUNNING and rebuild.rate:
+            eta = max(rebuild.items_total - rebuild.items_done,
+                      0) / rebuild.rate
+        res = {'id': rebuild.id,
+               'mode': rebuild.mode,
+               'status': rebuild.status,
+               'resource_type': DATA_TYPE_NAMES.get(rebuild.data_type_id),
+               'items_done': rebuild.items_done,
+               'items_total': rebuild.items_total,
+               'rows_per_sec': rebuild.rate,
+               'eta': eta,
+               'error': rebuild.error,
+               'started_at': (rebuild.started_at and
+                              rebuild.started_at.isoformat()),
+               'finished_at': (rebuild.finished_at and
+                               rebuild.finished_at.isoformat())}
+        if fields:
+            res = dict((key, value) for key, value in res.items()
+                       if key in fields)
+        return res
+
+    def create_cluster(self, context, cluster):
+        """Start a cluster rebuild in the background, or resume the last
+        one when it failed or its server stopped running it.
+        """
+        conf = cfg.CONF.MIDONET
+        session = context.session
+        stale_at = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=conf.cluster_rebuild_timeout)
+        with session.begin(subtransactions=True):
+            rebuild = session.query(ClusterRebuild).filter(
+                ClusterRebuild.status != REBUILD_COMPLETED).order_by(
+                    ClusterRebuild.started_at.desc()).with_lockmode(
+                        'update').first()
+            if (rebuild is not None and rebuild.status == REBUILD_RUNNING
+                    and rebuild.updated_at > stale_at):
+                raise ClusterRebuildInProgress(id=rebuild.id)
+            if rebuild is None or rebuild.mode != conf.cluster_rebuild_mode:
+                if rebuild is not None:
+                    self._clear_staging(session, rebuild.id)
+                    session.delete(rebuild)
+                rebuild = ClusterRebuild(mode=conf.cluster_rebuild_mode)
+                session.add(rebuild)
+            rebuild.status = REBUILD_RUNNING
+            rebuild.error = None
+            rebuild.updated_at = datetime.datetime.utcnow()
+
+        eventlet.spawn_n(self._run_rebuild, rebuild.id, rebuild.mode)
+        return self._make_cluster_dict(rebuild)
+
+    def get_cluster(self, context, id, fields=None):
+        rebuild = context.session.query(ClusterRebuild).get(id)
+        if rebuild is None:
+            raise ClusterRebuildNotFound(id=id)
+        return self._make_cluster_dict(rebuild, fields)
+
+    def get_clusters(self, context, filters=None, fields=None):
+        return [self._make_cluster_dict(rebuild, fields)
+                for rebuild in context.session.query(ClusterRebuild).order_by(
+                    ClusterRebuild.started_at)]
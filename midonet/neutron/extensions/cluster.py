@@ -28,9 +28,31 @@ CLUSTERS = '%ss' % CLUSTER
 
 RESOURCE_ATTRIBUTE_MAP = {
     CLUSTERS: {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
         'tenant_id': {'allow_post': True, 'allow_put': False,
                       'validate': {'type:string': None},
                       'is_visible': True, 'default': None},
+        'mode': {'allow_post': False, 'allow_put': False,
+                 'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'resource_type': {'allow_post': False, 'allow_put': False,
+                          'is_visible': True},
+        'items_done': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'items_total': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'rows_per_sec': {'allow_post': False, 'allow_put': False,
+                         'is_visible': True},
+        'eta': {'allow_post': False, 'allow_put': False,
+                'is_visible': True},
+        'error': {'allow_post': False, 'allow_put': False,
+                  'is_visible': True},
+        'started_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'finished_at': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
     }
 }
 
@@ -77,3 +99,11 @@ class ClusterPluginBase(object):
     @abc.abstractmethod
     def create_cluster(self, context, cluster):
         pass
+
+    @abc.abstractmethod
+    def get_cluster(self, context, id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_clusters(self, context, filters=None, fields=None):
+        pass
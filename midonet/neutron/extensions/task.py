@@ -0,0 +1,184 @@
+# Copyright (C) 2014 Midokura SARL
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+
+from neutron.api import extensions
+from neutron.api.v2 import attributes as attr
+from neutron.api.v2 import base
+from neutron.api.v2 import resource as wsgi_resource
+from neutron import manager
+
+import six
+
+TASK = 'task'
+TASKS = '%ss' % TASK
+TASK_CONSUMER = 'task_consumer'
+TASK_CONSUMERS = '%ss' % TASK_CONSUMER
+TASK_METRIC = 'task_metric'
+TASK_METRICS = '%ss' % TASK_METRIC
+
+RESOURCE_ATTRIBUTE_MAP = {
+    TASKS: {
+        'id': {'allow_post': False, 'allow_put': False,
+               'convert_to': attr.convert_to_int,
+               'is_visible': True, 'primary_key': True},
+        'type_id': {'allow_post': False, 'allow_put': False,
+                    'convert_to': attr.convert_to_int,
+                    'is_visible': True},
+        'data_type_id': {'allow_post': False, 'allow_put': False,
+                         'convert_to': attr.convert_to_int,
+                         'is_visible': True},
+        'resource_id': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'transaction_id': {'allow_post': False, 'allow_put': False,
+                           'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'envelope_id': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'depth': {'allow_post': False, 'allow_put': False,
+                  'is_visible': True},
+        'data': {'allow_post': False, 'allow_put': False,
+                 'is_visible': True},
+    },
+    TASK_CONSUMERS: {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True, 'primary_key': True},
+        'task_id': {'allow_post': False, 'allow_put': True,
+                    'convert_to': attr.convert_to_int,
+                    'validate': {'type:non_negative': None},
+                    'is_visible': True},
+        'backlog_rows': {'allow_post': False, 'allow_put': False,
+                         'is_visible': True},
+        'backlog_bytes': {'allow_post': False, 'allow_put': False,
+                          'is_visible': True},
+        'oldest_task_age': {'allow_post': False, 'allow_put': False,
+                            'is_visible': True},
+    },
+    TASK_METRICS: {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True, 'primary_key': True},
+        'tasks_per_sec': {'allow_post': False, 'allow_put': False,
+                          'is_visible': True},
+        'transactions': {'allow_post': False, 'allow_put': False,
+                         'is_visible': True},
+        'insert_latency_avg': {'allow_post': False, 'allow_put': False,
+                               'is_visible': True},
+        'insert_latency_max': {'allow_post': False, 'allow_put': False,
+                               'is_visible': True},
+    },
+}
+
+
+class TaskController(base.Controller):
+    """Controller passing the pagination and sorting of the tasks to the
+    plugin, which pages them with the task id, without the plugin declaring
+    native pagination and sorting for all its other resources.
+    """
+
+    def _is_native_pagination_supported(self):
+        return True
+
+    def _is_native_sorting_supported(self):
+        return True
+
+
+class Task(extensions.ExtensionDescriptor):
+    """Task extension."""
+
+    @classmethod
+    def get_name(cls):
+        return "Midonet Task Extension"
+
+    @classmethod
+    def get_alias(cls):
+        return "task"
+
+    @classmethod
+    def get_description(cls):
+        return ("Read-only feed of the tasks recorded for MidoNet, paginated "
+                "with the task id as the marker, with the backlog of the "
+                "task consumers and the task metrics")
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/task/api/v1.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2014-12-01T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        exts = []
+        plugin = manager.NeutronManager.get_plugin()
+        collection_name = TASKS
+        params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
+        controller = wsgi_resource.Resource(
+            TaskController(plugin, collection_name, TASK, params,
+                           allow_pagination=True, allow_sorting=True),
+            base.FAULT_MAP)
+        ex = extensions.ResourceExtension(collection_name, controller)
+        exts.append(ex)
+
+        for collection_name, resource_name in ((TASK_CONSUMERS,
+                                                TASK_CONSUMER),
+                                               (TASK_METRICS, TASK_METRIC)):
+            params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
+            controller = base.create_resource(
+                collection_name, resource_name, plugin, params)
+            ex = extensions.ResourceExtension(collection_name, controller)
+            exts.append(ex)
+        return exts
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return RESOURCE_ATTRIBUTE_MAP
+        else:
+            return {}
+
+
+@six.add_metaclass(abc.ABCMeta)
+class TaskPluginBase(object):
+
+    @abc.abstractmethod
+    def get_tasks(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
+        pass
+
+    @abc.abstractmethod
+    def get_task(self, context, id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_task_consumers(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_task_consumer(self, context, id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def update_task_consumer(self, context, id, task_consumer):
+        pass
+
+    @abc.abstractmethod
+    def get_task_metrics(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_task_metric(self, context, id, fields=None):
+        pass
@@ -0,0 +1,130 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+import threading
+import time
+
+from oslo.config import cfg
+import sqlalchemy as sa
+from webob import exc as w_exc
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.db import task
+
+from neutron import context as n_context
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Green thread local with eventlet.
+_local = threading.local()
+
+
+class TaskBacklogFull(w_exc.HTTPServiceUnavailable):
+    """The task replayer is too far behind to accept the write.
+
+    A webob exception rather than a NeutronException, so that the Neutron
+    API keeps its Retry-After header.
+    """
+
+    def __init__(self, backlog, retry_after):
+        super(TaskBacklogFull, self).__init__(
+            detail=_("MidoNet is %d tasks behind, retry later") % backlog,
+            headers={'Retry-After': str(retry_after)})
+
+
+class AdmissionController(object):
+    """Slows down, then rejects, writes while the task replayer is behind.
+
+    The backlog is the number of task ids after the checkpoint of the
+    task_consumer_name consumer, read at most every task_backlog_interval
+    seconds.  From task_backlog_soft_limit, writes are delayed by up to
+    task_backlog_max_delay seconds, growing with the backlog.  From
+    task_backlog_hard_limit, writes of non-admin users are rejected with a
+    503 error and a Retry-After header.  A limit of 0 is disabled.
+    """
+
+    def __init__(self):
+        conf = cfg.CONF.MIDONET
+        self.soft_limit = conf.task_backlog_soft_limit
+        self.hard_limit = conf.task_backlog_hard_limit
+        self.max_delay = conf.task_backlog_max_delay
+        self.retry_after = conf.task_backlog_retry_after
+        self.interval = conf.task_backlog_interval
+        self._backlog = 0
+        self._read_at = None
+
+    def _read_backlog(self, session):
+        last_id = session.query(sa.func.max(task.Task.id)).scalar() or 0
+        return max(last_id - task.get_checkpoint(
+            session, cfg.CONF.MIDONET.task_consumer_name), 0)
+
+    def get_backlog(self):
+        now = time.time()
+        if self._read_at is None or now - self._read_at >= self.interval:
+            # A session of its own, so as not to read in the transaction of
+            # the request.
+            self._backlog = self._read_backlog(
+                n_context.get_admin_context().session)
+            self._read_at = now
+        return self._backlog
+
+    def _get_delay(self, backlog):
+        if not self.soft_limit or backlog < self.soft_limit:
+            return 0
+        if not self.hard_limit or self.hard_limit <= self.soft_limit:
+            return self.max_delay
+        return self.max_delay * min(
+            float(backlog - self.soft_limit) /
+            (self.hard_limit - self.soft_limit), 1.0)
+
+    def admit(self, context):
+        """Delay or reject a write according to the task backlog."""
+        if not (self.soft_limit or self.hard_limit):
+            return
+        backlog = self.get_backlog()
+        if (self.hard_limit and backlog >= self.hard_limit and
+                not context.is_admin):
+            LOG.warn(_("Rejecting a write, MidoNet is %d tasks behind"),
+                     backlog)
+            raise TaskBacklogFull(backlog, self.retry_after)
+        delay = self._get_delay(backlog)
+        if delay:
+            time.sleep(delay)
+
+
+def admission_controlled(fn):
+    """Decorator for the plugin methods writing tasks, which are admitted
+    by the admission controller of the plugin, if any.
+
+    Only the outermost call is admitted.  The nested ones, such as the
+    create_port of add_router_interface, belong to a request admitted
+    already, and may run inside its transaction and locks, which must not
+    be held while delaying nor be failed halfway.
+    """
+    @functools.wraps(fn)
+    def wrapped(self, context, *args, **kwargs):
+        if (not self.admission or getattr(_local, 'admitted', False) or
+                context.session.transaction is not None):
+            return fn(self, context, *args, **kwargs)
+        self.admission.admit(context)
+        _local.admitted = True
+        try:
+            return fn(self, context, *args, **kwargs)
+        finally:
+            _local.admitted = False
+    return wrapped
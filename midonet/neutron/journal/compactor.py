@@ -0,0 +1,232 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import sys
+
+from oslo.config import cfg
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.db import task
+
+from neutron.common import config as common_config
+from neutron.db import api as db
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Number of ids in each DELETE statement.
+_DELETE_CHUNK = 500
+
+
+def _fold_run(run, created_ids, updates, deletes):
+    """Fold the tasks of a resource into their minimal equivalent."""
+    if len(run) < 2:
+        return
+
+    first, last = run[0], run[-1]
+    if first.type_id != task.CREATE:
+        # UPDATE* becomes the last UPDATE, UPDATE* DELETE the DELETE.
+        deletes.extend(t.id for t in run[:-1])
+    elif last.type_id == task.DELETE:
+        # The resource never needs to exist.
+        deletes.extend(t.id for t in run)
+    elif any(created_ids.get(parent_id, 0) > first.id for parent_id
+             in task.get_parent_ids(task.get_task_data(last))):
+        # The final data refers to a resource created after the CREATE, so
+        # it cannot move there. Keep the CREATE and the last UPDATE.
+        deletes.extend(t.id for t in run[1:-1])
+    else:
+        updates[first.id] = last
+        deletes.extend(t.id for t in run[1:])
+
+
+def fold_tasks(tasks):
+    """Plan the compaction of tasks given in id order.
+
+    The tasks of each resource are split into runs that can be folded
+    without changing what the other tasks see:
+
+    * a FLUSH task ends every run,
+    * a task referring to a resource ends the run of that resource,
+    * a DELETE ends the runs of the resources that referred to the deleted
+      resource, and those of runs whose earlier state is unknown because
+      they do not start with a CREATE.
+
+    Router interface tasks are never folded.  Each run then becomes its
+    minimal equivalent: CREATE UPDATE* becomes a CREATE with the final data,
+    CREATE ... DELETE becomes nothing and UPDATE* becomes the last UPDATE.
+
+    Returns a dict mapping the ids of the tasks whose data changes to the
+    tasks holding their new data, and the list of the ids of the tasks to
+    delete.
+    """
+    updates, deletes = {}, []
+    runs = {}
+    # Ids of the resources created by the tasks, mapped to the task ids
+    created_ids = {}
+    # Resource ids mapped to the ids of the resources whose open run
+    # refers to them
+    referrers = {}
+    # Ids of the resources whose open run does not start with a CREATE
+    unknown_ids = set()
+
+    def close(resource_id):
+        run = runs.pop(resource_id, None)
+        if run is not None:
+            unknown_ids.discard(resource_id)
+            _fold_run(run, created_ids, updates, deletes)
+
+    for t in tasks:
+        if t.type_id == task.FLUSH:
+            for resource_id in list(runs):
+                close(resource_id)
+            referrers.clear()
+            continue
+
+        parent_ids = task.get_parent_ids(task.get_task_data(t))
+        if t.data_type_id == task.ROUTERINTERFACE:
+            # The resource of a router interface task is its router.
+            parent_ids.add(t.resource_id)
+        else:
+            parent_ids.discard(t.resource_id)
+        for parent_id in parent_ids:
+            close(parent_id)
+
+        if t.data_type_id == task.ROUTERINTERFACE:
+            continue
+
+        if t.type_id == task.DELETE:
+            for resource_id in (referrers.pop(t.resource_id, set()) |
+                                unknown_ids) - set([t.resource_id]):
+                close(resource_id)
+        elif t.type_id == task.CREATE:
+            created_ids[t.resource_id] = t.id
+
+        if t.resource_id not in runs:
+            runs[t.resource_id] = []
+            if t.type_id != task.CREATE:
+                unknown_ids.add(t.resource_id)
+        runs[t.resource_id].append(t)
+        for parent_id in parent_ids:
+            referrers.setdefault(parent_id, set()).add(t.resource_id)
+
+        if t.type_id == task.DELETE:
+            close(t.resource_id)
+
+    for resource_id in list(runs):
+        close(resource_id)
+    return updates, sorted(deletes)
+
+
+class TaskCompactor(object):
+    """Folds the unconsumed tasks of midonet_tasks.
+
+    Only tasks above the watermark are compacted.  The watermark is the
+    configured task_compaction_watermark, or the id of the last task a
+    consumer may be applying if higher.  That is the read id a consumer
+    publishes with its checkpoint, or, for the consumers that do not, the
+    last task of the page of whole envelopes of task_replay_page_size tasks
+    after its checkpoint.  Each page of tasks is compacted in a transaction
+    that locks the checkpoints and the tasks it reads, so the consumers and
+    the writers wait for it.  The task count of the envelopes is lowered by
+    the number of their tasks removed.
+    """
+
+    def __init__(self, watermark=None, page_size=None):
+        conf = cfg.CONF.MIDONET
+        self.watermark = watermark or conf.task_compaction_watermark
+        self.page_size = page_size or conf.task_compaction_page_size
+
+    def _get_in_flight_id(self, session, checkpoint):
+        """Return the id of the last task a consumer may be applying."""
+        if checkpoint is not None and checkpoint.read_id is not None:
+            return max(checkpoint.task_id, checkpoint.read_id)
+
+        # The page the consumer reads ends with the envelope that holds its
+        # last task.
+        task_id = checkpoint.task_id if checkpoint is not None else 0
+        envelopes = task.get_envelopes(
+            session, after_id=task_id,
+            limit=cfg.CONF.MIDONET.task_replay_page_size)
+        return max([task_id] + [t.id for envelope in envelopes
+                                for t in envelope])
+
+    def _get_watermark(self, session):
+        checkpoints = session.query(task.TaskCheckpoint).populate_existing(
+        ).with_lockmode('update').all()
+        # Without checkpoints, a consumer may be starting from the first
+        # task.
+        return max([self.watermark] + [
+            self._get_in_flight_id(session, checkpoint)
+            for checkpoint in checkpoints or [None]])
+
+    def compact_page(self, session, after_id=0):
+        """Compact the next page of tasks after after_id.
+
+        Returns the id of the last task read, or None when there is nothing
+        to compact, and the number of tasks removed.
+        """
+        with session.begin(subtransactions=True):
+            watermark = self._get_watermark(session)
+            tasks = session.query(task.Task).filter(
+                task.Task.id > max(after_id, watermark)).order_by(
+                    task.Task.id).limit(self.page_size).with_lockmode(
+                        'update').all()
+            if not tasks:
+                return None, 0
+
+            updates, deletes = fold_tasks(tasks)
+            for t in tasks:
+                if t.id in updates:
+                    t.data = updates[t.id].data
+                    t.data_format = updates[t.id].data_format
+            for i in range(0, len(deletes), _DELETE_CHUNK):
+                session.query(task.Task).filter(task.Task.id.in_(
+                    deletes[i:i + _DELETE_CHUNK])).delete(
+                        synchronize_session=False)
+
+            deleted_ids = set(deletes)
+            removed = collections.Counter(
+                t.envelope_id for t in tasks
+                if t.id in deleted_ids and t.envelope_id)
+            for envelope_id, count in removed.items():
+                session.query(task.TaskEnvelope).filter_by(
+                    id=envelope_id).update(
+                        {'task_count': task.TaskEnvelope.task_count - count},
+                        synchronize_session=False)
+
+        return tasks[-1].id, len(deletes)
+
+    def compact(self, session):
+        """Compact all the tasks above the watermark and return the number
+        of tasks removed.
+        """
+        removed = 0
+        last_id = 0
+        while True:
+            last_id, count = self.compact_page(session, after_id=last_id)
+            if last_id is None:
+                return removed
+            removed += count
+
+
+def main():
+    common_config.init(sys.argv[1:])
+    common_config.setup_logging()
+
+    removed = TaskCompactor().compact(db.get_session())
+    LOG.info(_("Removed %d tasks"), removed)
@@ -0,0 +1,195 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+
+import eventlet
+from eventlet import queue
+from oslo.config import cfg
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.db import task
+
+from neutron.common import rpc as n_rpc
+from neutron import context as n_context
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Session info key of the id of the last task when the transaction commits
+_LAST_TASK_ID = 'midonet_last_task_id'
+
+_notifier = None
+
+
+class TaskNotifyAPI(n_rpc.RpcProxy):
+    """Client side of the task notification RPC API."""
+
+    BASE_RPC_API_VERSION = '1.0'
+
+    def __init__(self, topic):
+        super(TaskNotifyAPI, self).__init__(
+            topic=topic, default_version=self.BASE_RPC_API_VERSION)
+
+    def tasks_written(self, context, task_id):
+        self.fanout_cast(context,
+                         self.make_msg('tasks_written', task_id=task_id),
+                         topic=self.topic)
+
+
+class TaskNotifier(object):
+    """Tells the task consumers about new tasks.
+
+    The id of the last task is sent with a fanout cast on the
+    task_notify_topic RPC topic and as a datagram to the task_notify_socket
+    unix socket, for a consumer on the same host.  The casts are sent from
+    a green thread, one at a time, so a slow message bus neither delays the
+    requests nor piles up casts: only the last id is sent.
+    """
+
+    def __init__(self):
+        conf = cfg.CONF.MIDONET
+        self.rpc = TaskNotifyAPI(conf.task_notify_topic)
+        self.socket_path = conf.task_notify_socket
+        self._socket = None
+        self._pending_id = None
+        self._sending = False
+
+    def _send_datagram(self, task_id):
+        if not self.socket_path:
+            return
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+        try:
+            self._socket.sendto(str(task_id).encode('ascii'),
+                                self.socket_path)
+        except socket.error:
+            # Nobody listens, or the listener is busy and will poll.
+            pass
+
+    def _send_casts(self):
+        try:
+            while self._pending_id is not None:
+                task_id, self._pending_id = self._pending_id, None
+                try:
+                    self.rpc.tasks_written(
+                        n_context.get_admin_context_without_session(),
+                        task_id)
+                except Exception:
+                    LOG.exception(_("Failed to notify task %d"), task_id)
+        finally:
+            self._sending = False
+
+    def notify(self, task_id):
+        self._send_datagram(task_id)
+        self._pending_id = max(self._pending_id or 0, task_id)
+        if not self._sending:
+            self._sending = True
+            eventlet.spawn_n(self._send_casts)
+
+
+def _before_commit(session):
+    if session.info.pop(task.TASKS_WRITTEN, False):
+        session.flush()
+        session.info[_LAST_TASK_ID] = session.query(
+            sa.func.max(task.Task.id)).scalar()
+
+
+def _after_commit(session):
+    task_id = session.info.pop(_LAST_TASK_ID, None)
+    if task_id and _notifier:
+        _notifier.notify(task_id)
+
+
+def _after_rollback(session):
+    session.info.pop(task.TASKS_WRITTEN, None)
+    session.info.pop(_LAST_TASK_ID, None)
+
+
+def setup():
+    """Notify the task consumers after each commit that wrote tasks."""
+    global _notifier
+    if _notifier is None:
+        sa.event.listen(orm.Session, 'before_commit', _before_commit)
+        sa.event.listen(orm.Session, 'after_commit', _after_commit)
+        sa.event.listen(orm.Session, 'after_rollback', _after_rollback)
+        _notifier = TaskNotifier()
+    return _notifier
+
+
+class TaskNotifyCallback(n_rpc.RpcCallback):
+    """Server side of the task notification RPC API."""
+
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self, listener):
+        super(TaskNotifyCallback, self).__init__()
+        self.listener = listener
+
+    def tasks_written(self, context, task_id):
+        self.listener.wake(task_id)
+
+
+class TaskListener(object):
+    """Lets a task consumer wait for new tasks instead of polling.
+
+    The consumer must run with eventlet monkey patching, so that the unix
+    socket is read from a green thread.
+    """
+
+    def __init__(self):
+        self._queue = queue.LightQueue()
+
+    def wake(self, task_id):
+        self._queue.put(task_id)
+
+    def _listen_socket(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        while True:
+            data = sock.recv(64)
+            try:
+                self.wake(int(data))
+            except ValueError:
+                LOG.warn(_("Ignored task notification %r"), data)
+
+    def start(self):
+        conf = cfg.CONF.MIDONET
+        self.conn = n_rpc.create_connection(new=True)
+        self.conn.create_consumer(conf.task_notify_topic,
+                                  [TaskNotifyCallback(self)], fanout=True)
+        self.conn.consume_in_threads()
+        if conf.task_notify_socket:
+            eventlet.spawn_n(self._listen_socket, conf.task_notify_socket)
+
+    def wait(self, timeout):
+        """Wait until new tasks are notified or the timeout expires.
+
+        Returns the highest task id notified, or None on timeout.
+        """
+        try:
+            task_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while not self._queue.empty():
+            task_id = max(task_id, self._queue.get_nowait())
+        return task_id
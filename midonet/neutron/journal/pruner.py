@@ -0,0 +1,140 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gzip
+import json
+import sys
+import time
+
+import sqlalchemy as sa
+from oslo.config import cfg
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.db import task
+
+from neutron.common import config as common_config
+from neutron.db import api as db
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _archive_record(t):
+    return json.dumps({'id': t.id,
+                       'type_id': t.type_id,
+                       'data_type_id': t.data_type_id,
+                       'resource_id': t.resource_id,
+                       'transaction_id': t.transaction_id,
+                       'created_at': t.created_at and t.created_at.isoformat(),
+                       'data': task.get_task_data(t)})
+
+
+class TaskPruner(object):
+    """Deletes the tasks every consumer has applied.
+
+    The watermark is the configured task_prune_watermark or, when it is not
+    set, the lowest checkpoint of the task consumers, kept below the gaps
+    they are still looking for tasks in.  The tasks up to the
+    watermark are deleted in batches of task_prune_batch_size consecutive
+    ids, each in its own transaction, with a pause of task_prune_interval
+    seconds between batches so that the writers are not locked out for
+    long.  When task_prune_archive is set, the tasks of each batch are
+    appended to that gzip compressed file as JSON lines before they are
+    deleted.  The envelopes left without tasks are deleted with them.
+    """
+
+    def __init__(self, watermark=None, batch_size=None, interval=None,
+                 archive=None):
+        conf = cfg.CONF.MIDONET
+        self.watermark = watermark or conf.task_prune_watermark
+        self.batch_size = batch_size or conf.task_prune_batch_size
+        self.interval = (conf.task_prune_interval if interval is None
+                         else interval)
+        self.archive = archive or conf.task_prune_archive
+
+    def _get_watermark(self, session):
+        if self.watermark:
+            return self.watermark
+        watermark = session.query(
+            sa.func.min(task.TaskCheckpoint.task_id)).scalar() or 0
+        first_gap_id = session.query(
+            sa.func.min(task.TaskGap.first_id)).scalar()
+        if first_gap_id is not None:
+            watermark = min(watermark, first_gap_id - 1)
+        return watermark
+
+    def _prune_batch(self, session, watermark, archive_file):
+        """Delete the next batch of tasks up to the watermark and return the
+        number of tasks deleted.
+        """
+        with session.begin(subtransactions=True):
+            first_id = session.query(sa.func.min(task.Task.id)).scalar()
+            if first_id is None or first_id > watermark:
+                return 0
+            last_id = min(first_id + self.batch_size - 1, watermark)
+
+            if archive_file:
+                for t in session.query(task.Task).filter(
+                        task.Task.id.between(first_id, last_id)).order_by(
+                            task.Task.id):
+                    archive_file.write(_archive_record(t).encode('utf-8'))
+                    archive_file.write(b'\n')
+                # The tasks must be archived before they are deleted.
+                archive_file.flush()
+
+            envelope_ids = [row.envelope_id for row in session.query(
+                task.Task.envelope_id).filter(
+                    task.Task.id.between(first_id, last_id),
+                    task.Task.envelope_id.isnot(None)).distinct()]
+
+            count = session.execute(task.Task.__table__.delete().where(
+                task.Task.id.between(first_id, last_id))).rowcount
+
+            if envelope_ids:
+                remaining_ids = session.query(task.Task.envelope_id).filter(
+                    task.Task.envelope_id.in_(envelope_ids))
+                session.query(task.TaskEnvelope).filter(
+                    task.TaskEnvelope.id.in_(envelope_ids),
+                    ~task.TaskEnvelope.id.in_(remaining_ids)).delete(
+                        synchronize_session=False)
+            return count
+
+    def prune(self, session):
+        """Delete the tasks up to the watermark and return their number."""
+        watermark = self._get_watermark(session)
+        archive_file = gzip.open(self.archive, 'ab') if self.archive else None
+        pruned = 0
+        try:
+            while True:
+                count = self._prune_batch(session, watermark, archive_file)
+                if not count:
+                    break
+                pruned += count
+                LOG.debug("Pruned %(count)d tasks up to %(watermark)d",
+                          {'count': pruned, 'watermark': watermark})
+                time.sleep(self.interval)
+        finally:
+            if archive_file:
+                archive_file.close()
+        return pruned
+
+
+def main():
+    common_config.init(sys.argv[1:])
+    common_config.setup_logging()
+
+    pruned = TaskPruner().prune(db.get_session())
+    LOG.info(_("Pruned %d tasks"), pruned)
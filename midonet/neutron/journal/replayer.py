@@ -0,0 +1,294 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import sys
+import time
+
+import eventlet
+from oslo.config import cfg
+from webob import exc as w_exc
+
+from midonetclient import client
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.common import transport
+from midonet.neutron.common import util
+from midonet.neutron.db import task
+from midonet.neutron.journal import notifier
+from midonet.neutron.journal import scheduler
+
+from neutron.common import config as common_config
+from neutron.db import api as db
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# MidoNet client methods applying a task, by task type and data type.
+_METHODS = {
+    task.CREATE: {
+        task.NETWORK: 'create_network',
+        task.SUBNET: 'create_subnet',
+        task.ROUTER: 'create_router',
+        task.PORT: 'create_port',
+        task.FLOATINGIP: 'create_floating_ip',
+        task.SECURITYGROUP: 'create_security_group',
+        task.SECURITYGROUPRULE: 'create_security_group_rule',
+        task.ROUTERINTERFACE: 'add_router_interface',
+    },
+    task.UPDATE: {
+        task.NETWORK: 'update_network',
+        task.SUBNET: 'update_subnet',
+        task.ROUTER: 'update_router',
+        task.PORT: 'update_port',
+        task.FLOATINGIP: 'update_floating_ip',
+    },
+    task.DELETE: {
+        task.NETWORK: 'delete_network',
+        task.SUBNET: 'delete_subnet',
+        task.ROUTER: 'delete_router',
+        task.PORT: 'delete_port',
+        task.FLOATINGIP: 'delete_floating_ip',
+        task.SECURITYGROUP: 'delete_security_group',
+        task.SECURITYGROUPRULE: 'delete_security_group_rule',
+        task.ROUTERINTERFACE: 'remove_router_interface',
+    },
+}
+
+# MidoNet client methods applying a run of tasks of the same kind in a
+# single call, by task type and data type.
+_BULK_METHODS = {
+    (task.CREATE, task.SECURITYGROUPRULE): 'create_security_group_rule_bulk',
+}
+
+
+def _group_key(t):
+    return t.type_id, t.data_type_id
+
+
+class TaskReplayer(object):
+    """Applies the tasks recorded in midonet_tasks to MidoNet.
+
+    Tasks are read in id order a page of whole envelopes at a time, and
+    applied envelope after envelope.  Runs of consecutive tasks of the same
+    kind are applied with a single MidoNet API call when the client has a
+    bulk method for them.  The id of the last task up to which every task
+    is applied is stored as the checkpoint of the consumer after each page,
+    and when a task fails, so a restarted replayer resumes where it stopped,
+    starting again the envelope that failed.  A task may be applied twice if
+    the replayer dies in the middle of a page.
+
+    Task ids are taken when the tasks are written, so a transaction may
+    commit a task below the checkpoint.  The ranges of ids the checkpoint
+    moves past without their tasks are recorded as gaps, and the tasks
+    committed in them are applied before the next page, until
+    task_replay_gap_timeout seconds after the gaps were found.
+
+    The replayer of the task_consumer_name consumer also records the
+    fingerprints of the resources it applies, with its checkpoint, for the
+    incremental cluster rebuilds.
+
+    With more than one worker, the tasks of a page are applied by a
+    TaskScheduler instead, which runs independent tasks concurrently
+    regardless of their envelopes.
+
+    When caught up, the replayer waits for a notification from the given
+    TaskListener, polling every task_replay_interval seconds in case one is
+    lost.
+    """
+
+    def __init__(self, api_cli, consumer=None, page_size=None, workers=None,
+                 listener=None):
+        conf = cfg.CONF.MIDONET
+        self.api_cli = api_cli
+        self.listener = listener
+        self.consumer = consumer or conf.task_consumer_name
+        self.page_size = page_size or conf.task_replay_page_size
+        workers = workers or conf.task_replay_workers
+        self.scheduler = (scheduler.TaskScheduler(self.apply_task, workers)
+                          if workers > 1 else None)
+        self._applied_id = 0
+
+    def apply_task(self, t):
+        """Apply a single task to MidoNet.
+
+        Tasks may be applied again, after a failure or a cluster rebuild,
+        so a CREATE of a resource MidoNet already has updates it instead,
+        or is taken as applied when the resource has no update, and a
+        DELETE of a resource MidoNet does not have is taken as applied.
+        """
+        if t.type_id == task.FLUSH:
+            LOG.info(_("Task %d marks a cluster rebuild"), t.id)
+            return
+
+        try:
+            self._call(t.type_id, t)
+        except w_exc.HTTPConflict:
+            if t.type_id != task.CREATE:
+                raise
+            LOG.info(_("Task %(id)d creates %(resource)s, which exists "
+                       "already"), {'id': t.id, 'resource': t.resource_id})
+            if (t.data_type_id != task.ROUTERINTERFACE and
+                    t.data_type_id in _METHODS[task.UPDATE]):
+                self._call(task.UPDATE, t)
+        except w_exc.HTTPNotFound:
+            if t.type_id != task.DELETE:
+                raise
+            LOG.info(_("Task %(id)d deletes %(resource)s, which is gone "
+                       "already"), {'id': t.id, 'resource': t.resource_id})
+
+    def _call(self, type_id, t):
+        try:
+            method_name = _METHODS[type_id][t.data_type_id]
+        except KeyError:
+            raise util.MidonetPluginException(
+                msg=_("Unsupported task %(id)d: type=%(type)s, "
+                      "data_type=%(data_type)s") % {
+                          'id': t.id, 'type': t.type_id,
+                          'data_type': t.data_type_id})
+
+        method = getattr(self.api_cli, method_name)
+        if t.data_type_id == task.ROUTERINTERFACE:
+            method(t.resource_id, task.get_task_data(t))
+        elif type_id == task.CREATE:
+            method(task.get_task_data(t))
+        elif type_id == task.UPDATE:
+            method(t.resource_id, task.get_task_data(t))
+        else:
+            method(t.resource_id)
+
+    def _apply_group(self, key, tasks):
+        bulk_method = _BULK_METHODS.get(key)
+        if bulk_method and len(tasks) > 1:
+            try:
+                getattr(self.api_cli, bulk_method)(
+                    [task.get_task_data(t) for t in tasks])
+                return
+            except w_exc.HTTPConflict:
+                # Some exist already: apply them one at a time, which
+                # copes with that.
+                LOG.info(_("Tasks %(first)d to %(last)d create resources "
+                           "that exist already"),
+                         {'first': tasks[0].id, 'last': tasks[-1].id})
+
+        for t in tasks:
+            self.apply_task(t)
+
+    def _apply_envelopes(self, envelopes, tasks):
+        applied_ids = set()
+        try:
+            for key, group in itertools.groupby(
+                    itertools.chain(*envelopes), _group_key):
+                group = list(group)
+                self._apply_group(key, group)
+                applied_ids.update(t.id for t in group)
+        finally:
+            # Only whole envelopes count as applied.
+            for envelope in envelopes:
+                if not all(t.id in applied_ids for t in envelope):
+                    applied_ids.difference_update(t.id for t in envelope)
+            for t in tasks:
+                if t.id not in applied_ids:
+                    break
+                self._applied_id = t.id
+
+    def _schedule(self, tasks):
+        applied_id = self.scheduler.run(tasks)
+        if applied_id is not None:
+            self._applied_id = applied_id
+        if applied_id != tasks[-1].id:
+            raise util.MidonetPluginException(
+                msg=_("Failed to apply task %d") % (self._applied_id + 1))
+
+    def _replay_gaps(self, session):
+        """Apply the tasks committed in the gaps since they were found."""
+        tasks = task.get_gap_tasks(session, self.consumer,
+                                   cfg.CONF.MIDONET.task_replay_gap_timeout)
+        applied = []
+        try:
+            for t in tasks:
+                LOG.info(_("Task %d committed after the tasks following it"),
+                         t.id)
+                self.apply_task(t)
+                applied.append(t)
+        finally:
+            if applied:
+                with session.begin(subtransactions=True):
+                    if self.consumer == cfg.CONF.MIDONET.task_consumer_name:
+                        task.update_fingerprints(session, applied)
+                    task.fill_gaps(session, self.consumer,
+                                   [t.id for t in applied])
+
+    def replay(self, session):
+        """Apply the tasks committed in the gaps, then the next page of
+        tasks, and return the number of tasks of the page.
+        """
+        self._replay_gaps(session)
+        checkpoint, envelopes = task.read_envelopes(session, self.consumer,
+                                                    limit=self.page_size)
+        tasks = sorted(itertools.chain(*envelopes), key=lambda t: t.id)
+        self._applied_id = checkpoint
+        try:
+            if self.scheduler and tasks:
+                self._schedule(tasks)
+            else:
+                self._apply_envelopes(envelopes, tasks)
+        finally:
+            if self._applied_id != checkpoint:
+                with session.begin(subtransactions=True):
+                    if self.consumer == cfg.CONF.MIDONET.task_consumer_name:
+                        task.update_fingerprints(
+                            session, [t for t in tasks
+                                      if t.id <= self._applied_id])
+                    task.add_gaps(session, self.consumer, task.find_gaps(
+                        checkpoint, [t.id for t in tasks], self._applied_id))
+                    task.set_checkpoint(session, self.consumer,
+                                        self._applied_id)
+
+        return len(tasks)
+
+    def run(self):
+        interval = cfg.CONF.MIDONET.task_replay_interval
+        while True:
+            try:
+                count = self.replay(db.get_session())
+            except Exception:
+                LOG.exception(_("Failed to replay tasks for %s"),
+                              self.consumer)
+                count = 0
+
+            # Only wait when caught up, so a backlog is drained at full speed
+            if count >= self.page_size:
+                continue
+            if self.listener:
+                self.listener.wait(interval)
+            else:
+                time.sleep(interval)
+
+
+def main():
+    eventlet.monkey_patch()
+    common_config.init(sys.argv[1:])
+    common_config.setup_logging()
+
+    conf = cfg.CONF.MIDONET
+    transport.install()
+    api_cli = client.MidonetClient(conf.midonet_uri[0], conf.username,
+                                   conf.password, project_id=conf.project_id)
+    listener = None
+    if conf.task_notification:
+        listener = notifier.TaskListener()
+        listener.start()
+    TaskReplayer(api_cli, listener=listener).run()
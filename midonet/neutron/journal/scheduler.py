@@ -0,0 +1,177 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+from eventlet import queue
+
+from midonet.neutron.db import task
+
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class _Node(object):
+    """A task and the tasks depending on it."""
+
+    def __init__(self, t):
+        self.task = t
+        self.dependents = []
+        # The number of tasks it depends on that are not done yet, and
+        # whether all those done were applied.
+        self.waiting = 0
+        self.ready = True
+        self.applied = None
+
+
+class TaskScheduler(object):
+    """Applies independent tasks concurrently, on up to workers green
+    threads.
+
+    A task depends on the last earlier task writing its resource, and on the
+    last earlier tasks writing the resources its data refers to, its
+    parents.  The deletion of a resource also depends on every earlier task
+    referring to it, such as the creations of its ports for a network.  So
+    the tasks of a resource are applied in id order, after those of its
+    parents, while the children of a parent, for example the ports of a
+    network or of a security group, are applied concurrently.  The resources
+    a deleted resource referred to are remembered from its earlier tasks.
+    A FLUSH task, or the deletion of a resource the scheduler knows nothing
+    about, is a barrier that waits for every earlier task.
+
+    A task is only started once the tasks it depends on are applied, so
+    that waiting tasks do not take up workers.
+    """
+
+    def __init__(self, apply_task, workers):
+        self.apply_task = apply_task
+        self.workers = workers
+        # Resource ids referred to by the resources seen so far.
+        self._parent_ids = {}
+        # Ids of the tasks applied after a failed task.
+        self._applied_ids = set()
+
+    def _get_parent_ids(self, t):
+        """Return the ids of the resources the task refers to, or None for a
+        barrier.
+        """
+        if t.type_id == task.FLUSH:
+            self._parent_ids.clear()
+            return None
+
+        if t.type_id == task.DELETE and t.data_type_id != task.ROUTERINTERFACE:
+            return self._parent_ids.pop(t.resource_id, None)
+
+        parent_ids = task.get_parent_ids(task.get_task_data(t))
+        parent_ids.discard(t.resource_id)
+        if t.data_type_id != task.ROUTERINTERFACE:
+            self._parent_ids[t.resource_id] = parent_ids
+        return parent_ids
+
+    def _build(self, tasks):
+        """Return the nodes of the tasks, linked to the tasks they depend
+        on.
+        """
+        nodes = []
+        barrier = None
+        # The node of the last task writing each resource, and the nodes of
+        # the tasks referring to it since, for its deletion.
+        writes = {}
+        readers = collections.defaultdict(list)
+        since_barrier = []
+        for t in tasks:
+            node = _Node(t)
+            parent_ids = self._get_parent_ids(t)
+            if parent_ids is None:
+                deps = since_barrier
+                barrier = node
+                writes.clear()
+                readers.clear()
+                since_barrier = []
+            else:
+                deps = set(writes[key] for key in parent_ids | set(
+                    [t.resource_id]) if key in writes)
+                if t.type_id == task.DELETE:
+                    deps.update(readers.pop(t.resource_id, []))
+                if not deps and barrier is not None:
+                    deps.add(barrier)
+                writes[t.resource_id] = node
+                for parent_id in parent_ids:
+                    readers[parent_id].append(node)
+            since_barrier.append(node)
+
+            for dep in deps:
+                dep.dependents.append(node)
+            node.waiting = len(deps)
+            nodes.append(node)
+        return nodes
+
+    def _run_task(self, node, results):
+        try:
+            self.apply_task(node.task)
+        except Exception:
+            LOG.exception(_("Failed to apply task %d"), node.task.id)
+            results.put((node, False))
+        else:
+            results.put((node, True))
+
+    def run(self, tasks):
+        """Apply the tasks and return the id of the last task of the applied
+        prefix, or None if the first task was not applied.
+
+        Tasks after a failed task that were applied anyway are remembered
+        and skipped when they are passed in again.
+        """
+        nodes = self._build(tasks)
+        ready = collections.deque(node for node in nodes if not node.waiting)
+        results = queue.LightQueue()
+        running = 0
+
+        def done(node, applied):
+            node.applied = applied
+            for dependent in node.dependents:
+                dependent.ready = dependent.ready and applied
+                dependent.waiting -= 1
+                if not dependent.waiting:
+                    ready.append(dependent)
+
+        while ready or running:
+            if ready and running < self.workers:
+                node = ready.popleft()
+                if node.task.id in self._applied_ids:
+                    done(node, True)
+                elif not node.ready:
+                    # A task it depends on failed.
+                    done(node, False)
+                else:
+                    eventlet.spawn_n(self._run_task, node, results)
+                    running += 1
+                continue
+            node, applied = results.get()
+            running -= 1
+            done(node, applied)
+
+        applied_id = None
+        for node in nodes:
+            if not node.applied:
+                break
+            applied_id = node.task.id
+        self._applied_ids = set(node.task.id for node in nodes
+                                if node.task.id > (applied_id or 0) and
+                                node.applied)
+        return applied_id
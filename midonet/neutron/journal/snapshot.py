@@ -0,0 +1,91 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+
+from oslo.config import cfg
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.db import task
+
+from neutron.common import config as common_config
+from neutron import context
+from neutron.db import db_base_plugin_v2
+from neutron.db import external_net_db
+from neutron.db import l3_gwmode_db
+from neutron.db import portbindings_db
+from neutron.db import securitygroups_db
+from neutron.extensions import portbindings
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class SnapshotPlugin(db_base_plugin_v2.NeutronDbPluginV2,
+                     external_net_db.External_net_db_mixin,
+                     l3_gwmode_db.L3_NAT_db_mixin,
+                     securitygroups_db.SecurityGroupDbMixin,
+                     portbindings_db.PortBindingMixin,
+                     task.MidoClusterMixin):
+    """The parts of the MidoNet plugin that read the resources of a
+    snapshot, without its MidoNet API client and RPC.
+    """
+
+    def __init__(self):
+        super(SnapshotPlugin, self).__init__()
+        # The port bindings the plugin reports, with security groups.
+        self.base_binding_dict = {
+            portbindings.VIF_TYPE: portbindings.VIF_TYPE_MIDONET,
+            portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL,
+            portbindings.VIF_DETAILS: {portbindings.CAP_PORT_FILTER: True}}
+
+
+def export_snapshot(path):
+    with open(path, 'wb') as fileobj:
+        header = SnapshotPlugin().export_snapshot(
+            context.get_admin_context(), fileobj)
+    LOG.info(_("Exported %(counts)s as of task %(task_id)d to %(path)s"),
+             {'counts': header['counts'], 'task_id': header['task_id'],
+              'path': path})
+
+
+def import_snapshot(path):
+    with open(path, 'rb') as fileobj:
+        header = task.import_snapshot(context.get_admin_context(), fileobj)
+    LOG.info(_("Imported %(counts)s from %(path)s"),
+             {'counts': header['counts'], 'path': path})
+
+
+def add_command_parsers(subparsers):
+    for name, func in (('export', export_snapshot),
+                       ('import', import_snapshot)):
+        parser = subparsers.add_parser(name)
+        parser.add_argument('path')
+        parser.set_defaults(func=func)
+
+
+command_opt = cfg.SubCommandOpt('command',
+                                title='Command',
+                                help=_('Available commands'),
+                                handler=add_command_parsers)
+
+
+def main():
+    cfg.CONF.register_cli_opt(command_opt)
+    common_config.init(sys.argv[1:])
+    common_config.setup_logging()
+
+    cfg.CONF.command.func(cfg.CONF.command.path)
@@ -23,15 +23,20 @@
 # @author: Rossella Sblendido, Midokura Japan KK
 # @author: Duarte Nunes, Midokura Japan KK
 
+import contextlib
 
 from oslo.config import cfg
 
 from midonetclient import client
 from midonet.neutron import api
 from midonet.neutron.common import config  # noqa
+from midonet.neutron.common import postcommit
+from midonet.neutron.common import transport
 from midonet.neutron.common import util
 from midonet.neutron.db import task
 from midonet.neutron import extensions
+from midonet.neutron.journal import admission
+from midonet.neutron.journal import notifier
 from sqlalchemy import exc as sa_exc
 
 from neutron.api import extensions as neutron_extensions
@@ -40,28 +45,37 @@ from neutron.common import constants as n_const
 from neutron.common import exceptions as n_exc
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
-from neutron.common import utils
 from neutron.db import agents_db
 from neutron.db import agentschedulers_db
 from neutron.db import api as db
 from neutron.db import db_base_plugin_v2
 from neutron.db import external_net_db
+from neutron.db import l3_db
 from neutron.db import l3_gwmode_db
 from neutron.db.loadbalancer import loadbalancer_db
+from neutron.db import models_v2
 from neutron.db import portbindings_db
 from neutron.db import routedserviceinsertion_db as rsi_db
 from neutron.db import securitygroups_db
 from neutron.extensions import portbindings
 from neutron.extensions import routedserviceinsertion as rsi
 from neutron.extensions import securitygroup as ext_sg
-from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
 from neutron.plugins.common import constants
 
 
 LOG = logging.getLogger(__name__)
 
+_ROUTER_DEVICE_OWNERS = (n_const.DEVICE_OWNER_ROUTER_INTF,
+                         n_const.DEVICE_OWNER_ROUTER_GW)
+
+# Task data types of the resources created natively in bulk.
+_BULK_DATA_TYPES = {'network': task.NETWORK,
+                    'subnet': task.SUBNET,
+                    'port': task.PORT}
+
 
 class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                       portbindings_db.PortBindingMixin,
@@ -72,7 +86,8 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                       rsi_db.RoutedServiceInsertionDbMixin,
                       loadbalancer_db.LoadBalancerPluginDb,
                       api.MidoNetApiMixin,
-                      task.MidoClusterMixin):
+                      task.MidoClusterMixin,
+                      task.MidoTaskMixin):
 
     supported_extension_aliases = ['agent',
                                    'binding',
@@ -97,6 +112,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                    'routing-table',
                                    'vtep',
                                    'lbaas',
+                                   'task',
                                    'tunnelzone']
     __native_bulk_support = True
 
@@ -106,9 +122,27 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         # Instantiate MidoNet API client
         conf = cfg.CONF.MIDONET
         neutron_extensions.append_api_extensions_path(extensions.__path__)
-        self.api_cli = client.MidonetClient(conf.midonet_uri, conf.username,
+        transport.install()
+        self.api_cli = client.MidonetClient(conf.midonet_uri[0], conf.username,
                                             conf.password,
                                             project_id=conf.project_id)
+        self.use_journal = conf.use_task_journal
+        if self.use_journal and conf.task_notification:
+            notifier.setup()
+        self.admission = (admission.AdmissionController()
+                          if self.use_journal else None)
+        if self.use_journal and conf.task_metrics_interval > 0:
+            self.task_metrics_logger = loopingcall.FixedIntervalLoopingCall(
+                self._log_task_metrics)
+            self.task_metrics_logger.start(
+                conf.task_metrics_interval,
+                initial_delay=conf.task_metrics_interval)
+        if not self.use_journal and conf.deletion_retry_interval > 0:
+            self.deletion_retrier = loopingcall.FixedIntervalLoopingCall(
+                self._retry_deletions)
+            self.deletion_retrier.start(
+                conf.deletion_retry_interval,
+                initial_delay=conf.deletion_retry_interval)
 
         self.setup_rpc()
         self.repair_quotas_table()
@@ -135,6 +169,12 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         # Consume from all consumers in a thread
         self.conn.consume_in_threads()
 
+    def _retry_deletions(self):
+        try:
+            postcommit.retry_deletions(db.get_session(), self.api_cli)
+        except Exception:
+            LOG.exception(_("Failed to retry the MidoNet deletions"))
+
     def repair_quotas_table(self):
         query = ("CREATE TABLE `quotas` ( `id` varchar(36) NOT NULL, "
                  "`tenant_id` varchar(255) DEFAULT NULL, "
@@ -148,7 +188,72 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             # If the table already exists, then this is expected.
             pass
 
-    def _process_create_network(self, context, network):
+    def _set_error_status(self, context, model, id):
+        """Compensate for an update MidoNet failed to apply."""
+        with context.session.begin(subtransactions=True):
+            context.session.query(model).filter_by(id=id).update(
+                {'status': constants.ERROR}, synchronize_session=False)
+
+    def _create_in_midonet(self, resource, objects):
+        """Create resources in MidoNet with a call per resource.
+
+        The MidoNet client has no bulk method for networks, subnets and
+        ports, so they are created one at a time, unless the client has a
+        create_<resource>_bulk method.
+        """
+        create_bulk = getattr(self.api_cli, 'create_%s_bulk' % resource, None)
+        if create_bulk:
+            create_bulk(objects)
+        else:
+            create = getattr(self.api_cli, 'create_%s' % resource)
+            for obj in objects:
+                create(obj)
+
+    def _delete_created(self, context, delete, objects):
+        """Compensate for resources MidoNet failed to create."""
+        with context.session.begin(subtransactions=True):
+            for obj in reversed(objects):
+                delete(context, obj['id'])
+
+    def _create_bulk_native(self, context, resource, request_items):
+        """Create the resources of a bulk request in a single transaction,
+        recording their tasks with a single insert, or then in MidoNet.
+
+        When MidoNet fails to create them, they are all deleted.
+        """
+        create_db = getattr(self, '_create_%s_db' % resource)
+        delete = getattr(super(MidonetPluginV2, self), 'delete_%s' % resource)
+        with context.session.begin(subtransactions=True):
+            objects = [create_db(context, item, record_task=False)
+                       for item in request_items['%ss' % resource]]
+            if self.use_journal:
+                data_type_id = _BULK_DATA_TYPES[resource]
+                task.create_tasks(context, [
+                    (task.CREATE, data_type_id, obj['id'], obj)
+                    for obj in objects])
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_%s_bulk' % resource,
+                [obj['id'] for obj in objects],
+                lambda: self._create_in_midonet(resource, objects),
+                lambda: self._delete_created(context, delete, objects))
+        postcommit.run_hooks(context)
+        return objects
+
+    @util.handle_api_error
+    def _create_bulk(self, resource, context, request_items):
+        """Create the resources of a bulk request without a native
+        implementation, such as security groups, one at a time, and then
+        their MidoNet counterparts: the single creations only queue their
+        MidoNet API calls while the bulk transaction is open.
+        """
+        objects = super(MidonetPluginV2, self)._create_bulk(
+            resource, context, request_items)
+        postcommit.run_hooks(context)
+        return objects
+
+    def _create_network_db(self, context, network, record_task=True):
 
         net_data = network['network']
         tenant_id = self._get_tenant_id_for_create(context, net_data)
@@ -158,9 +263,14 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             net = super(MidonetPluginV2, self).create_network(context, network)
             self._process_l3_create(context, net, net_data)
+            if self.use_journal and record_task:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.NETWORK,
+                                 resource_id=net['id'], data=net)
 
         return net
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_network(self, context, network):
         """Create Neutron network.
@@ -170,19 +280,33 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.info(_('MidonetPluginV2.create_network called: network=%r'),
                  network)
 
-        net = self._process_create_network(context, network)
+        net = self._create_network_db(context, network)
 
-        try:
-            self.api_cli.create_network(net)
-        except Exception as ex:
-            LOG.error(_("Failed to create a network %(net_id)s in Midonet:"
-                        "%(err)s"), {"net_id": net["id"], "err": ex})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_network(context, net['id'])
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_network', net['id'],
+                lambda: self.api_cli.create_network(net),
+                lambda: super(MidonetPluginV2, self).delete_network(
+                    context, net['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_network exiting: net=%r"), net)
         return net
 
+    @admission.admission_controlled
+    @util.handle_api_error
+    def create_network_bulk(self, context, networks):
+        """Create Neutron networks and their MidoNet bridges in bulk."""
+        LOG.info(_("MidonetPluginV2.create_network_bulk called: "
+                   "networks=%r"), networks)
+
+        nets = self._create_bulk_native(context, 'network', networks)
+
+        LOG.info(_("MidonetPluginV2.create_network_bulk exiting: nets=%r"),
+                 nets)
+        return nets
+
+    @admission.admission_controlled
     @util.handle_api_error
     def update_network(self, context, id, network):
         """Update Neutron network.
@@ -198,24 +322,54 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 context, id, network)
 
             self._process_l3_update(context, net, network['network'])
-            self.api_cli.update_network(id, net)
+            if self.use_journal:
+                task.create_task(context, task.UPDATE,
+                                 data_type_id=task.NETWORK, resource_id=id,
+                                 data=net)
+            else:
+                postcommit.add_hook(
+                    context, 'update_network', id,
+                    lambda: self.api_cli.update_network(id, net),
+                    lambda: self._set_error_status(context,
+                                                   models_v2.Network, id))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.update_network exiting: net=%r"), net)
         return net
 
     @util.handle_api_error
-    @utils.synchronized('midonet-critical-section', external=True)
     def delete_network(self, context, id):
         """Delete a network and its corresponding MidoNet bridge."""
         LOG.info(_("MidonetPluginV2.delete_network called: id=%r"), id)
 
-        with context.session.begin(subtransactions=True):
-            self._process_l3_delete(context, id)
-            super(MidonetPluginV2, self).delete_network(context, id)
-            self.api_cli.delete_network(id)
+        with util.keyed_locks('network-%s' % id):
+            with context.session.begin(subtransactions=True):
+                self._process_l3_delete(context, id)
+                super(MidonetPluginV2, self).delete_network(context, id)
+                if self.use_journal:
+                    task.create_task(context, task.DELETE,
+                                     data_type_id=task.NETWORK,
+                                     resource_id=id)
+                else:
+                    postcommit.add_deletion(context, self.api_cli,
+                                            'delete_network', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_network exiting: id=%r"), id)
 
+    def _create_subnet_db(self, context, subnet, record_task=True):
+
+        with context.session.begin(subtransactions=True):
+            sn_entry = super(MidonetPluginV2, self).create_subnet(context,
+                                                                  subnet)
+            if self.use_journal and record_task:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.SUBNET,
+                                 resource_id=sn_entry['id'], data=sn_entry)
+
+        return sn_entry
+
+    @admission.admission_controlled
     @util.handle_api_error
     def create_subnet(self, context, subnet):
         """Create Neutron subnet.
@@ -224,21 +378,33 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         """
         LOG.info(_("MidonetPluginV2.create_subnet called: subnet=%r"), subnet)
 
-        sn_entry = super(MidonetPluginV2, self).create_subnet(context, subnet)
+        sn_entry = self._create_subnet_db(context, subnet)
 
-        try:
-            self.api_cli.create_subnet(sn_entry)
-        except Exception as ex:
-            LOG.error(_("Failed to create a subnet %(s_id)s in Midonet:"
-                        "%(err)s"), {"s_id": sn_entry["id"], "err": ex})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_subnet(context,
-                                                           sn_entry['id'])
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_subnet', sn_entry['id'],
+                lambda: self.api_cli.create_subnet(sn_entry),
+                lambda: super(MidonetPluginV2, self).delete_subnet(
+                    context, sn_entry['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_subnet exiting: sn_entry=%r"),
                  sn_entry)
         return sn_entry
 
+    @admission.admission_controlled
+    @util.handle_api_error
+    def create_subnet_bulk(self, context, subnets):
+        """Create Neutron subnets and their MidoNet DHCP entries in bulk."""
+        LOG.info(_("MidonetPluginV2.create_subnet_bulk called: "
+                   "subnets=%r"), subnets)
+
+        sn_entries = self._create_bulk_native(context, 'subnet', subnets)
+
+        LOG.info(_("MidonetPluginV2.create_subnet_bulk exiting: "
+                   "sn_entries=%r"), sn_entries)
+        return sn_entries
+
     @util.handle_api_error
     def delete_subnet(self, context, id):
         """Delete Neutron subnet.
@@ -249,10 +415,17 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_subnet(context, id)
-            self.api_cli.delete_subnet(id)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.SUBNET, resource_id=id)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'delete_subnet', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_subnet exiting"))
 
+    @admission.admission_controlled
     @util.handle_api_error
     def update_subnet(self, context, id, subnet):
         """Update the subnet with new info.
@@ -261,11 +434,19 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             s = super(MidonetPluginV2, self).update_subnet(context, id, subnet)
-            self.api_cli.update_subnet(id, s)
+            if self.use_journal:
+                task.create_task(context, task.UPDATE,
+                                 data_type_id=task.SUBNET, resource_id=id,
+                                 data=s)
+            else:
+                # A subnet has no status to flag the failure with.
+                postcommit.add_hook(context, 'update_subnet', id,
+                                    lambda: self.api_cli.update_subnet(id, s))
+        postcommit.run_hooks(context)
 
         return s
 
-    def _process_create_port(self, context, port):
+    def _create_port_db(self, context, port, record_task=True):
         """Create a L2 port in Neutron/MidoNet."""
         port_data = port['port']
         with context.session.begin(subtransactions=True):
@@ -287,47 +468,104 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
             self._process_portbindings_create_and_update(context, port_data,
                                                          new_port)
+            if self.use_journal and record_task:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.PORT,
+                                 resource_id=new_port['id'], data=new_port)
 
         return new_port
 
+    def _get_port_lock_keys(self, port):
+        """The keys of the locks serializing the changes of a port with
+        those of its network, and of its router if any.
+        """
+        keys = ['network-%s' % port['network_id']]
+        if (port.get('device_owner') in _ROUTER_DEVICE_OWNERS and
+                port.get('device_id')):
+            keys.append('router-%s' % port['device_id'])
+        return keys
+
+    @contextlib.contextmanager
+    def _lock_port(self, context, id):
+        """Hold the locks of an existing port, and yield it as read once
+        locked.
+
+        add_router_interface may give the port to a router while waiting
+        for the locks, so the port is read again once locked, and locked
+        again when its lock keys changed.
+        """
+        port = self._get_port(context, id)
+        keys = self._get_port_lock_keys(port)
+        while True:
+            with util.keyed_locks(*keys):
+                context.session.expire(port)
+                port = self._get_port(context, id)
+                locked_keys, keys = keys, self._get_port_lock_keys(port)
+                if keys == locked_keys:
+                    yield port
+                    return
+
+    @admission.admission_controlled
     @util.handle_api_error
-    @utils.synchronized('midonet-critical-section', external=True)
     def create_port(self, context, port):
         """Create a L2 port in Neutron/MidoNet."""
         LOG.info(_("MidonetPluginV2.create_port called: port=%r"), port)
 
-        new_port = self._process_create_port(context, port)
+        with util.keyed_locks(*self._get_port_lock_keys(port['port'])):
+            new_port = self._create_port_db(context, port)
 
-        try:
-            self.api_cli.create_port(new_port)
-        except Exception as ex:
-            LOG.error(_("Failed to create a port %(new_port)s: %(err)s"),
-                      {"new_port": new_port, "err": ex})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_port(context,
-                                                         new_port['id'])
+            if not self.use_journal:
+                postcommit.add_hook(
+                    context, 'create_port', new_port['id'],
+                    lambda: self.api_cli.create_port(new_port),
+                    lambda: super(MidonetPluginV2, self).delete_port(
+                        context, new_port['id']))
+            postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_port exiting: port=%r"), new_port)
         return new_port
 
+    @admission.admission_controlled
+    @util.handle_api_error
+    def create_port_bulk(self, context, ports):
+        """Create L2 ports in Neutron/MidoNet in bulk."""
+        LOG.info(_("MidonetPluginV2.create_port_bulk called: ports=%r"),
+                 ports)
+
+        keys = set()
+        for port in ports['ports']:
+            keys.update(self._get_port_lock_keys(port['port']))
+        with util.keyed_locks(*keys):
+            new_ports = self._create_bulk_native(context, 'port', ports)
+
+        LOG.info(_("MidonetPluginV2.create_port_bulk exiting: ports=%r"),
+                 new_ports)
+        return new_ports
+
     @util.handle_api_error
-    @utils.synchronized('midonet-critical-section', external=True)
     def delete_port(self, context, id, l3_port_check=True):
         """Delete a neutron port and corresponding MidoNet bridge port."""
         LOG.info(_("MidonetPluginV2.delete_port called: id=%(id)s "
                    "l3_port_check=%(l3_port_check)r"),
                  {'id': id, 'l3_port_check': l3_port_check})
 
-        # if needed, check to see if this is a port owned by
-        # and l3-router.  If so, we should prevent deletion.
-        if l3_port_check:
-            self.prevent_l3_port_deletion(context, id)
-
-        with context.session.begin(subtransactions=True):
-            super(MidonetPluginV2, self).disassociate_floatingips(
-                context, id, do_notify=False)
-            super(MidonetPluginV2, self).delete_port(context, id)
-            self.api_cli.delete_port(id)
+        with self._lock_port(context, id):
+            # if needed, check to see if this is a port owned by
+            # and l3-router.  If so, we should prevent deletion.
+            if l3_port_check:
+                self.prevent_l3_port_deletion(context, id)
+
+            with context.session.begin(subtransactions=True):
+                super(MidonetPluginV2, self).disassociate_floatingips(
+                    context, id, do_notify=False)
+                super(MidonetPluginV2, self).delete_port(context, id)
+                if self.use_journal:
+                    task.create_task(context, task.DELETE,
+                                     data_type_id=task.PORT, resource_id=id)
+                else:
+                    postcommit.add_deletion(context, self.api_cli,
+                                            'delete_port', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_port exiting: id=%r"), id)
 
@@ -342,6 +580,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             sg_ids = self._get_security_groups_on_port(context, in_port)
             self._process_port_create_security_group(context, out_port, sg_ids)
 
+    @admission.admission_controlled
     @util.handle_api_error
     def update_port(self, context, id, port):
         """Handle port update, including security groups and fixed IPs."""
@@ -355,11 +594,22 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             self._process_port_update(context, id, port, p)
             self._process_portbindings_create_and_update(context,
                                                          port['port'], p)
-            self.api_cli.update_port(id, p)
+            if self.use_journal:
+                task.create_task(context, task.UPDATE,
+                                 data_type_id=task.PORT, resource_id=id,
+                                 data=p)
+            else:
+                postcommit.add_hook(
+                    context, 'update_port', id,
+                    lambda: self.api_cli.update_port(id, p),
+                    lambda: self._set_error_status(context, models_v2.Port,
+                                                   id))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.update_port exiting: p=%r"), p)
         return p
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_router(self, context, router):
         """Handle router creation.
@@ -373,19 +623,26 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         """
         LOG.info(_("MidonetPluginV2.create_router called: router=%(router)s"),
                  {"router": router})
-        r = super(MidonetPluginV2, self).create_router(context, router)
-        try:
-            self.api_cli.create_router(r)
-        except Exception as ex:
-            LOG.error(_("Failed to create a router %(r_id)s in Midonet:"
-                        "%(err)s"), {"r_id": r["id"], "err": ex})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_router(context, r['id'])
+        with context.session.begin(subtransactions=True):
+            r = super(MidonetPluginV2, self).create_router(context, router)
+            if self.use_journal:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.ROUTER,
+                                 resource_id=r['id'], data=r)
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_router', r['id'],
+                lambda: self.api_cli.create_router(r),
+                lambda: super(MidonetPluginV2, self).delete_router(
+                    context, r['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_router exiting: "
                    "router=%(router)s."), {"router": r})
         return r
 
+    @admission.admission_controlled
     @util.handle_api_error
     def update_router(self, context, id, router):
         """Handle router updates."""
@@ -394,7 +651,16 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             r = super(MidonetPluginV2, self).update_router(context, id, router)
-            self.api_cli.update_router(id, r)
+            if self.use_journal:
+                task.create_task(context, task.UPDATE,
+                                 data_type_id=task.ROUTER, resource_id=id,
+                                 data=r)
+            else:
+                postcommit.add_hook(
+                    context, 'update_router', id,
+                    lambda: self.api_cli.update_router(id, r),
+                    lambda: self._set_error_status(context, l3_db.Router, id))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.update_router exiting: router=%r"), r)
         return r
@@ -412,10 +678,17 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_router(context, id)
-            self.api_cli.delete_router(id)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.ROUTER, resource_id=id)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'delete_router', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_router exiting: id=%s"), id)
 
+    @admission.admission_controlled
     @util.handle_api_error
     def add_router_interface(self, context, router_id, interface_info):
         """Handle router linking with network."""
@@ -424,17 +697,21 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                    "interface_info=%(interface_info)r"),
                  {'router_id': router_id, 'interface_info': interface_info})
 
-        info = super(MidonetPluginV2, self).add_router_interface(
-            context, router_id, interface_info)
-
-        try:
-            self.api_cli.add_router_interface(router_id, info)
-        except Exception:
-            LOG.error(_("Failed to create MidoNet resources to add router "
-                        "interface. info=%(info)s, router_id=%(router_id)s"),
-                      {"info": info, "router_id": router_id})
-            with excutils.save_and_reraise_exception():
-                self.remove_router_interface(context, router_id, info)
+        with context.session.begin(subtransactions=True):
+            info = super(MidonetPluginV2, self).add_router_interface(
+                context, router_id, interface_info)
+            if self.use_journal:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.ROUTERINTERFACE,
+                                 resource_id=router_id, data=info)
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'add_router_interface', router_id,
+                lambda: self.api_cli.add_router_interface(router_id, info),
+                lambda: super(MidonetPluginV2, self).remove_router_interface(
+                    context, router_id, info))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.add_router_interface exiting: info=%r"),
                  info)
@@ -451,28 +728,42 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             info = super(MidonetPluginV2, self).remove_router_interface(
                 context, router_id, interface_info)
-            self.api_cli.remove_router_interface(router_id, interface_info)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.ROUTERINTERFACE,
+                                 resource_id=router_id, data=info)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'remove_router_interface', router_id,
+                                        interface_info)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.remove_router_interface exiting: "
                    "info=%r"), info)
         return info
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_floatingip(self, context, floatingip):
         """Handle floating IP creation."""
         LOG.info(_("MidonetPluginV2.create_floatingip called: ip=%r"),
                  floatingip)
 
-        fip = super(MidonetPluginV2, self).create_floatingip(context,
-                                                             floatingip)
-        try:
-            self.api_cli.create_floating_ip(fip)
-        except Exception as ex:
-            LOG.error(_("Failed to create floating ip %(fip)s: %(err)s"),
-                      {"fip": fip, "err": ex})
-            with excutils.save_and_reraise_exception():
-                # Try removing the fip
-                self.delete_floatingip(context, fip['id'])
+        with context.session.begin(subtransactions=True):
+            fip = super(MidonetPluginV2, self).create_floatingip(context,
+                                                                 floatingip)
+            if self.use_journal:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.FLOATINGIP,
+                                 resource_id=fip['id'], data=fip)
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_floatingip', fip['id'],
+                lambda: self.api_cli.create_floating_ip(fip),
+                lambda: super(MidonetPluginV2, self).delete_floatingip(
+                    context, fip['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_floatingip exiting: fip=%r"),
                  fip)
@@ -485,10 +776,17 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_floatingip(context, id)
-            self.api_cli.delete_floating_ip(id)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.FLOATINGIP, resource_id=id)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'delete_floating_ip', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_floatingip exiting: id=%r"), id)
 
+    @admission.admission_controlled
     @util.handle_api_error
     def update_floatingip(self, context, id, floatingip):
         """Handle floating IP association and disassociation."""
@@ -506,11 +804,22 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 fip['status'] = n_const.FLOATINGIP_STATUS_ACTIVE
             self.update_floatingip_status(context, id, fip['status'])
 
-            self.api_cli.update_floating_ip(id, fip)
+            if self.use_journal:
+                task.create_task(context, task.UPDATE,
+                                 data_type_id=task.FLOATINGIP, resource_id=id,
+                                 data=fip)
+            else:
+                postcommit.add_hook(
+                    context, 'update_floatingip', id,
+                    lambda: self.api_cli.update_floating_ip(id, fip),
+                    lambda: self._set_error_status(context, l3_db.FloatingIP,
+                                                   id))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.update_floating_ip exiting: fip=%s"), fip)
         return fip
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_security_group(self, context, security_group, default_sg=False):
         """Create security group.
@@ -530,18 +839,22 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             self._ensure_default_security_group(context, tenant_id)
 
         # Create the Neutron sg first
-        sg = super(MidonetPluginV2, self).create_security_group(
-            context, security_group, default_sg)
-
-        try:
+        with context.session.begin(subtransactions=True):
+            sg = super(MidonetPluginV2, self).create_security_group(
+                context, security_group, default_sg)
+            if self.use_journal:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.SECURITYGROUP,
+                                 resource_id=sg['id'], data=sg)
+
+        if not self.use_journal:
             # Process the MidoNet side
-            self.api_cli.create_security_group(sg)
-        except Exception:
-            LOG.error(_("Failed to create MidoNet resources for sg %(sg)r"),
-                      {"sg": sg})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_security_group(context,
-                                                                   sg['id'])
+            postcommit.add_hook(
+                context, 'create_security_group', sg['id'],
+                lambda: self.api_cli.create_security_group(sg),
+                lambda: super(MidonetPluginV2, self).delete_security_group(
+                    context, sg['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_security_group exiting: sg=%r"), sg)
         return sg
@@ -560,10 +873,18 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_security_group(context, id)
-            self.api_cli.delete_security_group(id)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.SECURITYGROUP,
+                                 resource_id=id)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'delete_security_group', id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_security_group exiting: id=%r"), id)
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_security_group_rule(self, context, security_group_rule):
         """Create a security group rule
@@ -575,22 +896,28 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                    "security_group_rule=%(security_group_rule)r"),
                  {'security_group_rule': security_group_rule})
 
-        rule = super(MidonetPluginV2, self).create_security_group_rule(
-            context, security_group_rule)
-
-        try:
-            self.api_cli.create_security_group_rule(rule)
-        except Exception as ex:
-            LOG.error(_('Failed to create security group rule %(sg)s,'
-                      'error: %(err)s'), {'sg': rule, 'err': ex})
-            with excutils.save_and_reraise_exception():
-                super(MidonetPluginV2, self).delete_security_group_rule(
-                    context, rule['id'])
+        with context.session.begin(subtransactions=True):
+            rule = super(MidonetPluginV2, self).create_security_group_rule(
+                context, security_group_rule)
+            if self.use_journal:
+                task.create_task(context, task.CREATE,
+                                 data_type_id=task.SECURITYGROUPRULE,
+                                 resource_id=rule['id'], data=rule)
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_security_group_rule', rule['id'],
+                lambda: self.api_cli.create_security_group_rule(rule),
+                lambda: super(
+                    MidonetPluginV2, self).delete_security_group_rule(
+                        context, rule['id']))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_security_group_rule exiting: "
                    "rule=%r"), rule)
         return rule
 
+    @admission.admission_controlled
     @util.handle_api_error
     def create_security_group_rule_bulk(self, context, security_group_rules):
         """Create multiple security group rules
@@ -602,23 +929,32 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                    "security_group_rules=%(security_group_rules)r"),
                  {'security_group_rules': security_group_rules})
 
-        rules = super(
-            MidonetPluginV2, self).create_security_group_rule_bulk_native(
-                context, security_group_rules)
-        try:
-            self.api_cli.create_security_group_rule_bulk(rules)
-        except Exception as ex:
-            LOG.error(_("Failed to create bulk security group rules %(sg)s, "
-                        "error: %(err)s"), {"sg": rules, "err": ex})
-            with excutils.save_and_reraise_exception():
-                for rule in rules:
-                    super(MidonetPluginV2, self).delete_security_group_rule(
-                        context, rule['id'])
+        with context.session.begin(subtransactions=True):
+            rules = super(
+                MidonetPluginV2, self).create_security_group_rule_bulk_native(
+                    context, security_group_rules)
+            if self.use_journal:
+                task.create_tasks(context, [
+                    (task.CREATE, task.SECURITYGROUPRULE, rule['id'], rule)
+                    for rule in rules])
+
+        if not self.use_journal:
+            postcommit.add_hook(
+                context, 'create_security_group_rule_bulk',
+                [rule['id'] for rule in rules],
+                lambda: self.api_cli.create_security_group_rule_bulk(rules),
+                lambda: self._delete_security_group_rules(context, rules))
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.create_security_group_rule_bulk exiting: "
                    "rules=%r"), rules)
         return rules
 
+    def _delete_security_group_rules(self, context, rules):
+        for rule in rules:
+            super(MidonetPluginV2, self).delete_security_group_rule(
+                context, rule['id'])
+
     @util.handle_api_error
     def delete_security_group_rule(self, context, sg_rule_id):
         """Delete a security group rule
@@ -632,7 +968,15 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_security_group_rule(context,
                                                                     sg_rule_id)
-            self.api_cli.delete_security_group_rule(sg_rule_id)
+            if self.use_journal:
+                task.create_task(context, task.DELETE,
+                                 data_type_id=task.SECURITYGROUPRULE,
+                                 resource_id=sg_rule_id)
+            else:
+                postcommit.add_deletion(context, self.api_cli,
+                                        'delete_security_group_rule',
+                                        sg_rule_id)
+        postcommit.run_hooks(context)
 
         LOG.info(_("MidonetPluginV2.delete_security_group_rule exiting: "
                    "id=%r"), id)
@@ -642,12 +986,16 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.create_vip called: %(vip)r",
                   {'vip': vip})
 
-        with context.session.begin(subtransactions=True):
-            v = super(MidonetPluginV2, self).create_vip(context, vip)
-            self.api_cli.create_vip(v)
-            v['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Vip, v['id'],
-                               v['status'])
+        v = super(MidonetPluginV2, self).create_vip(context, vip)
+        postcommit.add_hook(
+            context, 'create_vip', v['id'],
+            lambda: self.api_cli.create_vip(v),
+            lambda: super(MidonetPluginV2, self).delete_vip(context,
+                                                            v['id']))
+        postcommit.run_hooks(context)
+        v['status'] = constants.ACTIVE
+        self.update_status(context, loadbalancer_db.Vip, v['id'],
+                           v['status'])
 
         LOG.debug("MidonetPluginV2.create_vip exiting: id=%r", v['id'])
         return v
@@ -659,7 +1007,8 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_vip(context, id)
-            self.api_cli.delete_vip(id)
+            postcommit.add_deletion(context, self.api_cli, 'delete_vip', id)
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.delete_vip existing: id=%(id)r",
                   {'id': id})
@@ -669,9 +1018,12 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.update_vip called: id=%(id)r, "
                   "vip=%(vip)r", {'id': id, 'vip': vip})
 
-        with context.session.begin(subtransactions=True):
-            v = super(MidonetPluginV2, self).update_vip(context, id, vip)
-            self.api_cli.update_vip(id, v)
+        v = super(MidonetPluginV2, self).update_vip(context, id, vip)
+        postcommit.add_hook(
+            context, 'update_vip', id,
+            lambda: self.api_cli.update_vip(id, v),
+            lambda: self._set_error_status(context, loadbalancer_db.Vip, id))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.update_vip exiting: id=%(id)r, "
                   "vip=%(vip)r", {'id': id, 'vip': v})
@@ -702,11 +1054,14 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                                     loadbalancer_db.Pool)
             p[rsi.ROUTER_ID] = router_id
 
-            self.api_cli.create_pool(p)
+        postcommit.add_hook(context, 'create_pool', p['id'],
+                            lambda: self.api_cli.create_pool(p),
+                            lambda: self._delete_pool(context, p['id']))
+        postcommit.run_hooks(context)
 
-            p['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Pool, p['id'],
-                               p['status'])
+        p['status'] = constants.ACTIVE
+        self.update_status(context, loadbalancer_db.Pool, p['id'],
+                           p['status'])
 
         LOG.debug("MidonetPluginV2.create_pool exiting: %(pool)r",
                   {'pool': p})
@@ -717,23 +1072,31 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.update_pool called: id=%(id)r, "
                   "pool=%(pool)r", {'id': id, 'pool': pool})
 
-        with context.session.begin(subtransactions=True):
-            p = super(MidonetPluginV2, self).update_pool(context, id, pool)
-            self.api_cli.update_pool(id, p)
+        p = super(MidonetPluginV2, self).update_pool(context, id, pool)
+        postcommit.add_hook(
+            context, 'update_pool', id,
+            lambda: self.api_cli.update_pool(id, p),
+            lambda: self._set_error_status(context, loadbalancer_db.Pool, id))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.update_pool exiting: id=%(id)r, "
                   "pool=%(pool)r", {'id': id, 'pool': pool})
         return p
 
+    def _delete_pool(self, context, id):
+        with context.session.begin(subtransactions=True):
+            self._delete_resource_router_id_binding(context, id,
+                                                    loadbalancer_db.Pool)
+            super(MidonetPluginV2, self).delete_pool(context, id)
+
     @util.handle_api_error
     def delete_pool(self, context, id):
         LOG.debug("MidonetPluginV2.delete_pool called: %(id)r", {'id': id})
 
         with context.session.begin(subtransactions=True):
-            self._delete_resource_router_id_binding(context, id,
-                                                    loadbalancer_db.Pool)
-            super(MidonetPluginV2, self).delete_pool(context, id)
-            self.api_cli.delete_pool(id)
+            self._delete_pool(context, id)
+            postcommit.add_deletion(context, self.api_cli, 'delete_pool', id)
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.delete_pool exiting: %(id)r", {'id': id})
 
@@ -742,12 +1105,16 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.create_member called: %(member)r",
                   {'member': member})
 
-        with context.session.begin(subtransactions=True):
-            m = super(MidonetPluginV2, self).create_member(context, member)
-            self.api_cli.create_member(m)
-            m['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Member, m['id'],
-                               m['status'])
+        m = super(MidonetPluginV2, self).create_member(context, member)
+        postcommit.add_hook(
+            context, 'create_member', m['id'],
+            lambda: self.api_cli.create_member(m),
+            lambda: super(MidonetPluginV2, self).delete_member(context,
+                                                               m['id']))
+        postcommit.run_hooks(context)
+        m['status'] = constants.ACTIVE
+        self.update_status(context, loadbalancer_db.Member, m['id'],
+                           m['status'])
 
         LOG.debug("MidonetPluginV2.create_member exiting: %(member)r",
                   {'member': m})
@@ -758,9 +1125,13 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.update_member called: id=%(id)r, "
                   "member=%(member)r", {'id': id, 'member': member})
 
-        with context.session.begin(subtransactions=True):
-            m = super(MidonetPluginV2, self).update_member(context, id, member)
-            self.api_cli.update_member(id, m)
+        m = super(MidonetPluginV2, self).update_member(context, id, member)
+        postcommit.add_hook(
+            context, 'update_member', id,
+            lambda: self.api_cli.update_member(id, m),
+            lambda: self._set_error_status(context, loadbalancer_db.Member,
+                                           id))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.update_member exiting: id=%(id)r, "
                   "member=%(member)r", {'id': id, 'member': m})
@@ -773,7 +1144,9 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_member(context, id)
-            self.api_cli.delete_member(id)
+            postcommit.add_deletion(context, self.api_cli, 'delete_member',
+                                    id)
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.delete_member exiting: %(id)r",
                   {'id': id})
@@ -783,10 +1156,14 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug("MidonetPluginV2.create_health_monitor called: "
                   " %(health_monitor)r", {'health_monitor': health_monitor})
 
-        with context.session.begin(subtransactions=True):
-            hm = super(MidonetPluginV2, self).create_health_monitor(
-                context, health_monitor)
-            self.api_cli.create_health_monitor(hm)
+        hm = super(MidonetPluginV2, self).create_health_monitor(
+            context, health_monitor)
+        postcommit.add_hook(
+            context, 'create_health_monitor', hm['id'],
+            lambda: self.api_cli.create_health_monitor(hm),
+            lambda: super(MidonetPluginV2, self).delete_health_monitor(
+                context, hm['id']))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.create_health_monitor exiting: "
                   "%(health_monitor)r", {'health_monitor': hm})
@@ -798,10 +1175,13 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                   "health_monitor=%(health_monitor)r",
                   {'id': id, 'health_monitor': health_monitor})
 
-        with context.session.begin(subtransactions=True):
-            hm = super(MidonetPluginV2, self).update_health_monitor(
-                context, id, health_monitor)
-            self.api_cli.update_health_monitor(id, hm)
+        hm = super(MidonetPluginV2, self).update_health_monitor(
+            context, id, health_monitor)
+        # A health monitor has no status to flag the failure with.
+        postcommit.add_hook(
+            context, 'update_health_monitor', id,
+            lambda: self.api_cli.update_health_monitor(id, hm))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.update_health_monitor exiting: id=%(id)r, "
                   "health_monitor=%(health_monitor)r",
@@ -815,7 +1195,9 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_health_monitor(context, id)
-            self.api_cli.delete_health_monitor(id)
+            postcommit.add_deletion(context, self.api_cli,
+                                    'delete_health_monitor', id)
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.delete_health_monitor exiting: %(id)r",
                   {'id': id})
@@ -833,10 +1215,14 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             raise n_exc.BadRequest(resource='pool_health_monitor', msg=msg)
 
         hm = health_monitor['health_monitor']
-        with context.session.begin(subtransactions=True):
-            monitors = super(MidonetPluginV2, self).create_pool_health_monitor(
-                context, health_monitor, pool_id)
-            self.api_cli.create_pool_health_monitor(hm, pool_id)
+        monitors = super(MidonetPluginV2, self).create_pool_health_monitor(
+            context, health_monitor, pool_id)
+        postcommit.add_hook(
+            context, 'create_pool_health_monitor', pool_id,
+            lambda: self.api_cli.create_pool_health_monitor(hm, pool_id),
+            lambda: super(MidonetPluginV2, self).delete_pool_health_monitor(
+                context, hm['id'], pool_id))
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.create_pool_health_monitor exiting: "
                   "%(health_monitor)r, %(pool_id)r",
@@ -852,7 +1238,10 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             super(MidonetPluginV2, self).delete_pool_health_monitor(
                 context, id, pool_id)
-            self.api_cli.delete_pool_health_monitor(id, pool_id)
+            postcommit.add_deletion(context, self.api_cli,
+                                    'delete_pool_health_monitor', id,
+                                    pool_id)
+        postcommit.run_hooks(context)
 
         LOG.debug("MidonetPluginV2.delete_pool_health_monitor exiting: "
                   "%(id)r, %(pool_id)r", {'id': id, 'pool_id': pool_id})
@@ -48,6 +48,27 @@ class ClusterExtensionTestCase(test_api_v2_extension.ExtensionTestCase):
         self.assertEqual(exc.HTTPCreated.code, res.status_int)
         instance.create_cluster.assert_called_once_with(mock.ANY, cluster=data)
 
+    def test_get_rebuild_progress(self):
+        rebuild_id = _uuid()
+        return_value = {'id': rebuild_id, 'mode': 'full',
+                        'status': 'RUNNING', 'resource_type': 'port',
+                        'items_done': 10, 'items_total': 40,
+                        'rows_per_sec': 5.0, 'eta': 6.0, 'error': None,
+                        'started_at': '2014-12-08T10:00:00',
+                        'finished_at': None}
+        instance = self.plugin.return_value
+        instance.get_cluster.return_value = return_value
+
+        res = self.api.get(_get_path('clusters/%s' % rebuild_id,
+                                     fmt=self.fmt))
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+        instance.get_cluster.assert_called_once_with(
+            mock.ANY, rebuild_id, fields=mock.ANY)
+        res = self.deserialize(res)
+        self.assertIn('cluster', res)
+        self.assertEqual(rebuild_id, res['cluster']['id'])
+        self.assertEqual('RUNNING', res['cluster']['status'])
+
 
 class ClusterExtensionTestCaseXml(ClusterExtensionTestCase):
     fmt = "xml"
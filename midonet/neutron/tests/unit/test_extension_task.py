@@ -0,0 +1,107 @@
+# Copyright 2014 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+from webob import exc
+
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import test_api_v2
+from neutron.tests.unit import test_api_v2_extension
+
+from midonet.neutron.extensions import task
+
+_uuid = uuidutils.generate_uuid
+_get_path = test_api_v2._get_path
+
+
+class TaskExtensionTestCase(test_api_v2_extension.ExtensionTestCase):
+    fmt = "json"
+
+    def setUp(self):
+        super(TaskExtensionTestCase, self).setUp()
+        plural_mappings = {'task': 'tasks',
+                           'task_consumer': 'task_consumers',
+                           'task_metric': 'task_metrics'}
+        self._setUpExtension(
+            'midonet.neutron.extensions.task.TaskPluginBase',
+            None, task.RESOURCE_ATTRIBUTE_MAP,
+            task.Task, '', plural_mappings=plural_mappings,
+            allow_pagination=True, allow_sorting=True)
+
+    def _task(self, task_id):
+        return {'id': task_id, 'type_id': 1, 'data_type_id': 4,
+                'resource_id': _uuid(), 'transaction_id': 'req-1',
+                'created_at': '2014-12-01T10:00:00', 'data': {'name': 'p'}}
+
+    def test_task_list(self):
+        instance = self.plugin.return_value
+        instance.get_tasks.return_value = [self._task(6), self._task(7)]
+
+        res = self.api.get(_get_path('tasks', fmt=self.fmt),
+                           {'data_type_id': '4', 'limit': '2',
+                            'marker': '5'})
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+
+        instance.get_tasks.assert_called_once_with(
+            mock.ANY, fields=mock.ANY, filters={'data_type_id': [4]},
+            sorts=mock.ANY, limit=2, marker='5', page_reverse=False)
+
+        res = self.deserialize(res)
+        self.assertEqual([6, 7], [t['id'] for t in res['tasks']])
+        self.assertEqual({'name': 'p'}, res['tasks'][0]['data'])
+        self.assertIn('marker=7', res['tasks_links'][0]['href'])
+
+    def test_task_show(self):
+        instance = self.plugin.return_value
+        instance.get_task.return_value = self._task(6)
+
+        res = self.api.get(_get_path('tasks/6', fmt=self.fmt))
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+
+        instance.get_task.assert_called_once_with(
+            mock.ANY, '6', fields=mock.ANY)
+        self.assertEqual(6, self.deserialize(res)['task']['id'])
+
+    def test_task_consumer_update(self):
+        instance = self.plugin.return_value
+        instance.update_task_consumer.return_value = {
+            'id': 'replayer', 'task_id': 8, 'backlog_rows': 2,
+            'backlog_bytes': 120, 'oldest_task_age': 1.5}
+
+        data = {'task_consumer': {'task_id': 8}}
+        res = self.api.put(_get_path('task_consumers/replayer',
+                                     fmt=self.fmt),
+                           self.serialize(data),
+                           content_type='application/%s' % self.fmt)
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+
+        instance.update_task_consumer.assert_called_once_with(
+            mock.ANY, 'replayer', task_consumer=data)
+        res = self.deserialize(res)
+        self.assertEqual(2, res['task_consumer']['backlog_rows'])
+
+    def test_task_metric_list(self):
+        instance = self.plugin.return_value
+        instance.get_task_metrics.return_value = [
+            {'id': 'create_port', 'tasks_per_sec': 2.5, 'transactions': 3,
+             'insert_latency_avg': 0.01, 'insert_latency_max': 0.02}]
+
+        res = self.api.get(_get_path('task_metrics', fmt=self.fmt))
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+
+        instance.get_task_metrics.assert_called_once_with(
+            mock.ANY, fields=mock.ANY, filters=mock.ANY)
+        res = self.deserialize(res)
+        self.assertEqual(['create_port'],
+                         [m['id'] for m in res['task_metrics']])
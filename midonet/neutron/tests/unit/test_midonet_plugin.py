@@ -19,11 +19,21 @@
 # @author: Rossella Sblendido, Midokura Europe SARL
 # @author: Ryu Ishimoto, Midokura Japan KK
 # @author: Tomoe Sugihara, Midokura Japan KK
+import contextlib
+import datetime
+import gzip
+import json
 import mock
 import os
+import tempfile
+import webob.exc
 
+from neutron.common import constants as n_const
+from neutron import context
+from neutron import manager
 from neutron.extensions import portbindings
 from neutron.openstack.common import importutils
+from neutron.openstack.common import uuidutils
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
 import neutron.tests.unit.test_db_plugin as test_plugin
 import neutron.tests.unit.test_extension_ext_gw_mode as test_gw_mode
@@ -31,11 +41,26 @@ import neutron.tests.unit.test_extension_security_group as sg
 import neutron.tests.unit.test_l3_plugin as test_l3_plugin
 from oslo.config import cfg
 
+from midonet.neutron.common import util
+from midonet.neutron.db import task
+from midonet.neutron.journal import snapshot as snapshot_cli
+
 
 MIDOKURA_PKG_PATH = "midonet.neutron.plugin"
 MIDOKURA_EXT_PATH = "midonet.neutron.extensions"
 MIDONET_PLUGIN_NAME = ('%s.MidonetPluginV2' % MIDOKURA_PKG_PATH)
 
+# The methods of the MidonetClient of python-midonetclient, which the client
+# mock is limited to. Its only bulk method is for security group rules.
+MIDONET_CLIENT_METHODS = [
+    '%s_%s' % (op, resource)
+    for op in ('create', 'update', 'delete')
+    for resource in ('network', 'subnet', 'port', 'router', 'floating_ip',
+                     'security_group', 'security_group_rule', 'vip', 'pool',
+                     'member', 'health_monitor', 'pool_health_monitor')
+] + ['add_router_interface', 'remove_router_interface',
+     'create_security_group_rule_bulk']
+
 
 class MidonetPluginV2TestCase(test_plugin.NeutronDbPluginV2TestCase):
 
@@ -60,12 +85,15 @@ class MidonetPluginV2TestCase(test_plugin.NeutronDbPluginV2TestCase):
         # mock object used for this module.
         from midonetclient.neutron.client import MidonetClient
         client_class = MidonetClient
+        client_class.return_value = mock.MagicMock(spec=MIDONET_CLIENT_METHODS)
         self.mock_class = client_class()
 
         extensions_path = importutils.import_module(
             MIDOKURA_EXT_PATH).__file__
         cfg.CONF.set_override('api_extensions_path',
                               os.path.dirname(extensions_path))
+        # The tests retry the failed deletions themselves.
+        cfg.CONF.set_override('deletion_retry_interval', 0, group='MIDONET')
         super(MidonetPluginV2TestCase, self).setUp(plugin=plugin)
 
     def tearDown(self):
@@ -118,3 +146,362 @@ class TestExtGwMode(MidonetPluginV2TestCase,
                     test_gw_mode.ExtGwModeIntTestCase):
 
     pass
+
+
+class TestMidonetTaskJournal(MidonetPluginV2TestCase):
+
+    def setUp(self):
+        cfg.CONF.set_override('use_task_journal', True, group='MIDONET')
+        super(TestMidonetTaskJournal, self).setUp()
+
+    def _get_tasks(self, resource_id):
+        session = context.get_admin_context().session
+        return session.query(task.Task).filter_by(
+            resource_id=resource_id).order_by(task.Task.id).all()
+
+    def test_create_network_records_task(self):
+        with self.network() as net:
+            net_id = net['network']['id']
+            tasks = self._get_tasks(net_id)
+            self.assertEqual([task.CREATE], [t.type_id for t in tasks])
+            self.assertEqual(task.NETWORK, tasks[0].data_type_id)
+            self.assertFalse(self.mock_class.create_network.called)
+
+    def test_create_ports_bulk_records_tasks_at_once(self):
+        with self.network() as net:
+            with self.subnet(network=net):
+                with mock.patch.object(task, 'create_task') as create_task:
+                    res = self._create_port_bulk(self.fmt, 3,
+                                                 net['network']['id'], 'test',
+                                                 True)
+                self.assertFalse(create_task.called)
+                ports = self.deserialize(self.fmt, res)['ports']
+                tasks = [self._get_tasks(port['id'])[0] for port in ports]
+                self.assertEqual([(task.CREATE, task.PORT)] * 3,
+                                 [(t.type_id, t.data_type_id) for t in tasks])
+                self.assertEqual(1, len(set(t.envelope_id for t in tasks)))
+                self.assertFalse(self.mock_class.create_port.called)
+
+    def test_delete_network_records_task(self):
+        with self.network(do_delete=False) as net:
+            net_id = net['network']['id']
+            self._delete('networks', net_id)
+            tasks = self._get_tasks(net_id)
+            self.assertEqual([task.CREATE, task.DELETE],
+                             [t.type_id for t in tasks])
+            self.assertFalse(self.mock_class.delete_network.called)
+
+
+class TestMidonetPostCommit(MidonetPluginV2TestCase):
+
+    def test_update_network_failure_sets_error_status(self):
+        self.mock_class.update_network.side_effect = (
+            webob.exc.HTTPInternalServerError())
+        with self.network() as net:
+            net_id = net['network']['id']
+            self._update('networks', net_id, {'network': {'name': 'foo'}},
+                         expected_code=webob.exc.HTTPInternalServerError.code)
+            net = self._show('networks', net_id)['network']
+            self.assertEqual('foo', net['name'])
+            self.assertEqual('ERROR', net['status'])
+
+    def test_delete_network_failure_is_retried(self):
+        with self.network(do_delete=False) as net:
+            net_id = net['network']['id']
+            self.mock_class.delete_network.side_effect = (
+                webob.exc.HTTPInternalServerError())
+            self._delete('networks', net_id)
+            self._show('networks', net_id,
+                       expected_code=webob.exc.HTTPNotFound.code)
+
+            session = context.get_admin_context().session
+            self.assertEqual(1, session.query(task.DeletionRetry).count())
+            self.mock_class.delete_network.side_effect = None
+            manager.NeutronManager.get_plugin()._retry_deletions()
+            self.mock_class.delete_network.assert_called_with(net_id)
+            self.assertEqual(0, session.query(task.DeletionRetry).count())
+
+
+class TestMidonetPortLocks(MidonetPluginV2TestCase):
+
+    def test_ports_lock_their_network(self):
+        with self.network() as net:
+            net_id = net['network']['id']
+            with mock.patch.object(util, 'keyed_locks',
+                                   wraps=util.keyed_locks) as keyed_locks:
+                with self.subnet(network=net) as subnet:
+                    with self.port(subnet=subnet):
+                        pass
+            keyed_locks.assert_has_calls([mock.call('network-%s' % net_id),
+                                          mock.call('network-%s' % net_id)])
+
+    def test_delete_port_locks_its_new_router(self):
+        with self.port(do_delete=False) as port:
+            port = port['port']
+            router_id = uuidutils.generate_uuid()
+            plugin = manager.NeutronManager.get_plugin()
+            keyed_locks = util.keyed_locks
+
+            def give_to_router(*keys):
+                # The port is given to a router while waiting for its locks.
+                self._update('ports', port['id'],
+                             {'port': {'device_id': router_id,
+                                       'device_owner':
+                                       n_const.DEVICE_OWNER_ROUTER_INTF}})
+                lock.side_effect = keyed_locks
+                return keyed_locks(*keys)
+
+            with mock.patch.object(util, 'keyed_locks',
+                                   side_effect=give_to_router) as lock:
+                plugin.delete_port(context.get_admin_context(), port['id'],
+                                   l3_port_check=False)
+
+            self.assertEqual(
+                [mock.call('network-%s' % port['network_id']),
+                 mock.call('network-%s' % port['network_id'],
+                           'router-%s' % router_id)],
+                lock.call_args_list)
+
+
+class TestMidonetBulk(MidonetPluginV2TestCase):
+
+    def test_create_ports_bulk_one_call_per_port(self):
+        # The MidoNet client has no bulk method for ports.
+        with self.network() as net:
+            with self.subnet(network=net):
+                res = self._create_port_bulk(self.fmt, 3,
+                                             net['network']['id'], 'test',
+                                             True)
+                self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+                ports = self.deserialize(self.fmt, res)['ports']
+
+                create_port = self.mock_class.create_port
+                self.assertEqual(3, create_port.call_count)
+                self.assertEqual(
+                    sorted(port['id'] for port in ports),
+                    sorted(c[0][0]['id'] for c in create_port.call_args_list))
+                for port in ports:
+                    self._delete('ports', port['id'])
+
+    def test_create_ports_bulk_failure_deletes_all(self):
+        self.mock_class.create_port.side_effect = [
+            None, webob.exc.HTTPInternalServerError()]
+        with self.network() as net:
+            net_id = net['network']['id']
+            with self.subnet(network=net):
+                res = self._create_port_bulk(self.fmt, 3, net_id, 'test',
+                                             True)
+                self.assertEqual(webob.exc.HTTPInternalServerError.code,
+                                 res.status_int)
+                self.assertEqual([], self._list(
+                    'ports', query_params='network_id=%s' % net_id)['ports'])
+
+
+class TestMidonetClusterRebuild(MidonetPluginV2TestCase):
+
+    def test_write_snapshot_reads_resources_in_chunks(self):
+        cfg.CONF.set_override('cluster_rebuild_chunk_size', 2,
+                              group='MIDONET')
+        with self.network() as net:
+            with contextlib.nested(self.port(net), self.port(net),
+                                   self.port(net)) as ports:
+                plugin = manager.NeutronManager.get_plugin()
+                spool = tempfile.TemporaryFile(mode='w+')
+                plugin._write_snapshot(context.get_admin_context(), spool)
+
+                spool.seek(0)
+                lines = [line.split('\t', 3)[1:3] for line in spool]
+                port_ids = sorted(p['port']['id'] for p in ports)
+                self.assertIn([str(task.NETWORK), net['network']['id']],
+                              lines)
+                self.assertEqual(port_ids,
+                                 [resource_id for data_type_id, resource_id
+                                  in lines if data_type_id == str(task.PORT)])
+
+    def test_spool_snapshot_reads_resources_concurrently(self):
+        cfg.CONF.set_override('cluster_snapshot_workers', 3,
+                              group='MIDONET')
+        with self.network() as net:
+            with self.port(net) as port:
+                plugin = manager.NeutronManager.get_plugin()
+                contexts = plugin._get_snapshot_contexts(
+                    context.get_admin_context())
+                spool = tempfile.TemporaryFile(mode='w+')
+                plugin._spool_snapshot(contexts, spool, False)
+
+                spool.seek(0)
+                lines = [line.split('\t', 3)[1:3] for line in spool]
+                self.assertEqual(3, len(contexts))
+                self.assertIn([str(task.PORT), port['port']['id']], lines)
+                # The lines keep the order of the resources.
+                data_type_ids = [int(data_type_id)
+                                 for data_type_id, resource_id in lines]
+                order = [r[0] for r in task.CLUSTER_RESOURCES]
+                self.assertEqual(sorted(data_type_ids, key=order.index),
+                                 data_type_ids)
+
+    def test_write_diff_writes_differences(self):
+        with self.network() as net:
+            with self.port(net) as port:
+                net_id = net['network']['id']
+                port_id = port['port']['id']
+                ctx = context.get_admin_context()
+                with ctx.session.begin():
+                    for data_type_id, resource_id in [
+                            (task.NETWORK, net_id), (task.PORT, 'stale')]:
+                        ctx.session.add(task.TaskFingerprint(
+                            data_type_id=data_type_id,
+                            resource_id=resource_id, content_hash='old'))
+                plugin = manager.NeutronManager.get_plugin()
+                spool = tempfile.TemporaryFile(mode='w+')
+                plugin._write_diff(ctx, spool)
+
+                spool.seek(0)
+                lines = [line.split('\t', 3)[:3] for line in spool]
+                self.assertIn([str(task.UPDATE), str(task.NETWORK), net_id],
+                              lines)
+                self.assertIn([str(task.CREATE), str(task.PORT), port_id],
+                              lines)
+                self.assertEqual([str(task.DELETE), str(task.PORT), 'stale'],
+                                 lines[-1])
+
+    def test_write_diff_needs_fingerprints(self):
+        plugin = manager.NeutronManager.get_plugin()
+        spool = tempfile.TemporaryFile(mode='w+')
+        self.assertRaises(task.MidonetClusterException, plugin._write_diff,
+                          context.get_admin_context(), spool)
+
+    def test_stage_snapshot_stages_the_spooled_tasks(self):
+        cfg.CONF.set_override('cluster_rebuild_chunk_size', 2,
+                              group='MIDONET')
+        with self.network() as net:
+            with contextlib.nested(self.port(net), self.port(net)) as ports:
+                plugin = manager.NeutronManager.get_plugin()
+                ctx = context.get_admin_context()
+                with ctx.session.begin():
+                    rebuild = task.ClusterRebuild(
+                        mode='full', status=task.REBUILD_RUNNING)
+                    ctx.session.add(rebuild)
+                spool = tempfile.TemporaryFile(mode='w+')
+                plugin._write_snapshot(ctx, spool)
+                plugin._stage_snapshot(ctx, rebuild.id, spool, 7, 5)
+
+                spool.seek(0)
+                self.assertEqual(
+                    [line.split('\t', 3)[2] for line in spool],
+                    [t.resource_id for t in ctx.session.query(
+                        task.ClusterRebuildTask).order_by(
+                            task.ClusterRebuildTask.id)])
+                self.assertIn(ports[1]['port']['id'],
+                              [t.resource_id for t in ctx.session.query(
+                                  task.ClusterRebuildTask)])
+                ctx.session.expire_all()
+                rebuild = ctx.session.query(task.ClusterRebuild).get(
+                    rebuild.id)
+                self.assertEqual((3, 3), (rebuild.items_done,
+                                          rebuild.items_total))
+                self.assertEqual((7, 5), (rebuild.task_id,
+                                          rebuild.task_count))
+
+    def test_heartbeat_touches_the_rebuild(self):
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        long_ago = datetime.datetime(2014, 1, 1)
+        with ctx.session.begin():
+            rebuild = task.ClusterRebuild(
+                mode='full', status=task.REBUILD_RUNNING, updated_at=long_ago)
+            ctx.session.add(rebuild)
+
+        def get_updated_at():
+            ctx.session.expire_all()
+            return ctx.session.query(task.ClusterRebuild).get(
+                rebuild.id).updated_at
+
+        plugin._get_heartbeat(rebuild.id)()
+        self.assertEqual(long_ago, get_updated_at())
+        cfg.CONF.set_override('cluster_rebuild_timeout', 0, group='MIDONET')
+        plugin._get_heartbeat(rebuild.id)()
+        self.assertTrue(get_updated_at() > long_ago)
+
+    def test_create_cluster_runs_in_background(self):
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        with mock.patch.object(task.eventlet, 'spawn_n') as spawn_n:
+            rebuild = plugin.create_cluster(ctx, {'cluster': {}})
+            self.assertEqual(task.REBUILD_RUNNING, rebuild['status'])
+            spawn_n.assert_called_once_with(plugin._run_rebuild,
+                                            rebuild['id'], 'full')
+            self.assertRaises(task.ClusterRebuildInProgress,
+                              plugin.create_cluster, ctx, {'cluster': {}})
+
+    def test_get_cluster_reports_progress(self):
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        with ctx.session.begin():
+            rebuild = task.ClusterRebuild(
+                mode='full', status=task.REBUILD_RUNNING,
+                data_type_id=task.PORT, items_done=10, items_total=40,
+                rate=5.0)
+            ctx.session.add(rebuild)
+
+        res = plugin.get_cluster(ctx, rebuild.id)
+        self.assertEqual('port', res['resource_type'])
+        self.assertEqual(6.0, res['eta'])
+        self.assertRaises(task.ClusterRebuildNotFound, plugin.get_cluster,
+                          ctx, 'missing')
+
+    def test_export_import_snapshot(self):
+        cfg.CONF.set_override('cluster_rebuild_chunk_size', 1,
+                              group='MIDONET')
+        with self.network() as net:
+            with self.port(net) as port:
+                plugin = manager.NeutronManager.get_plugin()
+                ctx = context.get_admin_context()
+                snapshot = tempfile.TemporaryFile()
+                # SQLite has no consistent snapshot transactions.
+                with mock.patch.object(
+                        plugin, '_take_consistent_snapshot',
+                        side_effect=lambda context, spool, incremental:
+                        plugin._read_snapshot([context], spool,
+                                              incremental)):
+                    header = plugin.export_snapshot(ctx, snapshot)
+                self.assertEqual(1, header['counts']['network'])
+                self.assertEqual(1, header['counts']['port'])
+
+                snapshot.seek(0)
+                task.import_snapshot(ctx, snapshot)
+                tasks = task.get_tasks(ctx.session)
+                self.assertEqual(task.FLUSH, tasks[-3].type_id)
+                self.assertEqual(
+                    [(task.CREATE, task.NETWORK, net['network']['id']),
+                     (task.CREATE, task.PORT, port['port']['id'])],
+                    [(t.type_id, t.data_type_id, t.resource_id)
+                     for t in tasks[-2:]])
+                # The FLUSH task shares its envelope with the first chunk.
+                self.assertEqual(tasks[-3].envelope_id, tasks[-2].envelope_id)
+                self.assertNotEqual(tasks[-2].envelope_id,
+                                    tasks[-1].envelope_id)
+
+    def test_export_snapshot_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with self.port(arg_list=(portbindings.HOST_ID,),
+                       **{portbindings.HOST_ID: 'host1'}) as port:
+            # SQLite has no consistent snapshot transactions.
+            with mock.patch.object(
+                    snapshot_cli.SnapshotPlugin, '_take_consistent_snapshot',
+                    autospec=True,
+                    side_effect=lambda plugin, context, spool, incremental:
+                    plugin._read_snapshot([context], spool, incremental)):
+                snapshot_cli.export_snapshot(path)
+
+            with open(path, 'rb') as fileobj:
+                records = [json.loads(line.decode('utf-8')) for line
+                           in gzip.GzipFile(fileobj=fileobj)][1:]
+            ports = [r['data'] for r in records
+                     if r['data_type_id'] == task.PORT]
+            self.assertEqual([port['port']['id']], [p['id'] for p in ports])
+            self.assertEqual('host1', ports[0][portbindings.HOST_ID])
+            self.assertEqual(portbindings.VIF_TYPE_MIDONET,
+                             ports[0][portbindings.VIF_TYPE])
@@ -0,0 +1,112 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import webob.exc
+
+from neutron import context
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.common import postcommit
+from midonet.neutron.db import task
+
+
+class PostCommitTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(PostCommitTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.calls = []
+
+    def _add_hook(self, name, fail=False, compensate=True):
+        def call():
+            self.calls.append(name)
+            if fail:
+                raise RuntimeError(name)
+
+        postcommit.add_hook(
+            self.ctx, 'test', name, call,
+            (lambda: self.calls.append('undo ' + name)) if compensate
+            else None)
+
+    def test_hooks_run_after_outermost_commit(self):
+        with self.ctx.session.begin(subtransactions=True):
+            with self.ctx.session.begin(subtransactions=True):
+                self._add_hook('a')
+            postcommit.run_hooks(self.ctx)
+            self.assertEqual([], self.calls)
+        postcommit.run_hooks(self.ctx)
+        self.assertEqual(['a'], self.calls)
+
+        postcommit.run_hooks(self.ctx)
+        self.assertEqual(['a'], self.calls)
+
+    def test_rollback_discards_hooks(self):
+        try:
+            with self.ctx.session.begin(subtransactions=True):
+                self._add_hook('a')
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        postcommit.run_hooks(self.ctx)
+        self.assertEqual([], self.calls)
+
+    def test_failure_compensates_pending_hooks(self):
+        self._add_hook('a')
+        self._add_hook('b', fail=True)
+        self._add_hook('c')
+
+        self.assertRaises(RuntimeError, postcommit.run_hooks, self.ctx)
+        self.assertEqual(['a', 'b', 'undo c', 'undo b'], self.calls)
+
+    def test_failure_without_compensation_runs_other_hooks(self):
+        self._add_hook('a', fail=True, compensate=False)
+        self._add_hook('b')
+
+        self.assertRaises(RuntimeError, postcommit.run_hooks, self.ctx)
+        self.assertEqual(['a', 'b'], self.calls)
+
+    def test_failed_deletion_is_retried(self):
+        api_cli = mock.Mock()
+        api_cli.delete_port.side_effect = webob.exc.HTTPInternalServerError()
+        api_cli.delete_network.side_effect = webob.exc.HTTPNotFound()
+        api_cli.remove_router_interface.side_effect = [
+            webob.exc.HTTPInternalServerError(), None]
+        postcommit.add_deletion(self.ctx, api_cli, 'delete_port', 'p1')
+        postcommit.add_deletion(self.ctx, api_cli, 'delete_network', 'n1')
+        postcommit.add_deletion(self.ctx, api_cli,
+                                'remove_router_interface', 'r1',
+                                {'port_id': 'p2'})
+        postcommit.run_hooks(self.ctx)
+
+        session = self.ctx.session
+        self.assertEqual(
+            [('delete_port', '["p1"]', 0),
+             ('remove_router_interface', '["r1", {"port_id": "p2"}]', 0)],
+            [(r.method, r.args, r.attempts)
+             for r in session.query(task.DeletionRetry).order_by(
+                 task.DeletionRetry.id)])
+
+        self.assertEqual(0, postcommit.retry_deletions(session, api_cli))
+        self.assertEqual([1], [r.attempts for r in session.query(
+            task.DeletionRetry).filter_by(method='delete_port')])
+        self.assertEqual(1, api_cli.remove_router_interface.call_count)
+
+        api_cli.delete_port.side_effect = webob.exc.HTTPNotFound()
+        self.assertEqual(2, postcommit.retry_deletions(session, api_cli))
+        self.assertEqual(2, api_cli.remove_router_interface.call_count)
+        api_cli.remove_router_interface.assert_called_with('r1',
+                                                           {'port_id': 'p2'})
+        self.assertEqual([], session.query(task.DeletionRetry).all())
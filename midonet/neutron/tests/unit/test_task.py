@@ -0,0 +1,242 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from neutron.common import exceptions as n_exc
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+
+_uuid = uuidutils.generate_uuid
+
+
+class TaskTestCase(testlib_api.SqlTestCase):
+    """Test for midonet.neutron.db.task."""
+
+    def setUp(self):
+        super(TaskTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+
+    def _get_tasks(self):
+        return task.get_tasks(self.ctx.session)
+
+    def test_create_tasks_in_batches(self):
+        port_ids = [_uuid() for i in range(5)]
+        task.create_task(self.ctx, task.CREATE, data_type_id=task.NETWORK,
+                         resource_id=_uuid(), data={'name': 'net'})
+        task.create_tasks(self.ctx, [(task.CREATE, task.PORT, port_id,
+                                      {'id': port_id})
+                                     for port_id in port_ids],
+                          batch_size=2)
+
+        tasks = self._get_tasks()
+        self.assertEqual([task.NETWORK] + [task.PORT] * 5,
+                         [t.data_type_id for t in tasks])
+        self.assertEqual(port_ids, [t.resource_id for t in tasks[1:]])
+        self.assertEqual({'id': port_ids[0]}, task.get_task_data(tasks[1]))
+        self.assertEqual(self.ctx.request_id, tasks[1].transaction_id)
+
+    def test_data_formats(self):
+        port_id = _uuid()
+        data = {'id': port_id, 'name': u'p\u00f6rt'}
+        task.create_task(self.ctx, task.CREATE, data_type_id=task.PORT,
+                         resource_id=port_id, data=data)
+        cfg.CONF.set_override('task_data_format', 'zlib', group='MIDONET')
+        task.create_task(self.ctx, task.UPDATE, data_type_id=task.PORT,
+                         resource_id=port_id, data=data)
+
+        tasks = self._get_tasks()
+        self.assertEqual([task.DATA_FORMAT_JSON, task.DATA_FORMAT_ZLIB],
+                         [t.data_format for t in tasks])
+        self.assertEqual([data, data], [task.get_task_data(t) for t in tasks])
+
+    def _create_feed_tasks(self):
+        net_id, port_id = _uuid(), _uuid()
+        task.create_tasks(self.ctx, [
+            (task.CREATE, task.NETWORK, net_id, {'id': net_id}),
+            (task.CREATE, task.PORT, port_id, {'id': port_id}),
+            (task.UPDATE, task.PORT, port_id, {'id': port_id}),
+            (task.DELETE, task.PORT, port_id, None)])
+        return net_id, port_id
+
+    def test_get_task_feed(self):
+        net_id, port_id = self._create_feed_tasks()
+
+        feed = task.get_task_feed(self.ctx.session, after_id=1, limit=2,
+                                  data_type_ids=[task.PORT])
+        self.assertEqual([2, 3], [t['id'] for t in feed])
+        self.assertEqual({'id': port_id}, feed[0]['data'])
+        self.assertEqual(task.DEPTHS[task.PORT], feed[0]['depth'])
+
+        feed = task.get_task_feed(self.ctx.session, after_id=3,
+                                  type_ids=[task.CREATE, task.DELETE])
+        self.assertEqual([4], [t['id'] for t in feed])
+        self.assertIsNone(feed[0]['data'])
+
+    def test_get_tasks_page_reverse(self):
+        self._create_feed_tasks()
+        mixin = task.MidoTaskMixin()
+
+        tasks = mixin.get_tasks(self.ctx, limit=2, marker='4',
+                                page_reverse=True, fields=['id'])
+        self.assertEqual([{'id': 2}, {'id': 3}], tasks)
+
+    def test_get_tasks_sorted_by_id_descending(self):
+        self._create_feed_tasks()
+        mixin = task.MidoTaskMixin()
+        sorts = [('id', False)]
+
+        tasks = mixin.get_tasks(self.ctx, limit=2, marker='4', sorts=sorts,
+                                fields=['id'])
+        self.assertEqual([{'id': 3}, {'id': 2}], tasks)
+        tasks = mixin.get_tasks(self.ctx, limit=2, marker='1', sorts=sorts,
+                                page_reverse=True, fields=['id'])
+        self.assertEqual([{'id': 3}, {'id': 2}], tasks)
+
+    def test_get_tasks_sorted_by_other_key(self):
+        mixin = task.MidoTaskMixin()
+
+        self.assertRaises(n_exc.BadRequest, mixin.get_tasks, self.ctx,
+                          sorts=[('type_id', True)])
+
+    def test_get_tasks_admin_only(self):
+        mixin = task.MidoTaskMixin()
+
+        self.assertRaises(n_exc.AdminRequired, mixin.get_tasks,
+                          context.Context('user', 'tenant'))
+
+    def test_envelopes(self):
+        net_id, port_id = _uuid(), _uuid()
+        with self.ctx.session.begin():
+            task.create_task(self.ctx, task.CREATE, data_type_id=task.NETWORK,
+                             resource_id=net_id, data={'id': net_id})
+            task.create_tasks(self.ctx, [
+                (task.CREATE, task.PORT, port_id, {'id': port_id}),
+                (task.UPDATE, task.PORT, port_id, {'id': port_id})])
+        task.create_task(self.ctx, task.DELETE, data_type_id=task.PORT,
+                         resource_id=port_id)
+
+        envelopes = self.ctx.session.query(task.TaskEnvelope).order_by(
+            task.TaskEnvelope.id).all()
+        self.assertEqual([3, 1], [e.task_count for e in envelopes])
+        self.assertTrue(all(e.committed_at for e in envelopes))
+
+        self.assertEqual([[1, 2, 3], [4]],
+                         [[t.id for t in envelope] for envelope
+                          in task.get_envelopes(self.ctx.session)])
+        # The page never ends inside an envelope.
+        self.assertEqual([[1, 2, 3]],
+                         [[t.id for t in envelope] for envelope
+                          in task.get_envelopes(self.ctx.session, limit=2)])
+        self.assertEqual([[3]],
+                         [[t.id for t in envelope] for envelope
+                          in task.get_envelopes(self.ctx.session, after_id=2,
+                                                limit=1)])
+
+    def _get_fingerprints(self):
+        return dict(((f.data_type_id, f.resource_id), f.content_hash)
+                    for f in self.ctx.session.query(task.TaskFingerprint))
+
+    def test_update_fingerprints(self):
+        net_id, port_id = self._create_feed_tasks()
+        net_data = {'id': net_id}
+        task.create_task(self.ctx, task.UPDATE, data_type_id=task.NETWORK,
+                         resource_id=net_id, data=net_data)
+        tasks = self._get_tasks()
+
+        task.update_fingerprints(self.ctx.session, tasks[:3])
+        self.assertEqual({(task.NETWORK, net_id): task.fingerprint(net_data),
+                          (task.PORT, port_id): task.fingerprint(
+                              {'id': port_id})},
+                         self._get_fingerprints())
+
+        task.update_fingerprints(self.ctx.session, tasks[3:])
+        self.assertEqual({(task.NETWORK, net_id): task.fingerprint(net_data)},
+                         self._get_fingerprints())
+
+        task.create_task(self.ctx, task.FLUSH)
+        task.update_fingerprints(self.ctx.session, self._get_tasks()[-1:])
+        self.assertEqual({}, self._get_fingerprints())
+
+    def test_cluster_resources_in_dependency_order(self):
+        depths = [task.DEPTHS[data_type_id]
+                  for data_type_id, model, make_dict
+                  in task.CLUSTER_RESOURCES]
+        self.assertEqual(sorted(depths), depths)
+
+    def test_find_gaps(self):
+        self.assertEqual([(3, 4), (6, 6)],
+                         task.find_gaps(2, [5, 7, 8, 10], 8))
+        self.assertEqual([], task.find_gaps(2, [3, 4], 4))
+
+    def test_fill_gaps(self):
+        task.add_gaps(self.ctx.session, 'foo', [(2, 6), (8, 8)])
+        task.fill_gaps(self.ctx.session, 'foo', [2, 4, 8])
+
+        self.assertEqual([(3, 3), (5, 6)],
+                         [(gap.first_id, gap.last_id) for gap
+                          in self.ctx.session.query(task.TaskGap).order_by(
+                              task.TaskGap.first_id)])
+
+    def test_read_envelopes_records_read_id(self):
+        self._create_feed_tasks()
+        task.set_checkpoint(self.ctx.session, 'foo', 1)
+
+        checkpoint, envelopes = task.read_envelopes(self.ctx.session, 'foo',
+                                                    limit=2)
+        # The tasks share an envelope, which is read whole.
+        self.assertEqual(1, checkpoint)
+        self.assertEqual([[2, 3, 4]],
+                         [[t.id for t in envelope] for envelope in envelopes])
+        self.assertEqual(4, self.ctx.session.query(task.TaskCheckpoint).get(
+            'foo').read_id)
+
+    def test_get_consumer_lags(self):
+        self._create_feed_tasks()
+        task.set_checkpoint(self.ctx.session, 'foo', 1)
+
+        lags = task.get_consumer_lags(self.ctx.session)
+        self.assertEqual(['foo'], [lag['consumer'] for lag in lags])
+        self.assertEqual(3, lags[0]['backlog_rows'])
+        self.assertEqual(sum(len(t.data) for t in self._get_tasks()
+                             if t.id > 1 and t.data),
+                         lags[0]['backlog_bytes'])
+        self.assertTrue(lags[0]['oldest_task_age'] >= 0)
+
+    def test_task_metrics(self):
+        with mock.patch.object(task, 'insert_stats',
+                               task.TaskInsertStats()):
+            self._create_feed_tasks()
+            metrics = dict((metric['id'], metric) for metric in
+                           task.MidoTaskMixin().get_task_metrics(self.ctx))
+
+        self.assertEqual(['create_network', 'create_port', 'delete_port',
+                          'update_port'], sorted(metrics))
+        port_metric = metrics['create_port']
+        self.assertEqual(1, port_metric['transactions'])
+        self.assertEqual(
+            1.0 / cfg.CONF.MIDONET.task_rate_window,
+            port_metric['tasks_per_sec'])
+        self.assertTrue(port_metric['insert_latency_max'] >= 0)
+
+    def test_checkpoint(self):
+        self.assertEqual(0, task.get_checkpoint(self.ctx.session, 'foo'))
+        task.set_checkpoint(self.ctx.session, 'foo', 10)
+        task.set_checkpoint(self.ctx.session, 'foo', 12)
+        self.assertEqual(12, task.get_checkpoint(self.ctx.session, 'foo'))
@@ -0,0 +1,92 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import admission
+
+_uuid = uuidutils.generate_uuid
+
+
+class AdmissionControllerTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(AdmissionControllerTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.user_ctx = context.Context('user', 'tenant')
+        for name, value in (('task_backlog_soft_limit', 2),
+                            ('task_backlog_hard_limit', 6),
+                            ('task_backlog_max_delay', 2.0),
+                            ('task_backlog_interval', 0)):
+            cfg.CONF.set_override(name, value, group='MIDONET')
+        task.create_tasks(self.ctx, [(task.CREATE, task.PORT, _uuid(), {})
+                                     for i in range(4)])
+        self.controller = admission.AdmissionController()
+
+    def _set_checkpoint(self, task_id):
+        task.set_checkpoint(self.ctx.session,
+                            cfg.CONF.MIDONET.task_consumer_name, task_id)
+
+    def test_admit_without_backlog(self):
+        self._set_checkpoint(4)
+        with mock.patch('time.sleep') as sleep:
+            self.controller.admit(self.user_ctx)
+        self.assertFalse(sleep.called)
+
+    def test_admit_delays_above_soft_limit(self):
+        self._set_checkpoint(0)
+        with mock.patch('time.sleep') as sleep:
+            self.controller.admit(self.user_ctx)
+        sleep.assert_called_once_with(1.0)
+
+    def test_admit_rejects_users_above_hard_limit(self):
+        task.create_tasks(self.ctx, [(task.CREATE, task.PORT, _uuid(), {})
+                                     for i in range(2)])
+        with mock.patch('time.sleep'):
+            self.assertRaises(admission.TaskBacklogFull,
+                              self.controller.admit, self.user_ctx)
+            self.controller.admit(self.ctx)
+
+    def test_backlog_full_sets_retry_after(self):
+        ex = admission.TaskBacklogFull(10, 30)
+        self.assertEqual(503, ex.code)
+        self.assertEqual('30', ex.headers['Retry-After'])
+
+    def test_nested_calls_are_not_admitted(self):
+        class Plugin(object):
+            pass
+
+            @admission.admission_controlled
+            def create_router(self, context):
+                self.create_port(context)
+                with context.session.begin(subtransactions=True):
+                    self.create_port(context)
+
+            @admission.admission_controlled
+            def create_port(self, context):
+                pass
+
+        Plugin.admission = self.controller
+        self._set_checkpoint(0)
+        with mock.patch('time.sleep') as sleep:
+            Plugin().create_router(self.user_ctx)
+            Plugin().create_port(self.user_ctx)
+        self.assertEqual([mock.call(1.0)] * 2, sleep.call_args_list)
@@ -0,0 +1,170 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests import base
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import compactor
+from midonet.neutron.tests.unit.test_task_scheduler import FakeTask
+
+_uuid = uuidutils.generate_uuid
+
+
+class FoldTasksTestCase(base.BaseTestCase):
+
+    def test_create_updates_delete_leave_nothing(self):
+        port_id = _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.PORT, port_id, {'name': 'a'})]
+        tasks += [FakeTask(i, task.UPDATE, task.PORT, port_id, {'name': i})
+                  for i in range(2, 7)]
+        tasks.append(FakeTask(7, task.DELETE, task.PORT, port_id))
+
+        self.assertEqual(({}, list(range(1, 8))),
+                         compactor.fold_tasks(tasks))
+
+    def test_create_updates_become_create(self):
+        port_id = _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.PORT, port_id, {'name': 'a'}),
+                 FakeTask(2, task.UPDATE, task.PORT, port_id, {'name': 'b'}),
+                 FakeTask(3, task.UPDATE, task.PORT, port_id, {'name': 'c'})]
+
+        updates, deletes = compactor.fold_tasks(tasks)
+        self.assertEqual({1: tasks[2]}, updates)
+        self.assertEqual([2, 3], deletes)
+
+    def test_updates_become_last_update(self):
+        port_id = _uuid()
+        tasks = [FakeTask(i, task.UPDATE, task.PORT, port_id, {'name': i})
+                 for i in range(1, 4)]
+
+        self.assertEqual(({}, [1, 2]), compactor.fold_tasks(tasks))
+
+    def test_flush_ends_runs(self):
+        port_id = _uuid()
+        tasks = [FakeTask(1, task.UPDATE, task.PORT, port_id, {'name': 'a'}),
+                 FakeTask(2, task.FLUSH, None, None),
+                 FakeTask(3, task.UPDATE, task.PORT, port_id, {'name': 'b'})]
+
+        self.assertEqual(({}, []), compactor.fold_tasks(tasks))
+
+    def test_referring_task_ends_run(self):
+        net_id, port_id = _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.NETWORK, net_id, {'name': 'a'}),
+                 FakeTask(2, task.CREATE, task.PORT, port_id,
+                          {'network_id': net_id}),
+                 FakeTask(3, task.DELETE, task.NETWORK, net_id)]
+
+        self.assertEqual(({}, []), compactor.fold_tasks(tasks))
+
+    def test_create_keeps_data_referring_to_later_resource(self):
+        port_id, sg_id = _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.PORT, port_id, {'name': 'a'}),
+                 FakeTask(2, task.UPDATE, task.PORT, port_id, {'name': 'b'}),
+                 FakeTask(3, task.CREATE, task.SECURITYGROUP, sg_id, {}),
+                 FakeTask(4, task.UPDATE, task.PORT, port_id,
+                          {'security_groups': [sg_id]})]
+
+        self.assertEqual(({}, [2]), compactor.fold_tasks(tasks))
+
+    def test_router_interface_ends_router_run(self):
+        router_id, port_id, subnet_id = _uuid(), _uuid(), _uuid()
+        info = {'id': router_id, 'port_id': port_id, 'subnet_id': subnet_id}
+        tasks = [FakeTask(1, task.CREATE, task.ROUTER, router_id,
+                          {'name': 'a'}),
+                 FakeTask(2, task.CREATE, task.ROUTERINTERFACE, router_id,
+                          info),
+                 FakeTask(3, task.UPDATE, task.ROUTER, router_id,
+                          {'name': 'b'}),
+                 FakeTask(4, task.DELETE, task.ROUTERINTERFACE, router_id,
+                          info),
+                 FakeTask(5, task.DELETE, task.ROUTER, router_id)]
+
+        self.assertEqual(({}, []), compactor.fold_tasks(tasks))
+
+
+class TaskCompactorTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(TaskCompactorTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        cfg.CONF.set_override('task_replay_page_size', 2, group='MIDONET')
+
+    def _create_tasks(self, port_id, count):
+        task.create_task(self.ctx, task.CREATE, data_type_id=task.PORT,
+                         resource_id=port_id, data={'name': 0})
+        for i in range(1, count):
+            task.create_task(self.ctx, task.UPDATE, data_type_id=task.PORT,
+                             resource_id=port_id, data={'name': i})
+
+    def test_compact_skips_tasks_being_applied(self):
+        port_id = _uuid()
+        self._create_tasks(port_id, 6)
+        task.set_checkpoint(self.ctx.session, 'foo', 1)
+
+        removed = compactor.TaskCompactor().compact(self.ctx.session)
+
+        tasks = task.get_tasks(self.ctx.session)
+        self.assertEqual(2, removed)
+        self.assertEqual([1, 2, 3, 6], [t.id for t in tasks])
+        self.assertEqual({'name': 5}, task.get_task_data(tasks[-1]))
+        self.assertEqual([1, 1, 1, 0, 0, 1],
+                         [e.task_count for e in self.ctx.session.query(
+                             task.TaskEnvelope).order_by(
+                                 task.TaskEnvelope.id)])
+
+    def test_compact_skips_tasks_read_by_consumer(self):
+        port_id = _uuid()
+        self._create_tasks(port_id, 6)
+        task.read_envelopes(self.ctx.session, 'foo', limit=4)
+
+        removed = compactor.TaskCompactor().compact(self.ctx.session)
+
+        self.assertEqual(1, removed)
+        self.assertEqual([1, 2, 3, 4, 6],
+                         [t.id for t in task.get_tasks(self.ctx.session)])
+
+    def test_compact_skips_whole_envelope_being_applied(self):
+        port_id = _uuid()
+        self._create_tasks(port_id, 1)
+        with self.ctx.session.begin():
+            for i in range(4):
+                task.create_task(self.ctx, task.UPDATE,
+                                 data_type_id=task.PORT,
+                                 resource_id=port_id, data={'name': i})
+        for i in range(2):
+            task.create_task(self.ctx, task.UPDATE, data_type_id=task.PORT,
+                             resource_id=port_id, data={'name': i})
+        task.set_checkpoint(self.ctx.session, 'foo', 1)
+
+        removed = compactor.TaskCompactor().compact(self.ctx.session)
+
+        # The page of the consumer ends with the envelope of tasks 2 to 5.
+        self.assertEqual(1, removed)
+        self.assertEqual([1, 2, 3, 4, 5, 7],
+                         [t.id for t in task.get_tasks(self.ctx.session)])
+
+    def test_compact_respects_watermark(self):
+        port_id = _uuid()
+        self._create_tasks(port_id, 4)
+
+        compactor.TaskCompactor(watermark=3).compact(self.ctx.session)
+
+        self.assertEqual([1, 2, 3, 4],
+                         [t.id for t in task.get_tasks(self.ctx.session)])
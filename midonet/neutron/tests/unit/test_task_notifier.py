@@ -0,0 +1,90 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+from oslo.config import cfg
+
+from neutron import context
+from neutron.tests import base
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import notifier
+
+
+class TaskNotifierHookTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(TaskNotifierHookTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        with mock.patch.object(notifier, 'TaskNotifyAPI'):
+            notifier.setup()
+        self.notifier = mock.Mock()
+        mock.patch.object(notifier, '_notifier', self.notifier).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _create_task(self):
+        task.create_task(self.ctx, task.CREATE, data_type_id=task.NETWORK,
+                         resource_id='net', data={'id': 'net'})
+
+    def test_notify_after_commit(self):
+        with self.ctx.session.begin():
+            self._create_task()
+            self._create_task()
+            self.assertFalse(self.notifier.notify.called)
+
+        self.notifier.notify.assert_called_once_with(2)
+
+    def test_no_notification_on_rollback(self):
+        try:
+            with self.ctx.session.begin():
+                self._create_task()
+                raise ValueError()
+        except ValueError:
+            pass
+
+        with self.ctx.session.begin():
+            self.ctx.session.query(task.Task).all()
+        self.assertFalse(self.notifier.notify.called)
+
+
+class TaskNotifierTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(TaskNotifierTestCase, self).setUp()
+        cfg.CONF.set_override('task_notify_socket', '', group='MIDONET')
+        with mock.patch.object(notifier, 'TaskNotifyAPI'):
+            self.notifier = notifier.TaskNotifier()
+
+    def test_casts_are_coalesced(self):
+        self.notifier.notify(1)
+        self.notifier.notify(3)
+        self.notifier.notify(2)
+        eventlet.sleep(0)
+
+        self.assertEqual([3], [c[0][1] for c in
+                               self.notifier.rpc.tasks_written.call_args_list])
+
+
+class TaskListenerTestCase(base.BaseTestCase):
+
+    def test_wait(self):
+        listener = notifier.TaskListener()
+        self.assertIsNone(listener.wait(0.01))
+
+        listener.wake(4)
+        listener.wake(7)
+        self.assertEqual(7, listener.wait(0.01))
@@ -0,0 +1,89 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gzip
+import json
+import os
+
+import fixtures
+
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import pruner
+
+_uuid = uuidutils.generate_uuid
+
+
+class TaskPrunerTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(TaskPrunerTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.port_ids = [_uuid() for i in range(5)]
+        task.create_tasks(self.ctx, [(task.CREATE, task.PORT, port_id,
+                                      {'id': port_id})
+                                     for port_id in self.port_ids])
+
+    def _get_task_ids(self):
+        return [t.id for t in task.get_tasks(self.ctx.session)]
+
+    def test_prune_up_to_lowest_checkpoint(self):
+        task.set_checkpoint(self.ctx.session, 'foo', 4)
+        task.set_checkpoint(self.ctx.session, 'bar', 3)
+
+        pruned = pruner.TaskPruner(batch_size=2, interval=0).prune(
+            self.ctx.session)
+
+        self.assertEqual(3, pruned)
+        self.assertEqual([4, 5], self._get_task_ids())
+
+    def test_prune_keeps_tasks_in_gaps(self):
+        task.set_checkpoint(self.ctx.session, 'foo', 4)
+        task.add_gaps(self.ctx.session, 'foo', [(3, 3)])
+
+        pruner.TaskPruner(interval=0).prune(self.ctx.session)
+
+        self.assertEqual([3, 4, 5], self._get_task_ids())
+
+    def test_prune_deletes_empty_envelopes(self):
+        task.create_task(self.ctx, task.DELETE, data_type_id=task.PORT,
+                         resource_id=self.port_ids[0])
+
+        pruner.TaskPruner(watermark=5, interval=0).prune(self.ctx.session)
+
+        self.assertEqual([6], self._get_task_ids())
+        self.assertEqual([1], [e.task_count for e in self.ctx.session.query(
+            task.TaskEnvelope)])
+
+    def test_prune_without_checkpoint(self):
+        pruner.TaskPruner(interval=0).prune(self.ctx.session)
+
+        self.assertEqual([1, 2, 3, 4, 5], self._get_task_ids())
+
+    def test_prune_archives_tasks(self):
+        archive = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                               'tasks.ndjson.gz')
+
+        pruner.TaskPruner(watermark=2, batch_size=1, interval=0,
+                          archive=archive).prune(self.ctx.session)
+
+        with gzip.open(archive, 'rb') as f:
+            records = [json.loads(line.decode('utf-8')) for line in f]
+        self.assertEqual([1, 2], [r['id'] for r in records])
+        self.assertEqual({'id': self.port_ids[0]}, records[0]['data'])
+        self.assertEqual([3, 4, 5], self._get_task_ids())
@@ -0,0 +1,201 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+from webob import exc as w_exc
+
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import replayer
+
+_uuid = uuidutils.generate_uuid
+
+
+class FakeMidonetClient(object):
+    """Fake MidoNet API endpoint that records the calls made to it."""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.errors = {}
+
+    def __getattr__(self, name):
+        def call(*args):
+            if name == self.fail_on:
+                raise Exception("%s failed" % name)
+            self.calls.append((name,) + args)
+            if name in self.errors:
+                raise self.errors[name]
+        return call
+
+
+class TaskReplayerTestCase(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(TaskReplayerTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.api_cli = FakeMidonetClient()
+        self.replayer = replayer.TaskReplayer(self.api_cli,
+                                              consumer='test', page_size=100)
+
+    def _create_task(self, task_type_id, data_type_id, resource_id,
+                     data=None):
+        task.create_task(self.ctx, task_type_id, data_type_id=data_type_id,
+                         resource_id=resource_id, data=data)
+
+    def _checkpoint(self):
+        return task.get_checkpoint(self.ctx.session, 'test')
+
+    def test_replay_applies_tasks_in_order(self):
+        net_id, port_id = _uuid(), _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_id, {'id': port_id})
+        self._create_task(task.DELETE, task.PORT, port_id)
+
+        self.assertEqual(3, self.replayer.replay(self.ctx.session))
+        self.assertEqual([('create_network', {'id': net_id}),
+                          ('create_port', {'id': port_id}),
+                          ('delete_port', port_id)], self.api_cli.calls)
+        self.assertEqual(3, self._checkpoint())
+
+    def test_replay_batches_security_group_rules(self):
+        rule_ids = [_uuid() for i in range(3)]
+        for rule_id in rule_ids:
+            self._create_task(task.CREATE, task.SECURITYGROUPRULE, rule_id,
+                              {'id': rule_id})
+
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual([('create_security_group_rule_bulk',
+                           [{'id': rule_id} for rule_id in rule_ids])],
+                         self.api_cli.calls)
+
+    def test_replay_applies_whole_envelopes(self):
+        net_id, port_ids = _uuid(), [_uuid(), _uuid()]
+        with self.ctx.session.begin():
+            self._create_task(task.CREATE, task.NETWORK, net_id,
+                              {'id': net_id})
+            for port_id in port_ids:
+                self._create_task(task.CREATE, task.PORT, port_id,
+                                  {'id': port_id})
+        self.replayer.page_size = 2
+
+        self.api_cli.fail_on = 'create_port'
+        self.assertRaises(Exception, self.replayer.replay, self.ctx.session)
+        self.assertEqual(0, self._checkpoint())
+
+        self.api_cli.fail_on = None
+        self.assertEqual(3, self.replayer.replay(self.ctx.session))
+        self.assertEqual(3, self._checkpoint())
+
+    def test_replay_records_fingerprints(self):
+        net_id = _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self.replayer.consumer = cfg.CONF.MIDONET.task_consumer_name
+
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual(
+            [(task.NETWORK, net_id, task.fingerprint({'id': net_id}))],
+            [(f.data_type_id, f.resource_id, f.content_hash)
+             for f in self.ctx.session.query(task.TaskFingerprint)])
+
+    def test_replay_resumes_from_checkpoint(self):
+        net_id, port_id = _uuid(), _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_id, {'id': port_id})
+
+        self.api_cli.fail_on = 'create_port'
+        self.assertRaises(Exception, self.replayer.replay, self.ctx.session)
+        self.assertEqual(1, self._checkpoint())
+
+        self.api_cli.fail_on = None
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual([('create_network', {'id': net_id}),
+                          ('create_port', {'id': port_id})],
+                         self.api_cli.calls)
+        self.assertEqual(2, self._checkpoint())
+
+    def test_replay_applies_tasks_committed_late(self):
+        net_ids = [_uuid() for i in range(3)]
+        for net_id in net_ids:
+            self._create_task(task.CREATE, task.NETWORK, net_id,
+                              {'id': net_id})
+        # Task 2 is written, but not committed yet.
+        late_task = self.ctx.session.query(task.Task).get(2)
+        self.ctx.session.query(task.Task).filter_by(id=2).delete()
+
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual(3, self._checkpoint())
+
+        task.create_task(self.ctx, late_task.type_id, task_id=2,
+                         data_type_id=late_task.data_type_id,
+                         resource_id=late_task.resource_id,
+                         data=task.get_task_data(late_task))
+        self.replayer.replay(self.ctx.session)
+        # The task is applied once.
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual([('create_network', {'id': net_id})
+                          for net_id in (net_ids[0], net_ids[2], net_ids[1])],
+                         self.api_cli.calls)
+        self.assertEqual(0, self.ctx.session.query(task.TaskGap).count())
+
+    def test_replay_forgets_old_gaps(self):
+        for i in range(3):
+            self._create_task(task.DELETE, task.NETWORK, _uuid())
+        self.ctx.session.query(task.Task).filter_by(id=2).delete()
+
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual([(2, 2)], [(gap.first_id, gap.last_id) for gap
+                                    in self.ctx.session.query(task.TaskGap)])
+        cfg.CONF.set_override('task_replay_gap_timeout', -1,
+                              group='MIDONET')
+        self.replayer.replay(self.ctx.session)
+        self.assertEqual(0, self.ctx.session.query(task.TaskGap).count())
+
+    def test_replay_tolerates_tasks_applied_already(self):
+        net_id, port_id, rule_ids = _uuid(), _uuid(), [_uuid(), _uuid()]
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.DELETE, task.PORT, port_id)
+        for rule_id in rule_ids:
+            self._create_task(task.CREATE, task.SECURITYGROUPRULE, rule_id,
+                              {'id': rule_id})
+        self.api_cli.errors = {
+            'create_network': w_exc.HTTPConflict(),
+            'delete_port': w_exc.HTTPNotFound(),
+            'create_security_group_rule_bulk': w_exc.HTTPConflict(),
+            'create_security_group_rule': w_exc.HTTPConflict()}
+
+        self.assertEqual(4, self.replayer.replay(self.ctx.session))
+        self.assertEqual(
+            [('create_network', {'id': net_id}),
+             ('update_network', net_id, {'id': net_id}),
+             ('delete_port', port_id),
+             ('create_security_group_rule_bulk',
+              [{'id': rule_id} for rule_id in rule_ids]),
+             ('create_security_group_rule', {'id': rule_ids[0]}),
+             ('create_security_group_rule', {'id': rule_ids[1]})],
+            self.api_cli.calls)
+        self.assertEqual(4, self._checkpoint())
+
+    def test_replay_stops_on_conflicting_update(self):
+        net_id = _uuid()
+        self._create_task(task.UPDATE, task.NETWORK, net_id, {'id': net_id})
+        self.api_cli.errors = {'update_network': w_exc.HTTPConflict()}
+
+        self.assertRaises(w_exc.HTTPConflict, self.replayer.replay,
+                          self.ctx.session)
+        self.assertEqual(0, self._checkpoint())
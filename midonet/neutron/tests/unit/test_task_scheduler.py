@@ -0,0 +1,119 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from neutron.openstack.common import uuidutils
+from neutron.tests import base
+
+from midonet.neutron.db import task
+from midonet.neutron.journal import scheduler
+
+_uuid = uuidutils.generate_uuid
+
+
+class FakeTask(object):
+
+    def __init__(self, id, type_id, data_type_id, resource_id, data=None):
+        self.id = id
+        self.type_id = type_id
+        self.data_type_id = data_type_id
+        self.resource_id = resource_id
+        self.data = task.encode_task_data(data, task.DATA_FORMAT_JSON)
+        self.data_format = task.DATA_FORMAT_JSON
+
+
+class TaskSchedulerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(TaskSchedulerTestCase, self).setUp()
+        self.applied = []
+        self.fail_ids = set()
+        self.running = 0
+        self.max_running = 0
+        self.scheduler = scheduler.TaskScheduler(self._apply_task, 4)
+
+    def _apply_task(self, t):
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        try:
+            # Let the other tasks run so that the order is not the spawn
+            # order
+            eventlet.sleep(0.01 if t.data_type_id == task.NETWORK else 0)
+            if t.id in self.fail_ids:
+                raise Exception("task %d failed" % t.id)
+            self.applied.append(t.id)
+        finally:
+            self.running -= 1
+
+    def test_dependent_tasks_are_applied_in_order(self):
+        net_id, port_id = _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.NETWORK, net_id),
+                 FakeTask(2, task.CREATE, task.PORT, port_id,
+                          {'network_id': net_id}),
+                 FakeTask(3, task.DELETE, task.PORT, port_id),
+                 FakeTask(4, task.DELETE, task.NETWORK, net_id)]
+
+        self.assertEqual(4, self.scheduler.run(tasks))
+        self.assertEqual([1, 2, 3, 4], self.applied)
+
+    def test_independent_tasks_are_applied_concurrently(self):
+        net_id, sg_id = _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.NETWORK, net_id),
+                 FakeTask(2, task.CREATE, task.SECURITYGROUP, sg_id)]
+
+        self.assertEqual(2, self.scheduler.run(tasks))
+        self.assertEqual([2, 1], self.applied)
+
+    def test_failed_task_stops_its_chain(self):
+        net_id, port_id, sg_id = _uuid(), _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.NETWORK, net_id),
+                 FakeTask(2, task.CREATE, task.PORT, port_id,
+                          {'network_id': net_id}),
+                 FakeTask(3, task.CREATE, task.SECURITYGROUP, sg_id)]
+        self.fail_ids.add(1)
+
+        self.assertIsNone(self.scheduler.run(tasks))
+        self.assertEqual([3], self.applied)
+
+        self.fail_ids.clear()
+        self.assertEqual(3, self.scheduler.run(tasks))
+        self.assertEqual([3, 1, 2], self.applied)
+
+    def test_children_of_a_parent_are_applied_concurrently(self):
+        sg_id, port_ids = _uuid(), [_uuid() for i in range(3)]
+        tasks = [FakeTask(1, task.CREATE, task.SECURITYGROUP, sg_id)]
+        tasks += [FakeTask(i + 2, task.CREATE, task.PORT, port_id,
+                           {'security_groups': [sg_id]})
+                  for i, port_id in enumerate(port_ids)]
+        tasks.append(FakeTask(5, task.DELETE, task.SECURITYGROUP, sg_id))
+
+        self.assertEqual(5, self.scheduler.run(tasks))
+        self.assertEqual(3, self.max_running)
+        self.assertEqual(1, self.applied[0])
+        self.assertEqual(5, self.applied[-1])
+
+    def test_waiting_tasks_do_not_take_workers(self):
+        self.scheduler = scheduler.TaskScheduler(self._apply_task, 2)
+        net_id, sg_id = _uuid(), _uuid()
+        tasks = [FakeTask(1, task.CREATE, task.NETWORK, net_id),
+                 FakeTask(2, task.CREATE, task.PORT, _uuid(),
+                          {'network_id': net_id}),
+                 FakeTask(3, task.CREATE, task.PORT, _uuid(),
+                          {'network_id': net_id}),
+                 FakeTask(4, task.CREATE, task.SECURITYGROUP, sg_id)]
+
+        self.assertEqual(4, self.scheduler.run(tasks))
+        self.assertEqual([4, 1], self.applied[:2])
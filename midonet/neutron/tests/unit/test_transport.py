@@ -0,0 +1,171 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import httplib2
+import mock
+from oslo.config import cfg
+
+from neutron.tests import base
+
+from midonet.neutron.common import config  # noqa
+from midonet.neutron.common import transport
+
+
+class HttpPoolTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(HttpPoolTestCase, self).setUp()
+        self.request = mock.patch.object(
+            httplib2.Http, 'request', autospec=True,
+            return_value=('response', 'content')).start()
+        self.close = mock.patch.object(transport._Http, 'close',
+                                       autospec=True).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _uris(self):
+        return [c[0][1] for c in self.request.call_args_list]
+
+    def _https(self):
+        return [c[0][0] for c in self.request.call_args_list]
+
+    def test_requests_reuse_http(self):
+        pool = transport.HttpPool(2, 5.0)
+        self.assertEqual(('response', 'content'),
+                         pool.request('http://api/a'))
+        pool.request('https://api/b', 'POST', '{}', headers={})
+
+        https = self._https()
+        self.assertIs(https[0], https[1])
+        self.assertEqual(5.0, https[0].timeout)
+        self.assertEqual(
+            [transport.HTTPConnection, transport.HTTPSConnection],
+            [c[1]['connection_type'] for c in self.request.call_args_list])
+        self.assertFalse(self.close.called)
+
+    def test_max_requests_closes_connections(self):
+        pool = transport.HttpPool(1, 5.0, max_requests=2)
+        pool.request('http://api/a')
+        self.assertFalse(self.close.called)
+        pool.request('http://api/a')
+        self.close.assert_called_once_with(self._https()[0])
+
+    def test_failure_closes_connections(self):
+        pool = transport.HttpPool(1, 5.0)
+        self.request.side_effect = socket.error()
+        self.assertRaises(socket.error, pool.request, 'http://api/a')
+        self.close.assert_called_once_with(self._https()[0])
+
+    def test_busy_pool_makes_own_connection(self):
+        pool = transport.HttpPool(1, 5.0)
+
+        def request(http, uri, *args, **kwargs):
+            if uri.endswith('/a'):
+                pool.request('http://api/b')
+            return 'response', 'content'
+
+        self.request.side_effect = request
+        pool.request('http://api/a')
+        pool.request('http://api/c')
+
+        a, b, c = self._https()
+        self.assertIsNot(a, b)
+        self.assertIs(a, c)
+        self.close.assert_called_once_with(b)
+
+    def test_connect_failure_fails_over(self):
+        endpoints = transport.Endpoints(['http://a/api/', 'http://b/api'])
+        pool = transport.HttpPool(1, 5.0, endpoints=endpoints)
+
+        def request(http, uri, *args, **kwargs):
+            if uri.startswith('http://a/'):
+                raise transport.ConnectError((socket.error, socket.error(),
+                                              None))
+            return 'response', 'content'
+
+        self.request.side_effect = request
+        pool.request('http://a/api/ports?id=1')
+        pool.request('http://b/api/ports')
+        pool.request('http://other/api')
+
+        self.assertEqual(['http://a/api/ports?id=1', 'http://b/api/ports?id=1',
+                          'http://b/api/ports', 'http://other/api'],
+                         self._uris())
+        self.assertEqual([0, 0], [e.outstanding for e in endpoints.endpoints])
+
+    def test_connect_failure_of_all_endpoints_raises_error(self):
+        endpoints = transport.Endpoints(['http://a/api', 'http://b/api'])
+        pool = transport.HttpPool(1, 5.0, endpoints=endpoints)
+        self.request.side_effect = transport.ConnectError(
+            (socket.error, socket.error(), None))
+
+        self.assertRaises(socket.error, pool.request, 'http://a/api')
+        self.assertEqual(['http://a/api', 'http://b/api'], self._uris())
+
+    def test_install(self):
+        cfg.CONF.set_override('http_pool_size', 3, group='MIDONET')
+        with mock.patch.object(transport, 'api_lib') as api_lib:
+            api_lib.httplib2 = httplib2
+            transport.install()
+            pool = api_lib.httplib2.Http(timeout=1)
+            self.assertIsInstance(pool, transport.HttpPool)
+            self.assertIs(pool, api_lib.httplib2.Http())
+            self.assertIs(httplib2.Response, api_lib.httplib2.Response)
+
+            transport.install()
+            self.assertIs(pool, api_lib.httplib2.Http())
+            self.assertIsNone(pool.endpoints)
+
+
+class EndpointsTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(EndpointsTestCase, self).setUp()
+        self.endpoints = transport.Endpoints(
+            ['http://a/api', 'http://b/api', 'http://c/api'])
+        self.a, self.b, self.c = self.endpoints.endpoints
+
+    def _choose(self, count):
+        return [self.endpoints.choose() for i in range(count)]
+
+    def test_path(self):
+        self.assertEqual('', self.endpoints.path('http://b/api'))
+        self.assertEqual('/ports', self.endpoints.path('http://b/api/ports'))
+        self.assertIsNone(self.endpoints.path('http://b/apis'))
+        self.assertIsNone(self.endpoints.path('http://d/api'))
+
+    def test_least_outstanding(self):
+        self.a.outstanding = 2
+        self.b.outstanding = 1
+        self.assertEqual([self.c, self.c], self._choose(2))
+        self.c.outstanding = 1
+        self.assertEqual([self.c, self.b], self._choose(2))
+
+    def test_round_robin(self):
+        self.endpoints.selection = 'round_robin'
+        self.a.outstanding = 2
+        self.assertEqual([self.a, self.b, self.c, self.a], self._choose(4))
+
+    def test_ejected_endpoints_are_chosen_last(self):
+        self.endpoints.eject(self.a, 'test')
+        self.endpoints.eject(self.b, 'test')
+        self.assertEqual([self.c, self.c], self._choose(2))
+        self.assertEqual(self.a, self.endpoints.choose(exclude=[self.c]))
+        self.assertIsNone(self.endpoints.choose(
+            exclude=[self.a, self.b, self.c]))
+
+        self.endpoints.readmit(self.b)
+        self.assertEqual(self.b, self.endpoints.choose(exclude=[self.c]))
@@ -16,6 +16,8 @@
 
 import abc
 
+import mock
+from oslo.config import cfg
 import six
 
 from neutron.api.v2 import base as api_base
@@ -160,3 +162,31 @@ class UtilTestCase(base.BaseTestCase):
         FooPlugin()
         self.assertIn('get_foos', FooPlugin.__dict__.keys())
         self.assertNotIn('get_foos', FooPlugin.__abstractmethods__)
+
+    def test_keyed_locks_in_sorted_order(self):
+        # 'network-a' hashes to stripe 5 and 'router-b' to stripe 1.
+        cfg.CONF.set_override('lock_stripes', 8, group='MIDONET')
+        self.addCleanup(cfg.CONF.clear_override, 'lock_stripes',
+                        group='MIDONET')
+        with mock.patch.object(util.lockutils, 'lock') as lock:
+            with util.keyed_locks('router-b', 'network-a', 'router-b'):
+                pass
+
+        self.assertEqual(
+            [mock.call('midonet-lock-1', lock_file_prefix='neutron-',
+                       external=True),
+             mock.call('midonet-lock-5', lock_file_prefix='neutron-',
+                       external=True)],
+            lock.call_args_list)
+
+    def test_keyed_locks_share_stripes(self):
+        cfg.CONF.set_override('lock_stripes', 1, group='MIDONET')
+        self.addCleanup(cfg.CONF.clear_override, 'lock_stripes',
+                        group='MIDONET')
+        with mock.patch.object(util.lockutils, 'lock') as lock:
+            with util.keyed_locks('router-b', 'network-a'):
+                pass
+
+        lock.assert_called_once_with('midonet-lock-0',
+                                     lock_file_prefix='neutron-',
+                                     external=True)
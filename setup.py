@@ -22,6 +22,15 @@ core.setup(
     author='Midokura',
     author_email='mido-openstack-dev@midokura.com',
     description='Neutron is a virtual network service for Openstack',
+    entry_points={
+        'console_scripts': [
+            'midonet-snapshot = midonet.neutron.journal.snapshot:main',
+            'midonet-task-compactor = '
+            'midonet.neutron.journal.compactor:main',
+            'midonet-task-pruner = midonet.neutron.journal.pruner:main',
+            'midonet-task-replayer = midonet.neutron.journal.replayer:main',
+        ],
+    },
     license="Apache License, Version 2.0",
     long_description=open("README.rst").read(),
     name='neutron-plugin-midonet',
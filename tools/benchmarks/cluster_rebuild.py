@@ -0,0 +1,119 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the speed and memory use of a cluster rebuild.
+
+For each size, a SQLite database is filled with synthetic networks and
+ports, and the rebuild tasks are spooled and inserted.  Each size runs in
+its own process, so the peak RSS reported is that of one rebuild.
+
+    $ python tools/benchmarks/cluster_rebuild.py 10000 100000 500000
+"""
+
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron import context
+from neutron.db import api as db
+from neutron.db import db_base_plugin_v2
+from neutron.db import l3_db
+from neutron.db import model_base
+from neutron.db import models_v2
+from neutron.db import securitygroups_db
+from neutron.openstack.common import uuidutils
+
+from midonet.neutron.db import task
+
+PORTS_PER_NETWORK = 10
+INSERT_CHUNK = 10000
+
+
+class RebuildPlugin(db_base_plugin_v2.NeutronDbPluginV2,
+                    l3_db.L3_NAT_db_mixin,
+                    securitygroups_db.SecurityGroupDbMixin,
+                    task.MidoClusterMixin):
+    """The parts of the MidoNet plugin that a cluster rebuild uses."""
+
+
+def _insert(session, table, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        session.execute(table.insert(), rows[i:i + INSERT_CHUNK])
+
+
+def _populate(session, count):
+    tenant_id = uuidutils.generate_uuid()
+    network_ids = [uuidutils.generate_uuid()
+                   for i in range(max(1, count // PORTS_PER_NETWORK))]
+    with session.begin():
+        _insert(session, models_v2.Network.__table__, [
+            {'id': network_id, 'tenant_id': tenant_id, 'name': 'net',
+             'status': 'ACTIVE', 'admin_state_up': True, 'shared': False}
+            for network_id in network_ids])
+        for start in range(0, count - len(network_ids), INSERT_CHUNK):
+            end = min(start + INSERT_CHUNK, count - len(network_ids))
+            _insert(session, models_v2.Port.__table__, [
+                {'id': uuidutils.generate_uuid(), 'tenant_id': tenant_id,
+                 'name': 'port', 'network_id': network_ids[i % len(
+                     network_ids)], 'mac_address': 'fa:16:3e:00:00:00',
+                 'admin_state_up': True, 'status': 'ACTIVE',
+                 'device_id': 'vm', 'device_owner': 'compute:nova'}
+                for i in range(start, end)])
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _run(count, results):
+    cfg.CONF([], project='neutron')
+    cfg.CONF.set_override('connection', 'sqlite://', 'database')
+    cfg.CONF.set_override('notify_nova_on_port_status_changes', False)
+    cfg.CONF.set_override('notify_nova_on_port_data_changes', False)
+
+    session = db.get_session()
+    model_base.BASEV2.metadata.create_all(session.get_bind())
+    _populate(session, count)
+
+    ctx = context.get_admin_context()
+    plugin = RebuildPlugin()
+    rss_before = _max_rss_mb()
+    start = time.time()
+    spool = tempfile.TemporaryFile(mode='w+')
+    plugin._write_snapshot(ctx, spool)
+    with ctx.session.begin():
+        plugin._insert_snapshot(ctx, spool)
+    elapsed = time.time() - start
+
+    results.put((count, count / elapsed, _max_rss_mb() - rss_before))
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    print("%10s %12s %16s" % ('resources', 'rows/sec', 'peak RSS +MB'))
+    for count in sizes:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run, args=(count, results))
+        process.start()
+        process.join()
+        print("%10d %12.0f %16.1f" % results.get())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark concurrent port creations under the global lock the plugin
+used to take, and under the locks of their networks.
+
+The given number of ports are created concurrently, round robin over the
+given number of networks.  Each creation holds its locks for the given
+MidoNet API latency in seconds, like the plugin does, so the ports created
+per second show how many creations the locks let run in parallel.
+
+    $ python tools/benchmarks/port_locks.py 500 50 0.02
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.openstack.common import lockutils
+from neutron.openstack.common import uuidutils
+
+from midonet.neutron.common import util
+
+
+def _create_port_global(network_id, latency):
+    with lockutils.lock('midonet-critical-section',
+                        lock_file_prefix='neutron-', external=True):
+        eventlet.sleep(latency)
+
+
+def _create_port_keyed(network_id, latency):
+    with util.keyed_locks('network-%s' % network_id):
+        eventlet.sleep(latency)
+
+
+def _run(create_port, network_ids, ports, latency):
+    pool = eventlet.GreenPool(ports)
+    start = time.time()
+    for i in range(ports):
+        pool.spawn_n(create_port, network_ids[i % len(network_ids)], latency)
+    pool.waitall()
+    return ports / (time.time() - start)
+
+
+def main():
+    ports = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    networks = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+    network_ids = [uuidutils.generate_uuid() for i in range(networks)]
+
+    lock_path = tempfile.mkdtemp()
+    cfg.CONF.set_override('lock_path', lock_path)
+    try:
+        print("%d ports on %d networks, %.3fs per creation" % (
+            ports, networks, latency))
+        print("%-8s %12s" % ('locks', 'ports/sec'))
+        for name, create_port in (('global', _create_port_global),
+                                  ('network', _create_port_keyed)):
+            print("%-8s %12.1f" % (
+                name, _run(create_port, network_ids, ports, latency)))
+    finally:
+        shutil.rmtree(lock_path)
+
+
+if __name__ == '__main__':
+    main()
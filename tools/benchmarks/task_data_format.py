@@ -0,0 +1,93 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the size and the speed of the task data formats.
+
+Port payloads like those the plugin records are encoded and decoded in
+every format, and the bytes stored and the payloads per second are
+reported.
+
+    $ python tools/benchmarks/task_data_format.py 10000
+"""
+
+import sys
+import time
+
+from neutron.openstack.common import uuidutils
+
+from midonet.neutron.db import task
+
+
+class _Task(object):
+
+    def __init__(self, data, data_format):
+        self.data = data
+        self.data_format = data_format
+
+
+def _port(i):
+    network_id = uuidutils.generate_uuid()
+    return {
+        'id': uuidutils.generate_uuid(),
+        'name': 'port-%d' % i,
+        'network_id': network_id,
+        'tenant_id': '5e6f6e0e0b5e4a4f9f5a0a2c8d4b3e1f',
+        'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+            i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff),
+        'admin_state_up': True,
+        'status': 'ACTIVE',
+        'device_id': uuidutils.generate_uuid(),
+        'device_owner': 'compute:nova',
+        'fixed_ips': [{'subnet_id': uuidutils.generate_uuid(),
+                       'ip_address': '10.%d.%d.%d' % (
+                           i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)}],
+        'security_groups': [uuidutils.generate_uuid()],
+        'allowed_address_pairs': [],
+        'extra_dhcp_opts': [],
+        'binding:host_id': 'compute-%d' % (i % 100),
+        'binding:vif_type': 'midonet',
+        'binding:vif_details': {'port_filter': True},
+        'binding:vnic_type': 'normal',
+        'binding:profile': {},
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ports = [_port(i) for i in range(count)]
+
+    print("%d port payloads" % count)
+    print("%-6s %12s %12s %14s %14s" % ('format', 'bytes', 'bytes/task',
+                                         'encode/sec', 'decode/sec'))
+    for name, data_format in sorted(task.DATA_FORMATS.items()):
+        start = time.time()
+        encoded = [task.encode_task_data(port, data_format)
+                   for port in ports]
+        encode_time = time.time() - start
+
+        tasks = [_Task(data, data_format) for data in encoded]
+        start = time.time()
+        for t in tasks:
+            task.get_task_data(t)
+        decode_time = time.time() - start
+
+        size = sum(len(data) for data in encoded)
+        print("%-6s %12d %12.1f %14.0f %14.0f" % (
+            name, size, float(size) / count, count / encode_time,
+            count / decode_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright (C) 2014 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the midonet_tasks lookups with and without their indexes.
+
+A SQLite database is filled with synthetic tasks, and the lookups by
+resource, by transaction and by creation time are timed before and after
+the indexes of the midonet_tasks table are created.
+
+    $ python tools/benchmarks/task_lookup.py 1000000
+"""
+
+import datetime
+import sys
+import time
+
+import sqlalchemy as sa
+
+from neutron.db import model_base
+from neutron.openstack.common import uuidutils
+
+from midonet.neutron.db import task
+
+INSERT_CHUNK = 10000
+TASKS_PER_RESOURCE = 4
+TASKS_PER_TRANSACTION = 2
+LOOKUPS = 100
+DATA = b'{"name": "port", "admin_state_up": true}'
+
+
+def _populate(engine, count):
+    start = datetime.datetime(2014, 1, 1)
+    resource_ids = [uuidutils.generate_uuid()
+                    for i in range(max(1, count // TASKS_PER_RESOURCE))]
+    with engine.begin() as conn:
+        for first in range(0, count, INSERT_CHUNK):
+            conn.execute(task.Task.__table__.insert(), [
+                {'id': i + 1, 'type_id': task.UPDATE,
+                 'data_type_id': task.PORT, 'data': DATA,
+                 'resource_id': resource_ids[i % len(resource_ids)],
+                 'transaction_id': 'req-%d' % (i // TASKS_PER_TRANSACTION),
+                 'created_at': start + datetime.timedelta(seconds=i)}
+                for i in range(first, min(first + INSERT_CHUNK, count))])
+    return resource_ids
+
+
+def _time(conn, query, params):
+    start = time.time()
+    for p in params:
+        conn.execute(query, p).fetchall()
+    return (time.time() - start) / len(params) * 1000
+
+
+def _lookups(engine, count, resource_ids):
+    tasks = task.Task.__table__
+    step = max(1, len(resource_ids) // LOOKUPS)
+    by_resource = sa.select([tasks.c.id]).where(
+        tasks.c.resource_id == sa.bindparam('r')).order_by(tasks.c.id)
+    by_transaction = sa.select([tasks.c.id]).where(
+        tasks.c.transaction_id == sa.bindparam('t'))
+    by_created_at = sa.select([sa.func.count(tasks.c.id)]).where(
+        tasks.c.created_at < sa.bindparam('c'))
+    start = datetime.datetime(2014, 1, 1)
+    with engine.connect() as conn:
+        return (
+            _time(conn, by_resource,
+                  [{'r': r} for r in resource_ids[::step][:LOOKUPS]]),
+            _time(conn, by_transaction,
+                  [{'t': 'req-%d' % (i * step)} for i in range(LOOKUPS)]),
+            _time(conn, by_created_at,
+                  [{'c': start + datetime.timedelta(seconds=count // 100)}]))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    engine = sa.create_engine('sqlite://')
+    model_base.BASEV2.metadata.create_all(engine)
+    indexes = task.Task.__table__.indexes
+    for index in indexes:
+        index.drop(engine)
+    resource_ids = _populate(engine, count)
+
+    before = _lookups(engine, count, resource_ids)
+    for index in indexes:
+        index.create(engine)
+    after = _lookups(engine, count, resource_ids)
+
+    print("%d tasks, ms per lookup" % count)
+    print("%-16s %10s %10s" % ('lookup', 'no index', 'index'))
+    for name, b, a in zip(('resource_id', 'transaction_id', 'created_at'),
+                          before, after):
+        print("%-16s %10.3f %10.3f" % (name, b, a))
+
+
+if __name__ == '__main__':
+    main()